@@ -0,0 +1,83 @@
+"""
+Benchmark of the blurred Reels background: full-size gblur vs downscaled fast mode.
+Бенчмарк размытого фона Reels: полноразмерный gblur против быстрого режима.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_blur_background [--duration 5]
+
+Для каждого зума печатается FPS обоих режимов и SSIM кадра быстрого
+режима относительно качественного (1.0 - идентичные кадры).
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import tempfile
+from dataclasses import replace
+
+from utils.constants import BLUR_MODE_FAST, BLUR_MODE_QUALITY
+from utils.filter_graph import GraphSpec, VIDEO_OUTPUT_LABEL, compile_filter_graph
+from utils.path_utils import get_ffmpeg_path
+
+from benchmarks.bench_filter_graph import SOURCE_WIDTH, SOURCE_HEIGHT, make_source, run_graph
+
+
+def render_frame(ffmpeg: str, source: str, spec: GraphSpec, out_path: str) -> None:
+    """Сохраняет один кадр графа в PNG."""
+    subprocess.run([
+        ffmpeg, '-y', '-v', 'error', '-ss', '1', '-i', source,
+        '-filter_complex', compile_filter_graph(spec.for_preview()),
+        '-map', f'[{VIDEO_OUTPUT_LABEL}]', '-frames:v', '1', out_path
+    ], check=True)
+
+
+def frame_ssim(ffmpeg: str, first: str, second: str) -> float:
+    """SSIM между двумя кадрами одинакового размера."""
+    result = subprocess.run([
+        ffmpeg, '-hide_banner', '-i', first, '-i', second,
+        '-lavfi', '[0:v][1:v]ssim', '-f', 'null', '-'
+    ], capture_output=True, text=True, check=True)
+    match = re.search(r'All:([\d.]+)', result.stderr)
+    return float(match.group(1)) if match else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Blurred background benchmark')
+    parser.add_argument('--duration', type=float, default=5.0, help='Длительность тестового видео, сек')
+    args = parser.parse_args()
+
+    ffmpeg = get_ffmpeg_path()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.mp4')
+        make_source(ffmpeg, source, args.duration)
+
+        print(f'{"Зум":>5} {"quality fps":>12} {"fast fps":>9} {"прирост":>8} {"SSIM":>7}')
+        for zoom in (80, 100, 120):
+            base = GraphSpec(
+                zoom_factor=zoom / 100,
+                reels=True,
+                blur_background=True,
+                has_audio=False,
+                source_size=(SOURCE_WIDTH, SOURCE_HEIGHT),
+            )
+            quality = replace(base, blur_mode=BLUR_MODE_QUALITY)
+            fast = replace(base, blur_mode=BLUR_MODE_FAST)
+
+            quality_frames, quality_time = run_graph(ffmpeg, source, quality)
+            fast_frames, fast_time = run_graph(ffmpeg, source, fast)
+
+            quality_png = os.path.join(tmp, 'quality.png')
+            fast_png = os.path.join(tmp, 'fast.png')
+            render_frame(ffmpeg, source, quality, quality_png)
+            render_frame(ffmpeg, source, fast, fast_png)
+
+            quality_fps = quality_frames / quality_time
+            fast_fps = fast_frames / fast_time
+            ssim = frame_ssim(ffmpeg, quality_png, fast_png)
+            print(f'{zoom:>4}% {quality_fps:>12.1f} {fast_fps:>9.1f} {fast_fps / quality_fps:>7.2f}x {ssim:>7.4f}')
+
+
+if __name__ == '__main__':
+    main()
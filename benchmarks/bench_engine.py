@@ -0,0 +1,254 @@
+"""
+Reproducible benchmark of the processing engine (process_single end to end).
+Воспроизводимый бенчмарк движка обработки (process_single целиком).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_engine [--duration 5] [--only reels] [--quick]
+    python -m benchmarks.bench_engine --save-baseline
+    python -m benchmarks.bench_engine --tolerance 0.15
+
+Синтетические входы (testsrc2 + sine) генерируются локально в нескольких
+разрешениях и пропорциях, включая GIF. Через process_single прогоняются
+все пресеты FILTERS, сочетания zoom/speed, Reels с размытием и без,
+оверлеи и субтитры. Для каждого случая печатается FPS и CPU-секунды
+FFmpeg на минуту выходного видео.
+
+Результаты сравниваются с сохраненной базой (по умолчанию
+benchmarks/results/engine_baseline.json): падение FPS или рост CPU/мин
+больше допуска считается регрессией, и процесс завершается с кодом 1.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from utils.constants import BLUR_MODE_FAST, BLUR_MODE_QUALITY, FILTERS, OUTPUT_FORMATS, REELS_FORMAT_NAME
+from utils.ffmpeg_utils import process_single
+from utils.filter_graph import RANDOM_FILTER_NAME
+from utils.path_utils import get_ffmpeg_path
+from utils.resource_utils import ResourceReport
+
+
+ORIGINAL_FORMAT = OUTPUT_FORMATS[0]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'engine_baseline.json')
+
+# Синтетические входы: имя -> (ширина, высота, fps, GIF)
+SOURCES = {
+    'landscape': (1920, 1080, 30, False),
+    'portrait': (1080, 1920, 30, False),
+    'square': (720, 720, 25, False),
+    'gif': (480, 270, 15, True),
+}
+
+
+@dataclass
+class Case:
+    """Один случай бенчмарка: аргументы process_single для синтетического входа."""
+    name: str
+    source: str
+    filters: List[str] = field(default_factory=lambda: ['Нет фильтра'])
+    zoom: int = 100
+    speed: int = 100
+    output_format: str = ORIGINAL_FORMAT
+    blur: bool = False
+    blur_mode: str = BLUR_MODE_QUALITY
+    overlay: Optional[str] = None  # 'png' или 'gif'
+    subtitles: bool = False
+    quick: bool = False  # Входит в сокращенный набор --quick
+
+
+def build_cases() -> List[Case]:
+    """Полный набор случаев бенчмарка."""
+    cases = []
+
+    # Каждый пресет фильтра на горизонтальном видео
+    for name in FILTERS:
+        if name == RANDOM_FILTER_NAME:
+            continue
+        cases.append(Case(f'filter/{name}', 'landscape', filters=[name], quick=name == 'Нет фильтра'))
+
+    # Сочетания zoom/speed
+    for zoom, speed in ((120, 100), (80, 100), (100, 150), (100, 75), (120, 200)):
+        cases.append(Case(f'zoom{zoom}/speed{speed}', 'landscape', zoom=zoom, speed=speed,
+                          quick=(zoom, speed) == (120, 200)))
+
+    # Reels с размытием и без на разных пропорциях
+    for source in ('landscape', 'portrait', 'square'):
+        cases.append(Case(f'reels/{source}', source, output_format=REELS_FORMAT_NAME, quick=source == 'landscape'))
+        for mode in (BLUR_MODE_QUALITY, BLUR_MODE_FAST):
+            cases.append(Case(f'reels-blur-{mode}/{source}', source, output_format=REELS_FORMAT_NAME,
+                              blur=True, blur_mode=mode, quick=source == 'landscape'))
+
+    # Оверлеи и субтитры
+    cases.append(Case('overlay/png', 'landscape', overlay='png', quick=True))
+    cases.append(Case('overlay/gif', 'landscape', overlay='gif'))
+    cases.append(Case('overlay/png-reels-zoom', 'landscape', zoom=110, output_format=REELS_FORMAT_NAME,
+                      overlay='png'))
+    cases.append(Case('subtitles', 'landscape', subtitles=True, quick=True))
+    cases.append(Case('subtitles/reels-blur-speed', 'landscape', speed=125, output_format=REELS_FORMAT_NAME,
+                      blur=True, subtitles=True))
+
+    # GIF на входе
+    cases.append(Case('gif/original', 'gif', quick=True))
+    cases.append(Case('gif/reels-blur', 'gif', output_format=REELS_FORMAT_NAME, blur=True))
+
+    return cases
+
+
+def make_inputs(ffmpeg: str, directory: str, duration: float) -> Dict[str, str]:
+    """Генерирует синтетические входы, оверлеи и SRT в directory."""
+    paths = {}
+    for name, (width, height, fps, is_gif) in SOURCES.items():
+        video = f'testsrc2=s={width}x{height}:r={fps}:d={duration}'
+        if is_gif:
+            path = os.path.join(directory, f'{name}.gif')
+            cmd = [ffmpeg, '-y', '-v', 'error', '-f', 'lavfi', '-i', video, path]
+        else:
+            path = os.path.join(directory, f'{name}.mp4')
+            cmd = [
+                ffmpeg, '-y', '-v', 'error',
+                '-f', 'lavfi', '-i', video,
+                '-f', 'lavfi', '-i', f'sine=frequency=440:d={duration}',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest', path
+            ]
+        subprocess.run(cmd, check=True)
+        paths[name] = path
+
+    # Полупрозрачный PNG и анимированный GIF для оверлея
+    paths['overlay_png'] = os.path.join(directory, 'overlay.png')
+    subprocess.run([
+        ffmpeg, '-y', '-v', 'error', '-f', 'lavfi', '-i', 'color=c=red@0.5:s=320x180,format=rgba',
+        '-frames:v', '1', paths['overlay_png']
+    ], check=True)
+    paths['overlay_gif'] = os.path.join(directory, 'overlay.gif')
+    subprocess.run([
+        ffmpeg, '-y', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=s=240x135:r=10:d=1', paths['overlay_gif']
+    ], check=True)
+
+    paths['srt'] = os.path.join(directory, 'subtitles.srt')
+    with open(paths['srt'], 'w', encoding='utf-8') as f:
+        for index in range(int(duration)):
+            f.write(f'{index + 1}\n00:00:{index:02},000 --> 00:00:{index:02},900\nСубтитр номер {index + 1}\n\n')
+
+    return paths
+
+
+def run_case(case: Case, inputs: Dict[str, str], directory: str, report: ResourceReport) -> Dict[str, float]:
+    """
+    Прогоняет случай через process_single.
+
+    Returns:
+        Словарь с fps, CPU-секундами на минуту выхода и временем
+    """
+    events = []
+    out_path = os.path.join(directory, 'out.mp4')
+    with report.track('ffmpeg', case.name, out_path) as record:
+        process_single(
+            in_path=inputs[case.source],
+            out_path=out_path,
+            filters=case.filters,
+            zoom_p=case.zoom,
+            speed_p=case.speed,
+            overlay_file=inputs[f'overlay_{case.overlay}'] if case.overlay else None,
+            overlay_pos='Середина-Центр',
+            output_format=case.output_format,
+            blur_background=case.blur,
+            blur_mode=case.blur_mode,
+            srt_path=inputs['srt'] if case.subtitles else None,
+            subtitle_style={'font_size': 36} if case.subtitles else None,
+            progress_event_callback=events.append,
+        )
+
+    last = events[-1] if events else None
+    out_minutes = (last.out_time if last else 0) / 60
+    frames = last.frame if last else 0
+    cpu = record.child_cpu_time + record.cpu_time
+    return {
+        'fps': frames / record.wall_time if record.wall_time > 0 else 0.0,
+        'cpu_per_min': cpu / out_minutes if out_minutes > 0 else 0.0,
+        'wall': record.wall_time,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Список регрессий относительно базы."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base['fps'] > 0 and result['fps'] < base['fps'] * (1 - tolerance):
+            regressions.append(f"{name}: FPS {result['fps']:.1f} < {base['fps']:.1f}")
+        if base['cpu_per_min'] > 0 and result['cpu_per_min'] > base['cpu_per_min'] * (1 + tolerance):
+            regressions.append(f"{name}: CPU/мин {result['cpu_per_min']:.1f} > {base['cpu_per_min']:.1f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Processing engine benchmark')
+    parser.add_argument('--duration', type=float, default=5.0, help='Длительность синтетических входов, сек')
+    parser.add_argument('--only', default='', help='Запускать только случаи, содержащие подстроку')
+    parser.add_argument('--quick', action='store_true', help='Сокращенный набор случаев')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно для случайных параметров фильтров')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Файл базовых результатов')
+    parser.add_argument('--save-baseline', action='store_true', help='Сохранить результаты как базу')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Допустимое ухудшение (0.1 = 10%%)')
+    args = parser.parse_args()
+
+    # Случайный пресет и параметры eq должны совпадать между запусками
+    random.seed(args.seed)
+
+    cases = [c for c in build_cases() if args.only in c.name and (c.quick or not args.quick)]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    ffmpeg = get_ffmpeg_path()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = make_inputs(ffmpeg, tmp, args.duration)
+        report = ResourceReport('engine', tmp)
+
+        print(f'{"Случай":<45} {"fps":>8} {"CPU/мин":>9} {"база fps":>9} {"Δ":>7}')
+        for case in cases:
+            result = run_case(case, inputs, tmp, report)
+            results[case.name] = result
+            base = baseline.get(case.name)
+            if base and base['fps'] > 0:
+                delta = f"{(result['fps'] / base['fps'] - 1) * 100:+6.1f}%"
+                base_fps = f"{base['fps']:9.1f}"
+            else:
+                delta, base_fps = '', f'{"-":>9}'
+            print(f"{case.name:<45} {result['fps']:>8.1f} {result['cpu_per_min']:>9.1f} {base_fps} {delta:>7}")
+
+        print()
+        print(report.summary())
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f'База сохранена: {args.baseline}')
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('\nРегрессии:')
+        for line in regressions:
+            print(f'  {line}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
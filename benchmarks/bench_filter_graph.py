@@ -0,0 +1,103 @@
+"""
+Benchmark of the filter graph optimizer: legacy stage order vs planned geometry.
+Бенчмарк оптимизатора графа фильтров: исходный порядок стадий против планировщика.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_filter_graph [--duration 5] [--zoom 110]
+
+Для каждого пресета из FILTERS синтетическое видео (testsrc2) прогоняется
+через граф без оптимизации (optimize=False) и через оптимизированный граф
+с выводом в null-muxer, после чего печатается FPS и прирост.
+"""
+
+import argparse
+import os
+import random
+import re
+import subprocess
+import tempfile
+import time
+from dataclasses import replace
+from typing import Tuple
+
+from utils.constants import FILTERS, REELS_FORMAT_NAME, OUTPUT_FORMATS
+from utils.filter_graph import (
+    GraphSpec,
+    RANDOM_FILTER_NAME,
+    VIDEO_OUTPUT_LABEL,
+    compile_filter_graph,
+    resolve_filter_templates,
+)
+from utils.path_utils import get_ffmpeg_path
+
+
+SOURCE_WIDTH = 1920
+SOURCE_HEIGHT = 1080
+SOURCE_FPS = 30
+
+
+def make_source(ffmpeg: str, path: str, duration: float) -> None:
+    """Создает синтетическое исходное видео testsrc2."""
+    subprocess.run([
+        ffmpeg, '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=s={SOURCE_WIDTH}x{SOURCE_HEIGHT}:r={SOURCE_FPS}:d={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path
+    ], check=True)
+
+
+def run_graph(ffmpeg: str, source: str, spec: GraphSpec) -> Tuple[int, float]:
+    """
+    Прогоняет граф через null-muxer.
+
+    Returns:
+        Кортеж (количество кадров, время в секундах)
+    """
+    cmd = [
+        ffmpeg, '-y', '-hide_banner', '-nostats', '-v', 'error', '-progress', 'pipe:1',
+        '-i', source,
+        '-filter_complex', compile_filter_graph(spec),
+        '-map', f'[{VIDEO_OUTPUT_LABEL}]', '-f', 'null', '-'
+    ]
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    frames = re.findall(r'^frame=(\d+)', result.stdout, re.MULTILINE)
+    return (int(frames[-1]) if frames else 0), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Filter graph optimizer benchmark')
+    parser.add_argument('--duration', type=float, default=5.0, help='Длительность тестового видео, сек')
+    parser.add_argument('--zoom', type=int, default=110, help='Zoom в процентах')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=REELS_FORMAT_NAME)
+    parser.add_argument('--blur', action='store_true', help='Размытый фон для Reels')
+    args = parser.parse_args()
+
+    ffmpeg = get_ffmpeg_path()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.mp4')
+        make_source(ffmpeg, source, args.duration)
+
+        print(f'{"Пресет":<40} {"legacy fps":>11} {"opt fps":>9} {"прирост":>8}')
+        for name in FILTERS:
+            if name == RANDOM_FILTER_NAME:
+                continue
+            base = GraphSpec(
+                filter_templates=resolve_filter_templates([name], random.Random(0)),
+                zoom_factor=args.zoom / 100,
+                reels=args.format == REELS_FORMAT_NAME,
+                blur_background=args.blur,
+                has_audio=False,
+            )
+            legacy_frames, legacy_time = run_graph(ffmpeg, source, replace(base, optimize=False))
+            opt_frames, opt_time = run_graph(
+                ffmpeg, source, replace(base, source_size=(SOURCE_WIDTH, SOURCE_HEIGHT))
+            )
+            legacy_fps = legacy_frames / legacy_time
+            opt_fps = opt_frames / opt_time
+            print(f'{name:<40} {legacy_fps:>11.1f} {opt_fps:>9.1f} {opt_fps / legacy_fps:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark of the playlist cache against a local stub of the YouTube API.
+Бенчмарк кеша плейлистов на локальной заглушке YouTube API.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_playlists [--playlists 500] [--latency 0.05] [--rounds 5]
+
+Сравниваются полная загрузка всех страниц playlists().list (как раньше
+при каждом обновлении) и обновление PlaylistCache: без изменений и после
+изменения одного плейлиста. Печатается время, число запросов, ответов
+304 и объем ответов сервера.
+"""
+
+import argparse
+import time
+
+from google.oauth2.credentials import Credentials
+
+from benchmarks.youtube_stub import YouTubeStub
+from uploader_core.playlist_cache import PlaylistCache
+from uploader_core.youtube_api import list_playlists
+
+
+def measure(stub: YouTubeStub, func, rounds: int) -> tuple:
+    """Среднее время, запросов, ответов 304 и килобайт на один вызов func."""
+    stats = stub.stats
+    requests, not_modified, sent = stats.requests, stats.not_modified, stats.bytes_sent
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    wall = (time.perf_counter() - start) / rounds
+    return (wall, (stats.requests - requests) / rounds, (stats.not_modified - not_modified) / rounds,
+            (stats.bytes_sent - sent) / rounds / 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Playlist cache benchmark')
+    parser.add_argument('--playlists', type=int, default=500, help='Количество плейлистов')
+    parser.add_argument('--latency', type=float, default=0.05, help='Задержка ответа заглушки, с')
+    parser.add_argument('--rounds', type=int, default=5, help='Повторов каждого замера')
+    args = parser.parse_args()
+
+    with YouTubeStub(latency=args.latency, playlists=args.playlists) as stub:
+        youtube = stub.build_client(Credentials(token='stub'))
+        cache = PlaylistCache(None)
+        cache.refresh(youtube, 'account')
+
+        def change_last_playlist() -> None:
+            stub.playlists[-1]['count'] += 1
+            cache.refresh(youtube, 'account')
+
+        print(f'{args.playlists} плейлистов, задержка {args.latency:g} с')
+        print(f'{"Вариант":<28} {"Время, с":>9} {"запросов":>9} {"304":>5} {"КБ":>8}')
+        for name, func in (
+            ('все страницы', lambda: list_playlists(youtube)),
+            ('кеш, без изменений', lambda: cache.refresh(youtube, 'account')),
+            ('кеш, изменен один плейлист', change_last_playlist),
+        ):
+            wall, requests, not_modified, kilobytes = measure(stub, func, args.rounds)
+            print(f'{name:<28} {wall:>9.3f} {requests:>9.1f} {not_modified:>5.1f} {kilobytes:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
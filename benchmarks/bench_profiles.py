@@ -0,0 +1,87 @@
+"""
+Benchmark of encode profiles: throughput and output size per profile.
+Бенчмарк профилей кодирования: скорость и размер результата.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_profiles [--duration 20] [--codec libx264] [--target-mb 5]
+
+Синтетическое видео обрабатывается в формате Reels каждым профилем
+(включая целевой размер в один и два прохода и ограничение пресета
+при забитой очереди). Печатается FPS, CPU FFmpeg, размер файла, битрейт
+и для целевого размера - отклонение от цели.
+"""
+
+import argparse
+import os
+import tempfile
+from dataclasses import replace
+
+from utils.constants import (
+    AUTO_FASTER_PRESET,
+    ENCODE_PROFILE_BALANCED,
+    ENCODE_PROFILE_FASTEST,
+    ENCODE_PROFILE_SMALLEST,
+    ENCODE_PROFILE_TARGET_SIZE,
+    REELS_FORMAT_NAME,
+)
+from utils.ffmpeg_utils import EncodeProfile, process_single
+from utils.path_utils import get_ffmpeg_path
+from utils.resource_utils import ResourceReport
+
+from benchmarks.bench_engine import make_inputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Encode profile benchmark')
+    parser.add_argument('--duration', type=float, default=20.0, help='Длительность тестового видео, сек')
+    parser.add_argument('--codec', default='libx264', help='Видеокодек')
+    parser.add_argument('--target-mb', type=float, default=5.0, help='Целевой размер файла, МБ')
+    args = parser.parse_args()
+
+    smallest = EncodeProfile(ENCODE_PROFILE_SMALLEST)
+    target = EncodeProfile(ENCODE_PROFILE_TARGET_SIZE, target_size_mb=args.target_mb)
+    profiles = {
+        'fastest': EncodeProfile(ENCODE_PROFILE_FASTEST),
+        'balanced': EncodeProfile(ENCODE_PROFILE_BALANCED),
+        'smallest': smallest,
+        f'smallest (cap {AUTO_FASTER_PRESET})': replace(smallest, preset_cap=AUTO_FASTER_PRESET),
+        'target 1-pass': target,
+        'target 2-pass': replace(target, two_pass=True),
+    }
+
+    ffmpeg = get_ffmpeg_path()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_inputs(ffmpeg, tmp, args.duration)['landscape']
+        report = ResourceReport('profiles', tmp)
+
+        print(f'{"Профиль":<26} {"fps":>7} {"CPU, с":>8} {"МБ":>7} {"кбит/с":>8} {"от цели":>8}')
+        for name, profile in profiles.items():
+            events = []
+            out_path = os.path.join(tmp, 'out.mp4')
+            with report.track('ffmpeg', name, out_path) as record:
+                process_single(
+                    in_path=source,
+                    out_path=out_path,
+                    filters=['Нет фильтра'],
+                    zoom_p=100,
+                    speed_p=100,
+                    output_format=REELS_FORMAT_NAME,
+                    codec=args.codec,
+                    encode_profile=profile,
+                    progress_event_callback=events.append,
+                )
+            # Для двух проходов кадров вдвое больше, чем в выходе
+            passes = 2 if profile.two_pass and args.codec == 'libx264' else 1
+            frames = (events[-1].frame if events else 0) * passes
+            size_mb = record.output_size / (1024 * 1024)
+            kbps = record.output_size * 8 / 1024 / args.duration
+            deviation = ''
+            if profile.name == ENCODE_PROFILE_TARGET_SIZE:
+                deviation = f'{(size_mb / args.target_mb - 1) * 100:+.1f}%'
+            print(f'{name:<26} {frames / record.wall_time:>7.1f} {record.child_cpu_time:>8.1f} '
+                  f'{size_mb:>7.2f} {kbps:>8.0f} {deviation:>8}')
+
+
+if __name__ == '__main__':
+    main()
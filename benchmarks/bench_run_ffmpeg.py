@@ -0,0 +1,93 @@
+"""
+Benchmark of the Python side of run_ffmpeg: CPU spent reading FFmpeg output.
+Бенчмарк чтения вывода FFmpeg: сколько CPU тратит Python на минуту видео.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_run_ffmpeg [--duration 60]
+
+Сравниваются прежний режим (-loglevel debug, stderr в stdout, построчное
+чтение в текстовом режиме, неограниченный список строк) и текущий
+run_ffmpeg (-progress pipe, -nostats, warning-лог, блочное чтение).
+Время CPU считается для процесса Python (без дочернего FFmpeg).
+"""
+
+import argparse
+import re
+import subprocess
+import time
+from typing import List
+
+from utils.ffmpeg_utils import run_ffmpeg
+from utils.path_utils import get_ffmpeg_path
+
+
+def encode_args(duration: float) -> List[str]:
+    """Аргументы тестового кодирования синтетического видео в null-muxer."""
+    return [
+        '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=s=640x360:r=30:d={duration}',
+        '-f', 'lavfi', '-i', f'sine=d={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac',
+        '-f', 'null', '-'
+    ]
+
+
+def legacy_run(ffmpeg: str, cmd: List[str], duration: float) -> int:
+    """Прежняя схема чтения вывода; возвращает число накопленных строк."""
+    final_cmd = [ffmpeg, '-loglevel', 'debug', '-progress', 'pipe:1', '-hide_banner'] + cmd
+    process = subprocess.Popen(
+        final_cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1
+    )
+    output_lines = []
+    time_regex = re.compile(r'out_time_ms=(\d+)')
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            break
+        line = line.strip()
+        if line:
+            output_lines.append(line)
+            if line.startswith('out_time_ms'):
+                match = time_regex.search(line)
+                if match:
+                    int(int(match.group(1)) / (duration * 1000000) * 100)
+    process.stdout.close()
+    process.wait()
+    return len(output_lines)
+
+
+def measure(label: str, func, duration: float) -> None:
+    """Печатает CPU процесса Python и время выполнения func."""
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    func()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    per_minute = cpu / (duration / 60)
+    print(f'{label:<12} CPU {cpu:7.3f} s   wall {wall:6.2f} s   CPU/мин видео {per_minute:7.3f} s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='run_ffmpeg reader overhead benchmark')
+    parser.add_argument('--duration', type=float, default=60.0, help='Длительность тестового видео, сек')
+    args = parser.parse_args()
+
+    ffmpeg = get_ffmpeg_path()
+    cmd = encode_args(args.duration)
+
+    line_counter = {}
+    measure('legacy', lambda: line_counter.setdefault('legacy', legacy_run(ffmpeg, cmd, args.duration)),
+            args.duration)
+    measure('run_ffmpeg', lambda: run_ffmpeg(cmd, duration=args.duration, progress_callback=lambda p: None),
+            args.duration)
+    print(f'Строк, накопленных прежним режимом: {line_counter["legacy"]}')
+
+
+if __name__ == '__main__':
+    main()
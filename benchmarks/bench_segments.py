@@ -0,0 +1,72 @@
+"""
+Benchmark of segment-parallel encoding of one long video.
+Бенчмарк сегментного кодирования одного длинного видео.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_segments [--duration 300] [--segments 2 4] [--speed 125]
+
+Длинный синтетический файл (ключевой кадр каждые 2 секунды) обрабатывается
+в формате Reels с размытием одним процессом и с разным числом сегментов.
+Печатается время, ускорение и длительность результата, которая должна
+совпадать с обработкой одним процессом.
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from utils.constants import REELS_FORMAT_NAME
+from utils.ffmpeg_utils import get_video_duration, process_single
+from utils.path_utils import get_ffmpeg_path
+from utils.scheduling_utils import available_cpu_count
+
+
+def make_long_input(ffmpeg: str, directory: str, duration: float) -> str:
+    """Генерирует длинное видео со звуком и GOP 2 секунды."""
+    path = os.path.join(directory, 'long.mp4')
+    subprocess.run([
+        ffmpeg, '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=s=1280x720:r=30:d={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:d={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest', path
+    ], check=True)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Segment-parallel encoding benchmark')
+    parser.add_argument('--duration', type=float, default=300.0, help='Длительность тестового видео, сек')
+    parser.add_argument('--segments', type=int, nargs='+', default=[2, 4], help='Количество сегментов')
+    parser.add_argument('--speed', type=int, default=100, help='Скорость, проценты')
+    args = parser.parse_args()
+
+    print(f'Доступно ядер: {available_cpu_count()}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_long_input(get_ffmpeg_path(), tmp, args.duration)
+
+        print(f'{"Сегментов":>9} {"Время, с":>9} {"ускорение":>10} {"длит., с":>9}')
+        baseline = None
+        for jobs in [1] + args.segments:
+            out_path = os.path.join(tmp, f'out_{jobs}.mp4')
+            start = time.perf_counter()
+            process_single(
+                in_path=source,
+                out_path=out_path,
+                filters=['Нет фильтра'],
+                zoom_p=100,
+                speed_p=args.speed,
+                output_format=REELS_FORMAT_NAME,
+                blur_background=True,
+                segment_jobs=jobs,
+            )
+            wall = time.perf_counter() - start
+            baseline = baseline or wall
+            print(f'{jobs:>9} {wall:>9.1f} {baseline / wall:>9.2f}x {get_video_duration(out_path):>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Throughput benchmark of concurrent encodes: default FFmpeg threading vs ThreadPlan.
+Бенчмарк пропускной способности параллельных кодирований: потоки по умолчанию против ThreadPlan.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_threads [--jobs 2 4] [--files 8] [--duration 10]
+
+Для каждого числа одновременных заданий одна и та же пачка синтетических
+файлов обрабатывается через process_single три раза: без ограничений
+потоков (каждый FFmpeg берет все ядра), с планом потоков plan_threads и
+с планом плюс привязкой к ядрам. Печатается пропускная способность -
+секунды выходного видео за секунду работы - и суммарное CPU FFmpeg.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from utils.constants import REELS_FORMAT_NAME
+from utils.ffmpeg_utils import process_single
+from utils.path_utils import get_ffmpeg_path
+from utils.resource_utils import ResourceReport
+from utils.scheduling_utils import ThreadPlan, available_cpu_count, plan_threads
+
+from benchmarks.bench_engine import make_inputs
+
+
+def run_batch(source: str, directory: str, files: int, jobs: int, mode: str,
+              duration: float) -> Tuple[float, float]:
+    """
+    Обрабатывает files копий source по jobs одновременно.
+
+    Returns:
+        Кортеж (секунды выхода за секунду работы, CPU-секунды FFmpeg)
+    """
+    report = ResourceReport(f'threads_{mode}_{jobs}', directory)
+
+    def job(index: int) -> None:
+        slot = index % jobs
+        if mode == 'default':
+            plan = ThreadPlan()
+        else:
+            plan = plan_threads(jobs, slot, pin=mode == 'pinned')
+        out_path = os.path.join(directory, f'out_{index}.mp4')
+        with report.track('ffmpeg', f'{mode}-{index}', out_path):
+            process_single(
+                in_path=source,
+                out_path=out_path,
+                filters=['Нет фильтра'],
+                zoom_p=110,
+                speed_p=100,
+                output_format=REELS_FORMAT_NAME,
+                blur_background=True,
+                thread_plan=plan,
+            )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(job, range(files)))
+    wall = time.perf_counter() - start
+
+    cpu = sum(record.child_cpu_time for record in report.records)
+    return files * duration / wall, cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Concurrent encode throughput benchmark')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[2, 4], help='Количество одновременных заданий')
+    parser.add_argument('--files', type=int, default=8, help='Файлов в пачке')
+    parser.add_argument('--duration', type=float, default=10.0, help='Длительность тестового видео, сек')
+    args = parser.parse_args()
+
+    ffmpeg = get_ffmpeg_path()
+    print(f'Доступно ядер: {available_cpu_count()}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_inputs(ffmpeg, tmp, args.duration)['landscape']
+
+        print(f'{"Заданий":>7} {"Режим":<8} {"с/с":>7} {"CPU, с":>8} {"прирост":>8}')
+        for jobs in args.jobs:
+            baseline = None
+            for mode in ('default', 'planned', 'pinned'):
+                throughput, cpu = run_batch(source, tmp, args.files, jobs, mode, args.duration)
+                baseline = baseline or throughput
+                print(f'{jobs:>7} {mode:<8} {throughput:>7.2f} {cpu:>8.1f} {throughput / baseline:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
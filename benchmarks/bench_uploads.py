@@ -0,0 +1,107 @@
+"""
+Benchmark of the upload queue against a local stub of the YouTube API.
+Бенчмарк очереди загрузки на локальной заглушке YouTube API.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_uploads [--files 40] [--size-mb 4] [--accounts 2]
+        [--jobs 1 2 4 8] [--account-jobs 2] [--bandwidth-mb 8] [--latency 0.05]
+        [--chunk-mb 8] [--fail-rate 0] [--drop-rate 0] [--fresh-clients]
+
+Заглушка ограничивает скорость одного соединения (--bandwidth-mb), как
+сеть до серверов YouTube, поэтому параллельные загрузки складывают
+пропускную способность. jobs=1 соответствует прежней загрузке по одному
+видео. Печатается время пачки, файлов и мегабайт в секунду, пик
+одновременных загрузок на стороне сервера и сколько байт отправлено
+относительно размера пачки: при обрывах (--drop-rate) повторяется только
+часть файла, а не весь файл. Колонка "соед." - сколько TLS-соединений
+открыто: клиенты из YouTubeClientPool переиспользуют их между файлами,
+--fresh-clients собирает клиент на каждую загрузку, как раньше.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from google.oauth2.credentials import Credentials
+
+from benchmarks.youtube_stub import YouTubeStub
+from uploader_core.client_pool import YouTubeClientPool
+from uploader_core.upload_queue import UPLOAD_DONE, UploadItem, UploadQueue
+from utils.constants import UPLOAD_CHUNK_MB
+
+
+def make_files(directory: str, count: int, size: int) -> list:
+    """Создает count файлов размера size со случайным содержимым."""
+    block = os.urandom(min(size, 1024 * 1024))
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f'video_{index:03d}.mp4')
+        with open(path, 'wb') as f:
+            written = 0
+            while written < size:
+                chunk = block[:size - written]
+                f.write(chunk)
+                written += len(chunk)
+        paths.append(path)
+    return paths
+
+
+def run_batch(stub: YouTubeStub, paths: list, accounts: int, jobs: int, account_jobs: int,
+              chunk_mb: float, fresh_clients: bool) -> tuple:
+    """Загружает пачку через UploadQueue; возвращает (время, загружено)."""
+    credentials = Credentials(token='stub')
+    queue = UploadQueue(
+        state_path=None,
+        clients=YouTubeClientPool(lambda account: credentials, build_func=stub.build_client,
+                                  idle_max=0 if fresh_clients else jobs),
+        jobs=jobs,
+        account_jobs=account_jobs,
+        backoff=0.1,
+        chunk_mb=chunk_mb,
+    )
+    items = [UploadItem(account=f'account_{index % accounts}', video_path=path, title=os.path.basename(path))
+             for index, path in enumerate(paths)]
+    start = time.perf_counter()
+    queue.add(items)
+    queue.wait()
+    wall = time.perf_counter() - start
+    return wall, sum(1 for item in queue.items() if item.status == UPLOAD_DONE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Upload queue benchmark')
+    parser.add_argument('--files', type=int, default=40, help='Количество файлов')
+    parser.add_argument('--size-mb', type=float, default=4, help='Размер файла, МБ')
+    parser.add_argument('--accounts', type=int, default=2, help='Количество аккаунтов')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8], help='Одновременных загрузок всего')
+    parser.add_argument('--account-jobs', type=int, default=4, help='Одновременных загрузок на аккаунт')
+    parser.add_argument('--bandwidth-mb', type=float, default=8, help='Скорость одного соединения, МБ/с')
+    parser.add_argument('--latency', type=float, default=0.05, help='Задержка ответа заглушки, с')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Доля ответов 503')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Доля частей с обрывом соединения')
+    parser.add_argument('--chunk-mb', type=float, default=UPLOAD_CHUNK_MB, help='Размер части, МБ')
+    parser.add_argument('--fresh-clients', action='store_true', help='Новый клиент API на каждую загрузку')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_files(tmp, args.files, size)
+        total_mb = args.files * size / (1024 * 1024)
+        print(f'{args.files} файлов по {args.size_mb:g} МБ, {args.accounts} акк., '
+              f'соединение {args.bandwidth_mb:g} МБ/с, задержка {args.latency:g} с, часть {args.chunk_mb:g} МБ')
+        print(f'{"jobs":>5} {"на акк.":>7} {"Время, с":>9} {"файл/с":>7} {"МБ/с":>7} {"пик":>4} '
+              f'{"готово":>7} {"отправлено":>10} {"соед.":>6}')
+        for jobs in args.jobs:
+            with YouTubeStub(latency=args.latency, bandwidth=args.bandwidth_mb * 1024 * 1024,
+                             fail_rate=args.fail_rate, drop_rate=args.drop_rate) as stub:
+                wall, done = run_batch(stub, paths, args.accounts, jobs, args.account_jobs, args.chunk_mb,
+                                       args.fresh_clients)
+                sent = stub.stats.bytes_received / (args.files * size)
+                print(f'{jobs:>5} {args.account_jobs:>7} {wall:>9.2f} {done / wall:>7.2f} '
+                      f'{total_mb / wall:>7.1f} {stub.stats.peak_active:>4} {done:>4}/{args.files} {sent:>9.2f}x '
+                      f'{stub.stats.connections:>6}')
+
+
+if __name__ == '__main__':
+    main()
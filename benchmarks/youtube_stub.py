@@ -0,0 +1,297 @@
+"""
+Local stub of the YouTube Data API for upload benchmarks.
+Локальная заглушка YouTube Data API для бенчмарков загрузки.
+
+Поддерживается то, что использует uploader_core:
+    - POST /upload/youtube/v3/videos?uploadType=resumable - начало сессии
+      (адрес сессии в заголовке Location);
+    - PUT на адрес сессии - прием файла целиком или частями (308 с Range,
+      пока файл не получен полностью), запрос состояния "bytes */N";
+    - POST /youtube/v3/playlistItems - добавление в плейлист;
+    - GET /youtube/v3/playlists - список плейлистов постранично (maxResults,
+      pageToken) с ETag страницы; If-None-Match с тем же ETag дает 304.
+
+Задержка ответа и пропускная способность одного соединения имитируют
+сеть; fail_rate - доля ответов 503, drop_rate - доля частей, на
+середине которых соединение обрывается (для проверки повторов и
+продолжения загрузки с подтвержденного байта).
+
+Заглушка отвечает по HTTPS с самоподписанным сертификатом (создается
+openssl), потому что клиент Google берет схему адреса загрузки из
+discovery-документа. YouTubeStub.build_client возвращает клиент, который
+обращается к заглушке и не проверяет сертификат.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build
+
+_CONTENT_RANGE = re.compile(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)')
+
+
+class StubStats:
+    """Счетчики заглушки."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.sessions = 0
+        self.uploads = 0
+        self.requests = 0
+        self.failures = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.drops = 0
+        self.bytes_received = 0
+        self.active = 0
+        self.peak_active = 0
+
+
+class YouTubeStub:
+    """
+    HTTP-сервер заглушки в фоновом потоке.
+
+    Использование:
+        with YouTubeStub(latency=0.05, bandwidth=2 * 1024 * 1024) as stub:
+            pool = YouTubeClientPool(lambda account: credentials, build_func=stub.build_client)
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0, fail_rate: float = 0.0,
+                 drop_rate: float = 0.0, playlists: int = 3):
+        """
+        Args:
+            latency: Задержка каждого ответа, секунды
+            bandwidth: Скорость приема одного соединения, байт/с (0 - без ограничения)
+            fail_rate: Доля запросов загрузки, на которые отвечается 503
+            drop_rate: Доля частей файла, посреди которых соединение обрывается
+            playlists: Сколько плейлистов возвращает список
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.stats = StubStats()
+        self.sessions: Dict[str, Dict] = {}
+        self.playlists = [{'id': f'PL{i}', 'title': f'Playlist {i}', 'count': i} for i in range(playlists)]
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._cert_dir: Optional[tempfile.TemporaryDirectory] = None
+
+    @property
+    def url(self) -> str:
+        return f'https://127.0.0.1:{self._server.server_address[1]}/'
+
+    def build_client(self, credentials):
+        """Клиент YouTube API, направленный на заглушку."""
+        insecure_http = httplib2.Http(timeout=30, disable_ssl_certificate_validation=True)
+        # Как googleapiclient.http.build_http: 308 - ответ resumable upload, а не перенаправление
+        insecure_http.redirect_codes = insecure_http.redirect_codes - {308}
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=insecure_http)
+        return build('youtube', 'v3', http=http, cache_discovery=False,
+                     client_options={'api_endpoint': self.url})
+
+    def __enter__(self) -> 'YouTubeStub':
+        self._cert_dir = tempfile.TemporaryDirectory()
+        cert_path = os.path.join(self._cert_dir.name, 'stub.pem')
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+            '-subj', '/CN=127.0.0.1', '-keyout', cert_path, '-out', cert_path
+        ], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path)
+
+        handler = type('Handler', (_StubHandler,), {'stub': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._cert_dir.cleanup()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    stub: YouTubeStub
+    protocol_version = 'HTTP/1.1'
+    # Соединение, по которому тело запроса не дошло, закрывается, как на настоящем сервере
+    timeout = 10
+
+    def setup(self) -> None:
+        super().setup()
+        with self.stub.stats.lock:
+            self.stub.stats.connections += 1
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send_json(self, status: int, data: Dict, headers: Optional[Dict] = None) -> None:
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.stub.stats.lock:
+            self.stub.stats.bytes_sent += len(payload)
+
+    def _send_empty(self, status: int, headers: Optional[Dict] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _read_body(self, limit: Optional[int] = None) -> bytes:
+        """Читает тело запроса (не больше limit байт) со скоростью stub.bandwidth."""
+        length = int(self.headers.get('Content-Length') or 0)
+        if limit is not None:
+            length = min(length, limit)
+        bandwidth = self.stub.bandwidth
+        received = bytearray()
+        start = time.perf_counter()
+        while len(received) < length:
+            block = self.rfile.read(min(64 * 1024, length - len(received)))
+            if not block:
+                break
+            received.extend(block)
+            if bandwidth:
+                ahead = len(received) / bandwidth - (time.perf_counter() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+        with self.stub.stats.lock:
+            self.stub.stats.bytes_received += len(received)
+        return bytes(received)
+
+    def _maybe_fail(self) -> bool:
+        stats = self.stub.stats
+        with stats.lock:
+            stats.requests += 1
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        if self.stub.fail_rate and random.random() < self.stub.fail_rate:
+            with stats.lock:
+                stats.failures += 1
+            self._send_json(503, {'error': {'code': 503, 'message': 'Backend Error'}})
+            return True
+        return False
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        body = self._read_body()
+        if self._maybe_fail():
+            return
+        if parsed.path.endswith('/upload/youtube/v3/videos'):
+            query = parse_qs(parsed.query)
+            if query.get('uploadType', [''])[0] != 'resumable':
+                self._send_json(400, {'error': {'code': 400, 'message': 'Only resumable uploads'}})
+                return
+            session_id = uuid.uuid4().hex
+            self.stub.sessions[session_id] = {
+                'metadata': json.loads(body or b'{}'),
+                'received': 0,
+                'total': int(self.headers.get('X-Upload-Content-Length') or 0),
+            }
+            with self.stub.stats.lock:
+                self.stub.stats.sessions += 1
+            host = self.headers.get('Host')
+            self._send_empty(200, {'Location': f'https://{host}/upload/session/{session_id}'})
+        elif parsed.path.endswith('/youtube/v3/playlistItems'):
+            self._send_json(200, {'kind': 'youtube#playlistItem', 'id': uuid.uuid4().hex,
+                                  'snippet': json.loads(body or b'{}').get('snippet', {})})
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_PUT(self) -> None:
+        parsed = urlparse(self.path)
+        session = self.stub.sessions.get(parsed.path.rsplit('/', 1)[-1])
+        if session is None:
+            self._read_body()
+            self._send_json(404, {'error': {'code': 404, 'message': 'Unknown upload session'}})
+            return
+
+        stats = self.stub.stats
+        with stats.lock:
+            stats.active += 1
+            stats.peak_active = max(stats.peak_active, stats.active)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length and self.stub.drop_rate and random.random() < self.stub.drop_rate:
+                # Обрыв посреди части: сервер ничего не засчитывает
+                self._read_body(length // 2)
+                with stats.lock:
+                    stats.drops += 1
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            body = self._read_body()
+        finally:
+            with stats.lock:
+                stats.active -= 1
+        if self._maybe_fail():
+            return
+
+        match = _CONTENT_RANGE.match(self.headers.get('Content-Range') or '')
+        if match and match.group(1) is not None:
+            first = int(match.group(1))
+            if first == session['received']:
+                session['received'] += len(body)
+        elif not match:
+            session['received'] += len(body)
+        if match and match.group(3) != '*':
+            session['total'] = int(match.group(3))
+
+        if session['total'] and session['received'] < session['total']:
+            headers = {'Range': f"bytes=0-{session['received'] - 1}"} if session['received'] else {}
+            self._send_empty(308, headers)
+            return
+
+        with stats.lock:
+            stats.uploads += 1
+        video_id = uuid.uuid4().hex[:11]
+        self._send_json(200, {'kind': 'youtube#video', 'id': video_id,
+                              'snippet': session['metadata'].get('snippet', {})})
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        if self._maybe_fail():
+            return
+        if parsed.path.endswith('/youtube/v3/playlists'):
+            query = parse_qs(parsed.query)
+            page_size = int(query.get('maxResults', ['5'])[0])
+            offset = int(query.get('pageToken', ['0'])[0])
+            page = self.stub.playlists[offset:offset + page_size]
+            items = [{'id': p['id'], 'snippet': {'title': p['title'], 'description': ''},
+                      'contentDetails': {'itemCount': p['count']}} for p in page]
+            data = {'kind': 'youtube#playlistListResponse', 'items': items}
+            if offset + page_size < len(self.stub.playlists):
+                data['nextPageToken'] = str(offset + page_size)
+            etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                with self.stub.stats.lock:
+                    self.stub.stats.not_modified += 1
+                self._send_empty(304, {'ETag': etag})
+                return
+            data['etag'] = etag
+            self._send_json(200, data, {'ETag': etag})
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
@@ -1,18 +1,19 @@
 import sys
 import os
 import ctypes
+import threading
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QIcon
 import logging
 
 from os.path import dirname, abspath
 
-from utils.path_utils import get_ffmpeg_path
+from utils.tool_utils import TOOL_FFMPEG, describe_tools, executable_name, find_tool
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
 from ui.main_window import VideoUnicApp
-from utils.constants import APP_NAME, APP_VERSION, FFMPEG_EXE_PATH
+from utils.constants import APP_NAME, APP_VERSION, TOOLS_BIN_DIR
 
 
 def set_app_user_model_id(app_id):
@@ -20,6 +21,14 @@ def set_app_user_model_id(app_id):
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(app_id)
 
 
+def log_tools():
+    """Пишет в лог найденные инструменты и их версии (запускает их, поэтому вызывается в фоне)"""
+    if not find_tool(TOOL_FFMPEG):
+        logging.error(f"Error: {executable_name(TOOL_FFMPEG)} not found in {TOOLS_BIN_DIR}")
+        logging.error("Please ensure FFmpeg is in the specified path or in your system's PATH.")
+    logging.info(describe_tools())
+
+
 def main():
     log_file_path = os.path.join(project_root, "crash_log.log")
     
@@ -47,15 +56,12 @@ def main():
     myappid = f"mycompany.{APP_NAME}.{APP_VERSION}"
     set_app_user_model_id(myappid)
 
-    ffpmeg_path = get_ffmpeg_path()
-
-    if sys.platform.startswith("win") and not os.path.exists(ffpmeg_path):
-        logging.error(f"Error: ffmpeg.exe not found at {FFMPEG_EXE_PATH}")
-        logging.error("Please ensure FFmpeg is in the specified path or in your system's PATH.")
-
     w = VideoUnicApp()
     w.show()
 
+    # Поиск инструментов и запрос версий не задерживают показ окна
+    threading.Thread(target=log_tools, name="log-tools", daemon=True).start()
+
     sys.exit(app.exec_())
 
 
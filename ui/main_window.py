@@ -2,11 +2,11 @@ import os
 import sys
 import random
 import tempfile
-import uuid
 import shutil
 import logging
+import uuid
 
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal, QThread
+from PyQt5.QtCore import Qt, QObject, QPoint, pyqtSignal, QThread
 from PyQt5.QtGui import QFontMetrics, QIcon, QPixmap
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
@@ -23,41 +23,39 @@ from workers.worker import Worker
 from utils.file_utils import is_video_file, find_videos_in_folder
 from utils.constants import (
     FILTERS, OVERLAY_POSITIONS, REELS_FORMAT_NAME, OUTPUT_FORMATS,
-    CODECS, WHISPER_MODELS, WHISPER_LANGUAGES, APP_NAME, APP_VERSION
+    CODECS, WHISPER_MODELS, WHISPER_LANGUAGES, APP_NAME, APP_VERSION,
+    BLUR_MODES, BLUR_MODE_QUALITY, ENCODE_PROFILES, ENCODE_PROFILE_BALANCED,
+    ENCODE_PROFILE_TARGET_SIZE, DEFAULT_TARGET_SIZE_MB, DOWNLOAD_JOBS_DEFAULT, DOWNLOAD_JOBS_MAX
 )
+from utils.filter_graph import GraphSpec, source_fit_box
 from utils.ffmpeg_utils import generate_preview, get_video_duration, detect_crop_dimensions
-from utils.youtube_utils import download_video
+from utils.download_utils import (
+    DownloadCache, DownloadManager, DOWNLOAD_PENDING, DOWNLOAD_RUNNING, DOWNLOAD_RETRYING,
+    DOWNLOAD_DONE, DOWNLOAD_FAILED, DOWNLOAD_CANCELLED, is_playlist_url, is_video_url
+)
 from uploader_ui.uploader_widget import UploaderWidget
 from utils.path_utils import resource_path
+from utils.progress_utils import format_eta
+from utils.scheduling_utils import available_cpu_count
 
 
-class YoutubeDownloader(QThread):
-    finished_signal = pyqtSignal(str, str)
-    error_signal = pyqtSignal(str)
-    
-    def __init__(self, url, temp_dir, crop_bars):
-        super().__init__()
-        self.url = url
-        self.temp_dir = temp_dir
-        self.crop_bars = crop_bars
-        self.temp_file_path = ''
-        self.cropped_file_path = ''
-    
-    def run(self):
-        try:
-            temp_filename = f'yt_{uuid.uuid4()}.mp4'
-            self.temp_file_path = os.path.join(self.temp_dir, temp_filename)
-            
-            download_video(self.url, self.temp_file_path)
-            
-            if not os.path.exists(self.temp_file_path):
-                raise IOError(f'Файл не был создан после скачивания: {self.temp_file_path}')
-            
-            final_path = self.temp_file_path
-            self.finished_signal.emit(final_path, self.url)
-            
-        except Exception as e:
-            self.error_signal.emit(str(e))
+class DownloadSignals(QObject):
+    # Обратные вызовы DownloadManager приходят из его потоков,
+    # сигналы доставляют DownloadItem в поток интерфейса
+    updated = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+# Подписи состояний загрузки в списке
+DOWNLOAD_STATUS_TEXT = {
+    DOWNLOAD_PENDING: 'в очереди',
+    DOWNLOAD_RUNNING: 'скачивание',
+    DOWNLOAD_RETRYING: 'повтор',
+    DOWNLOAD_DONE: 'готово',
+    DOWNLOAD_FAILED: 'ошибка',
+    DOWNLOAD_CANCELLED: 'отменено',
+}
 
 
 class PreviewWorker(QThread):
@@ -134,12 +132,21 @@ class DropListWidget(QListWidget):
 
 
 class ProcessingWidgetContent(QWidget):
-    video_processed = pyqtSignal(str)
+    video_processed = pyqtSignal(list)
     
     def __init__(self, parent_window):
         super().__init__(parent_window)
         self.parent_window = parent_window
-        self.downloader_thread = None
+        self.download_signals = DownloadSignals()
+        self.download_cache = DownloadCache()
+        self.download_manager = DownloadManager(
+            parent_window.temp_dir,
+            on_update=self.download_signals.updated.emit,
+            on_finished=self.download_signals.finished.emit,
+            on_failed=self.download_signals.failed.emit,
+            cache=self.download_cache
+        )
+        self.download_items = {}
         self.preview_thread = None
         self.processing_thread = None
         self.last_output_path = None
@@ -203,15 +210,51 @@ class ProcessingWidgetContent(QWidget):
         # YouTube группа
         yt_group = QGroupBox('Альтернативный источник')
         yt_layout = QVBoxLayout(yt_group)
-        yt_layout.addWidget(QLabel('Ссылка на YouTube видео:'))
+        yt_layout.addWidget(QLabel('Ссылки на YouTube видео или плейлист (по одной в строке):'))
         
-        self.yt_url_input = QLineEdit()
+        self.yt_url_input = QPlainTextEdit()
         self.yt_url_input.setPlaceholderText('https://www.youtube.com/watch?v=...')
+        self.yt_url_input.setMaximumHeight(70)
         yt_layout.addWidget(self.yt_url_input)
         
+        yt_buttons_layout = QHBoxLayout()
         self.yt_add_button = QPushButton('Скачать и добавить в список')
-        yt_layout.addWidget(self.yt_add_button)
-        yt_layout.addStretch()
+        yt_buttons_layout.addWidget(self.yt_add_button)
+        self.yt_cancel_button = QPushButton('Отменить')
+        yt_buttons_layout.addWidget(self.yt_cancel_button)
+        yt_buttons_layout.addWidget(QLabel('Одновременно:'))
+        self.download_jobs_spin = QSpinBox()
+        self.download_jobs_spin.setRange(1, DOWNLOAD_JOBS_MAX)
+        self.download_jobs_spin.setValue(DOWNLOAD_JOBS_DEFAULT)
+        self.download_jobs_spin.setToolTip('Сколько видео скачивается одновременно')
+        yt_buttons_layout.addWidget(self.download_jobs_spin)
+        yt_layout.addLayout(yt_buttons_layout)
+        
+        # Скачивание только нужного отрезка
+        yt_section_layout = QHBoxLayout()
+        self.yt_section_checkbox = QCheckBox('Только отрезок, сек: с')
+        self.yt_section_checkbox.setToolTip('yt-dlp скачает только этот отрезок видео (--download-sections)')
+        yt_section_layout.addWidget(self.yt_section_checkbox)
+        self.yt_section_start_spin = QSpinBox()
+        self.yt_section_start_spin.setRange(0, 24 * 3600)
+        yt_section_layout.addWidget(self.yt_section_start_spin)
+        yt_section_layout.addWidget(QLabel('по'))
+        self.yt_section_end_spin = QSpinBox()
+        self.yt_section_end_spin.setRange(1, 24 * 3600)
+        self.yt_section_end_spin.setValue(60)
+        yt_section_layout.addWidget(self.yt_section_end_spin)
+        yt_layout.addLayout(yt_section_layout)
+        
+        self.yt_stream_checkbox = QCheckBox('Обрабатывать во время скачивания (без файла)')
+        self.yt_stream_checkbox.setToolTip(
+            'Ссылка сразу попадает в список обработки: yt-dlp передает видео в FFmpeg через канал.\n'
+            'Если формат нельзя передать потоком (отдельные видео и аудио), видео скачивается.'
+        )
+        yt_layout.addWidget(self.yt_stream_checkbox)
+        
+        self.download_list_widget = QListWidget()
+        self.download_list_widget.setMaximumHeight(110)
+        yt_layout.addWidget(self.download_list_widget)
         
         left_splitter.addWidget(yt_group)
         left_splitter.setSizes([400, 150])
@@ -254,14 +297,67 @@ class ProcessingWidgetContent(QWidget):
         self.blur_background_checkbox = QCheckBox('Размыть фон')
         self.blur_background_checkbox.setToolTip('Заполняет черные полосы размытой версией видео (только для Reels)')
         self.blur_background_checkbox.setEnabled(False)
+        self.blur_background_checkbox.toggled.connect(self.on_blur_background_toggled)
         ofg_layout.addWidget(self.blur_background_checkbox)
         
+        self.blur_mode_combo = QComboBox()
+        self.blur_mode_combo.addItems(BLUR_MODES.keys())
+        self.blur_mode_combo.setToolTip('Быстрый режим размывает уменьшенную копию кадра: результат почти тот же, обработка заметно быстрее')
+        self.blur_mode_combo.setEnabled(False)
+        ofg_layout.addWidget(self.blur_mode_combo)
+        
         ofg_layout.addWidget(QLabel('Видеокодек:'))
         self.codec_combo = QComboBox()
         self.codec_combo.addItems(CODECS.keys())
         self.codec_combo.setToolTip('Аппаратные кодеки (NVIDIA, Intel, AMD) могут значительно ускорить обработку')
         ofg_layout.addWidget(self.codec_combo)
         
+        ofg_layout.addWidget(QLabel('Профиль кодирования:'))
+        self.encode_profile_combo = QComboBox()
+        self.encode_profile_combo.addItems(ENCODE_PROFILES.keys())
+        self.encode_profile_combo.setToolTip('Скорость кодирования против размера файла. '
+                                             'Целевой размер подбирает битрейт под лимит площадки')
+        self.encode_profile_combo.currentTextChanged.connect(self.on_encode_profile_changed)
+        ofg_layout.addWidget(self.encode_profile_combo)
+        
+        target_size_layout = QHBoxLayout()
+        target_size_layout.addWidget(QLabel('Размер, МБ:'))
+        self.target_size_spin = QSpinBox()
+        self.target_size_spin.setRange(1, 4096)
+        self.target_size_spin.setValue(DEFAULT_TARGET_SIZE_MB)
+        target_size_layout.addWidget(self.target_size_spin)
+        self.two_pass_checkbox = QCheckBox('Два прохода')
+        self.two_pass_checkbox.setToolTip('Точнее попадает в размер, но кодирует почти вдвое дольше (только CPU)')
+        target_size_layout.addWidget(self.two_pass_checkbox)
+        self.target_size_widget = QWidget()
+        self.target_size_widget.setLayout(target_size_layout)
+        self.target_size_widget.setVisible(False)
+        ofg_layout.addWidget(self.target_size_widget)
+        
+        self.auto_faster_checkbox = QCheckBox('Ускорять кодирование при большой очереди')
+        self.auto_faster_checkbox.setChecked(True)
+        self.auto_faster_checkbox.setToolTip('Если в очереди много файлов, медленные пресеты x264 заменяются на faster')
+        ofg_layout.addWidget(self.auto_faster_checkbox)
+        
+        ofg_layout.addWidget(QLabel('Параллельных заданий:'))
+        self.parallel_jobs_spin = QSpinBox()
+        self.parallel_jobs_spin.setRange(1, max(1, available_cpu_count()))
+        self.parallel_jobs_spin.setValue(1)
+        self.parallel_jobs_spin.setToolTip('Сколько файлов кодируется одновременно. Ядра делятся между заданиями поровну')
+        ofg_layout.addWidget(self.parallel_jobs_spin)
+        
+        self.pin_cpus_checkbox = QCheckBox('Закрепить задания за ядрами')
+        self.pin_cpus_checkbox.setToolTip('Каждое параллельное задание работает на своем наборе ядер процессора')
+        ofg_layout.addWidget(self.pin_cpus_checkbox)
+        
+        ofg_layout.addWidget(QLabel('Сегментов на файл:'))
+        self.segment_jobs_spin = QSpinBox()
+        self.segment_jobs_spin.setRange(1, max(1, available_cpu_count()))
+        self.segment_jobs_spin.setValue(1)
+        self.segment_jobs_spin.setToolTip('Длинное видео делится по ключевым кадрам на части, которые кодируются '
+                                          'одновременно и склеиваются без перекодирования')
+        ofg_layout.addWidget(self.segment_jobs_spin)
+        
         main_tab_layout.addWidget(self.output_format_group)
         
         # Группа предпросмотра
@@ -662,6 +758,11 @@ class ProcessingWidgetContent(QWidget):
         btn_ol.clicked.connect(self.on_select_overlay)
         btn_clear_ol.clicked.connect(lambda: self.overlay_path.clear())
         self.yt_add_button.clicked.connect(self.on_add_from_youtube)
+        self.yt_cancel_button.clicked.connect(self.download_manager.cancel)
+        self.download_jobs_spin.valueChanged.connect(self.on_download_jobs_changed)
+        self.download_signals.updated.connect(self.on_download_updated)
+        self.download_signals.finished.connect(self.on_youtube_download_finished)
+        self.download_signals.failed.connect(self.on_youtube_download_error)
         self.preview_button.clicked.connect(self.on_update_preview)
         btn_browse_srt.clicked.connect(self.on_browse_srt)
         self.subs_mode_group.buttonClicked.connect(self.on_subs_mode_changed)
@@ -702,36 +803,78 @@ class ProcessingWidgetContent(QWidget):
             self.overlay_audio_path_edit.setText(fs)
     
     def on_add_from_youtube(self):
-        url = self.yt_url_input.text().strip()
-        if not url:
+        urls = self.yt_url_input.toPlainText().split()
+        if not urls:
             QMessageBox.warning(self, 'Нет ссылки', 'Пожалуйста, вставьте ссылку на YouTube видео.')
             return
         
-        self.set_controls_enabled(False)
-        self.status_label.setText(f'Скачивание видео: {url[:50]}...')
+        section = None
+        if self.yt_section_checkbox.isChecked():
+            start, end = self.yt_section_start_spin.value(), self.yt_section_end_spin.value()
+            if end <= start:
+                QMessageBox.warning(self, 'Неверный отрезок', 'Конец отрезка должен быть позже начала.')
+                return
+            section = (start, end)
+        
+        # Видео без отрезка можно обработать прямо из канала yt-dlp
+        if self.yt_stream_checkbox.isChecked() and section is None:
+            streamed = [url for url in urls if not is_playlist_url(url)]
+            for url in streamed:
+                if not self.video_list_widget.is_already_added(url):
+                    it = QListWidgetItem(f'[YT] {url}')
+                    it.setData(Qt.UserRole, url)
+                    self.video_list_widget.addItem(it)
+            urls = [url for url in urls if is_playlist_url(url)]
+            if not urls:
+                self.yt_url_input.clear()
+                self.status_label.setText(f'Добавлено в список обработки: {len(streamed)}')
+                return
         
-        self.downloader_thread = YoutubeDownloader(url, self.parent_window.temp_dir, False)
-        self.downloader_thread.finished_signal.connect(self.on_youtube_download_finished)
-        self.downloader_thread.error_signal.connect(self.on_youtube_download_error)
-        self.downloader_thread.start()
-    
-    def on_youtube_download_finished(self, file_path, original_url):
-        self.status_label.setText('Видео успешно скачано!')
+        self.download_manager.jobs = self.download_jobs_spin.value()
+        added = self.download_manager.add(urls, fit_box=self.download_fit_box(), section=section)
         self.yt_url_input.clear()
-        self.set_controls_enabled(True)
+        self.status_label.setText(f'Добавлено в очередь скачивания: {len(added)}')
+    
+    def download_fit_box(self):
+        # Разрешение скачивания подбирается под текущий формат и наибольший зум
+        zoom = self.zoom_max_spin.value() if self.zoom_dynamic_radio.isChecked() else self.zoom_static_spin.value()
+        spec = GraphSpec(reels=self.output_format_combo.currentText() == REELS_FORMAT_NAME, zoom_factor=zoom / 100)
+        return source_fit_box(spec)
+    
+    def on_download_jobs_changed(self, value):
+        self.download_manager.jobs = value
+    
+    def on_download_updated(self, item):
+        it = self.download_items.get(item.key)
+        if it is None:
+            it = QListWidgetItem()
+            self.download_items[item.key] = it
+            self.download_list_widget.addItem(it)
+        
+        status = DOWNLOAD_STATUS_TEXT.get(item.status, item.status)
+        if item.status == DOWNLOAD_RUNNING:
+            status = f'{item.percent:.0f}%'
+        elif item.status == DOWNLOAD_RETRYING:
+            status = f'повтор {item.attempts}'
+        it.setText(f'[{status}] {item.url}')
+        it.setToolTip(item.error)
+    
+    def on_youtube_download_finished(self, item):
+        file_path = item.path
+        self.status_label.setText(f'Видео {"взято из кеша" if item.cached else "скачано"}: {item.url[:50]}')
         
+        # Готовый файл сразу попадает в очередь обработки; он лежит
+        # в кеше загрузок и при выходе не удаляется
         if not self.video_list_widget.is_already_added(file_path):
-            self.parent_window.temp_files.append(file_path)
             item_text = f'[YT] {os.path.basename(file_path)}'
             it = QListWidgetItem(item_text)
             it.setData(Qt.UserRole, file_path)
             self.video_list_widget.addItem(it)
             self.refresh_video_list_display()
     
-    def on_youtube_download_error(self, error_msg):
-        self.status_label.setText('Ошибка скачивания.')
-        QMessageBox.critical(self, 'Ошибка скачивания', f'Не удалось скачать видео:\n\n{error_msg}')
-        self.set_controls_enabled(True)
+    def on_youtube_download_error(self, item):
+        self.status_label.setText(f'Ошибка скачивания: {item.url[:50]}')
+        self.on_download_updated(item)
     
     def on_update_preview(self):
         selected_items = self.video_list_widget.selectedItems()
@@ -740,6 +883,9 @@ class ProcessingWidgetContent(QWidget):
             return
         
         in_path = selected_items[0].data(Qt.UserRole)
+        if is_video_url(in_path):
+            QMessageBox.information(self, 'Предпросмотр', 'Для ссылки предпросмотр недоступен: видео еще не скачано.')
+            return
         temp_preview_path = os.path.join(
             self.parent_window.temp_dir,
             f'preview_{uuid.uuid4()}.png'
@@ -764,6 +910,7 @@ class ProcessingWidgetContent(QWidget):
             'overlay_pos': self.overlay_pos_combo.currentText(),
             'output_format': self.output_format_combo.currentText(),
             'blur_background': self.blur_background_checkbox.isChecked(),
+            'blur_mode': self.selected_blur_mode(),
             'crop_filter': crop_filter
         }
         
@@ -798,7 +945,6 @@ class ProcessingWidgetContent(QWidget):
     
     def set_controls_enabled(self, enabled):
         self.process_button.setEnabled(enabled)
-        self.yt_add_button.setEnabled(enabled)
         self.preview_button.setEnabled(enabled)
         self.video_list_widget.setEnabled(enabled)
     
@@ -808,6 +954,18 @@ class ProcessingWidgetContent(QWidget):
         if not is_reels:
             self.blur_background_checkbox.setChecked(False)
     
+    def on_blur_background_toggled(self, checked):
+        self.blur_mode_combo.setEnabled(checked)
+    
+    def on_encode_profile_changed(self, profile_text):
+        self.target_size_widget.setVisible(ENCODE_PROFILES.get(profile_text) == ENCODE_PROFILE_TARGET_SIZE)
+    
+    def selected_encode_profile(self):
+        return ENCODE_PROFILES.get(self.encode_profile_combo.currentText(), ENCODE_PROFILE_BALANCED)
+    
+    def selected_blur_mode(self):
+        return BLUR_MODES.get(self.blur_mode_combo.currentText(), BLUR_MODE_QUALITY)
+    
     def on_list_menu(self, pos: QPoint):
         menu = QMenu()
         act_del = menu.addAction('Удалить выделенное')
@@ -943,12 +1101,21 @@ class ProcessingWidgetContent(QWidget):
             auto_crop=self.auto_crop_checkbox.isChecked(),
             overlay_audio=self.overlay_audio_path_edit.text().strip() or None,
             original_volume=self.orig_vol_slider.value(),
-            overlay_volume=self.over_vol_slider.value()
+            overlay_volume=self.over_vol_slider.value(),
+            blur_mode=self.selected_blur_mode(),
+            parallel_jobs=self.parallel_jobs_spin.value(),
+            pin_cpus=self.pin_cpus_checkbox.isChecked(),
+            encode_profile=self.selected_encode_profile(),
+            target_size_mb=self.target_size_spin.value(),
+            two_pass=self.two_pass_checkbox.isChecked(),
+            auto_faster=self.auto_faster_checkbox.isChecked(),
+            segment_jobs=self.segment_jobs_spin.value(),
+            download_cache=self.download_cache
         )
         
         # Подключение сигналов
         self.processing_thread.progress.connect(self.on_prog)
-        self.processing_thread.file_progress.connect(self.on_file_prog)
+        self.processing_thread.telemetry.connect(self.on_telemetry)
         self.processing_thread.finished.connect(self.on_done)
         self.processing_thread.error.connect(self.on_err)
         self.processing_thread.file_processing.connect(self.on_file_processing)
@@ -965,10 +1132,15 @@ class ProcessingWidgetContent(QWidget):
     
     def on_prog(self, done, total):
         self.progress_label.setText(f'{done} / {total}')
-        self.progress_bar.setValue(100)
+        self.progress_bar.setValue(int(done / total * 100) if total else 0)
     
-    def on_file_prog(self, percentage):
-        self.progress_bar.setValue(percentage)
+    def on_telemetry(self, event):
+        # Полоса показывает прогресс пачки, текст - скорость текущего файла
+        self.progress_bar.setValue(int(event.batch_percent))
+        self.progress_bar.setFormat(
+            f'%p% · файл {event.percent}% · {event.fps:.0f} fps · {event.speed:.2f}x · '
+            f'осталось {format_eta(event.batch_eta)}'
+        )
     
     def on_file_processing(self, fname):
         try:
@@ -979,10 +1151,8 @@ class ProcessingWidgetContent(QWidget):
                 self.status_label.width() - 20
             )
             self.status_label.setText(elided_text)
-            self.progress_bar.setValue(0)
         except Exception:
             self.status_label.setText(f'Обрабатываю: ...{fname[-30:]}')
-            self.progress_bar.setValue(0)
     
     def on_status_update(self, message: str):
         self.status_label.setText(message)
@@ -992,17 +1162,19 @@ class ProcessingWidgetContent(QWidget):
             output_paths = self.processing_thread.output_paths
             QMessageBox.information(self, 'Готово', 'Обработка успешно завершена!')
             
-            if len(output_paths) == 1:
-                self.video_processed.emit(output_paths[0])
+            if output_paths:
+                self.video_processed.emit(list(output_paths))
         
         self.set_controls_enabled(True)
         self.status_label.setText('Готово')
+        self.progress_bar.setFormat('%p%')
         self.processing_thread = None
     
     def on_err(self, msg):
         QMessageBox.critical(self, 'Ошибка обработки', f'Произошла ошибка:\n\n{msg}')
         self.set_controls_enabled(True)
         self.status_label.setText('Ошибка')
+        self.progress_bar.setFormat('%p%')
         self.processing_thread = None
 
 
@@ -1208,7 +1380,7 @@ class VideoUnicApp(QMainWindow):
             print(f'Stylesheet not found at {path}')
             self.setStyleSheet('')
     
-    def prepare_for_upload(self, video_path):
+    def prepare_for_upload(self, video_paths):
         # Получение списка аккаунтов
         accounts = self.uploader_widget.get_account_names()
         if not accounts:
@@ -1216,9 +1388,13 @@ class VideoUnicApp(QMainWindow):
             return
         
         # Подтверждение загрузки
+        if len(video_paths) == 1:
+            question = 'Видео успешно обработано. Хотите отправить его на загрузку?'
+        else:
+            question = f'Обработано видео: {len(video_paths)}. Хотите добавить их в очередь загрузки?'
         reply = QMessageBox.question(
             self, 'Загрузка видео',
-            'Видео успешно обработано. Хотите отправить его на загрузку?',
+            question,
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.Yes
         )
@@ -1238,8 +1414,11 @@ class VideoUnicApp(QMainWindow):
             self.stacked_widget.setCurrentWidget(self.uploader_widget)
             self.upload_btn.setChecked(True)
             
-            # Передача видео для загрузки
-            self.uploader_widget.receive_video_for_upload(video_path, account_name)
+            # Одно видео попадает в форму, пачка - сразу в очередь загрузки
+            if len(video_paths) == 1:
+                self.uploader_widget.receive_video_for_upload(video_paths[0], account_name)
+            else:
+                self.uploader_widget.receive_videos_for_upload(video_paths, account_name)
     
     def _cleanup_temp_files(self):
         print('Cleaning up temporary files...')
@@ -1276,6 +1455,10 @@ class VideoUnicApp(QMainWindow):
             )
         
         if reply == QMessageBox.Yes:
+            # Незавершенные загрузки останавливаются до удаления временной папки
+            self.processing_widget.download_manager.cancel()
+            self.processing_widget.download_manager.wait(5)
+            
             if is_running:
                 try:
                     proc_thread.stop()
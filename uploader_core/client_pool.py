@@ -0,0 +1,143 @@
+"""
+Per-account pool of YouTube API clients and cached credentials.
+Пул клиентов YouTube API и кеш учетных данных по аккаунтам.
+
+Раньше каждая загрузка и каждый запрос плейлистов заново читали токен из
+файла, собирали клиент build('youtube', 'v3') и открывали новое
+TLS-соединение. Пул переиспользует и то, и другое:
+    - учетные данные аккаунта загружаются один раз и обновляются, только
+      когда токен истек;
+    - клиент выдается одному потоку на время работы (httplib2.Http не
+      потокобезопасен) и возвращается в пул вместе с открытым
+      соединением, поэтому следующая загрузка того же аккаунта не платит
+      за рукопожатие;
+    - prewarm() заранее загружает учетные данные и собирает клиенты в
+      фоновом потоке, пока пользователь еще не нажал "Загрузить".
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from uploader_core.youtube_api import build_youtube
+from utils.constants import YOUTUBE_CLIENTS_IDLE_MAX
+
+
+class YouTubeClientPool:
+    """
+    Клиенты YouTube API, сгруппированные по аккаунтам.
+
+    Использование:
+        with pool.client(account) as youtube:
+            list_playlists(youtube)
+    """
+
+    def __init__(self, credentials_func: Callable[[str], object],
+                 build_func: Callable = build_youtube, idle_max: int = YOUTUBE_CLIENTS_IDLE_MAX):
+        """
+        Args:
+            credentials_func: Возвращает учетные данные по имени аккаунта (None - нет доступа)
+            build_func: Создает клиент API по учетным данным (в бенчмарках - клиент заглушки)
+            idle_max: Сколько свободных клиентов одного аккаунта держать в пуле (0 - не держать)
+        """
+        self._credentials_func = credentials_func
+        self._build = build_func
+        self.idle_max = max(0, idle_max)
+        self._credentials: Dict[str, object] = {}
+        self._idle: Dict[str, List[object]] = {}
+        self._account_locks: Dict[str, threading.Lock] = {}
+        # Поколение аккаунта растет при invalidate: клиенты старых учетных данных не возвращаются в пул
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _account_lock(self, account: str) -> threading.Lock:
+        with self._lock:
+            return self._account_locks.setdefault(account, threading.Lock())
+
+    def credentials(self, account: str):
+        """
+        Учетные данные аккаунта из кеша; истекшие загружаются заново.
+
+        Returns:
+            Учетные данные или None, если аккаунт не авторизован
+        """
+        with self._account_lock(account):
+            credentials = self._credentials.get(account)
+            if credentials is not None and not getattr(credentials, 'expired', False):
+                return credentials
+            # AuthManager сам обновляет истекший токен и сохраняет его в файл
+            credentials = self._credentials_func(account)
+            with self._lock:
+                if credentials:
+                    self._credentials[account] = credentials
+                else:
+                    self._credentials.pop(account, None)
+            return credentials
+
+    def _acquire(self, account: str):
+        with self._lock:
+            generation = self._generations.get(account, 0)
+        credentials = self.credentials(account)
+        if not credentials:
+            raise PermissionError(f"Нет данных для аутентификации аккаунта '{account}'")
+        with self._lock:
+            idle = self._idle.get(account)
+            if idle and self._generations.get(account, 0) == generation:
+                return idle.pop(), generation
+        return self._build(credentials), generation
+
+    def _release(self, account: str, youtube, generation: int) -> None:
+        with self._lock:
+            if self._generations.get(account, 0) != generation:
+                return
+            idle = self._idle.setdefault(account, [])
+            if len(idle) < self.idle_max:
+                idle.append(youtube)
+
+    @contextmanager
+    def client(self, account: str) -> Iterator[object]:
+        """
+        Клиент аккаунта в монопольное пользование текущего потока.
+
+        Клиент возвращается в пул и после ошибки: httplib2 сам закрывает
+        оборванное соединение и открывает новое при следующем запросе.
+
+        Raises:
+            PermissionError: Если у аккаунта нет учетных данных
+        """
+        youtube, generation = self._acquire(account)
+        try:
+            yield youtube
+        finally:
+            self._release(account, youtube, generation)
+
+    def prewarm(self, accounts: Iterable[str]) -> threading.Thread:
+        """
+        В фоне загружает учетные данные и собирает по клиенту для каждого аккаунта.
+
+        Returns:
+            Запущенный поток (join() - дождаться окончания)
+        """
+        accounts = list(accounts)
+
+        def warm() -> None:
+            for account in accounts:
+                try:
+                    with self.client(account):
+                        pass
+                except Exception as e:
+                    logging.warning(f"Could not prepare YouTube client for '{account}': {e}")
+
+        thread = threading.Thread(target=warm, name='youtube-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, account: Optional[str] = None) -> None:
+        """Забывает учетные данные и клиенты аккаунта (None - всех), например после повторного входа."""
+        with self._lock:
+            accounts = [account] if account is not None else list(set(self._credentials) | set(self._idle))
+            for name in accounts:
+                self._credentials.pop(name, None)
+                self._idle.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
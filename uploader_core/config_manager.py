@@ -7,6 +7,10 @@ class ConfigManager:
         self.config_path = self._get_absolute_path('config/config.json') 
         self.history_path = self._get_absolute_path('config/history.json')
         self.schedule_path = self._get_absolute_path('config/schedule.json')
+        # Очередь загрузки пишет свое состояние сама (uploader_core/upload_queue.py)
+        self.upload_queue_path = self._get_absolute_path('config/upload_queue.json')
+        # Кеш плейлистов с ETag (uploader_core/playlist_cache.py)
+        self.playlist_cache_path = self._get_absolute_path('config/playlist_cache.json')
 
         # Load configurations
         self.config = self._load_json(self.config_path, default={'ffmpeg_path': '', 'accounts': {}, 'settings': {}})
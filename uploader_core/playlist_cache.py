@@ -0,0 +1,136 @@
+"""
+Local cache of account playlists with ETag-based incremental refresh.
+Локальный кеш плейлистов аккаунтов с обновлением по ETag.
+
+Вкладка аккаунта показывает плейлисты из кеша сразу при открытии, а
+обновление идет в фоне. Кеш хранит каждую страницу playlists().list
+вместе с ее ETag; при обновлении страница запрашивается условно
+(If-None-Match), и неизменившаяся страница приходит ответом 304 без
+данных. Новые данные пишутся в JSON атомарно, как состояние очереди
+загрузки.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from uploader_core.youtube_api import list_playlists_page
+
+
+class PlaylistCache:
+    """Плейлисты аккаунтов, сохраненные постранично с ETag."""
+
+    def __init__(self, path: Optional[str]):
+        """
+        Args:
+            path: JSON с кешем (None - хранить только в памяти)
+        """
+        self.path = path
+        self._accounts: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def playlists(self, account: str) -> Optional[List[Dict]]:
+        """
+        Плейлисты аккаунта из кеша.
+
+        Returns:
+            Список словарей с id, title, description и item_count
+            или None, если плейлисты аккаунта еще не загружались
+        """
+        with self._lock:
+            entry = self._accounts.get(account)
+            if entry is None:
+                return None
+            return [playlist for page in entry['pages'] for playlist in page['items']]
+
+    def refresh(self, youtube, account: str) -> Tuple[List[Dict], bool]:
+        """
+        Обновляет плейлисты аккаунта, запрашивая каждую известную страницу условно.
+
+        Args:
+            youtube: Клиент API аккаунта
+            account: Имя аккаунта
+
+        Returns:
+            (плейлисты, изменились ли они с прошлого обновления)
+
+        Raises:
+            HttpError: При ошибке API (кеш при этом не меняется)
+        """
+        with self._lock:
+            entry = self._accounts.get(account)
+            cached = {page['token']: page for page in entry['pages']} if entry else {}
+
+        pages = []
+        changed = entry is None
+        fetched = False
+        token = None
+        while True:
+            cached_page = cached.get(token)
+            response = list_playlists_page(youtube, token, cached_page['etag'] if cached_page else None)
+            if response is None:
+                page = cached_page
+            else:
+                fetched = True
+                page = {'token': token, 'etag': response['etag'], 'items': response['items'],
+                        'next': response['next_page_token']}
+                changed = changed or cached_page is None or page['items'] != cached_page['items']
+            pages.append(page)
+            token = page['next']
+            if not token:
+                break
+        # Страниц стало меньше: последние плейлисты удалены
+        changed = changed or len(pages) != len(cached)
+
+        with self._lock:
+            self._accounts[account] = {'pages': pages, 'updated_at': time.time()}
+        if changed or fetched:
+            self._save()
+        playlists = [playlist for page in pages for playlist in page['items']]
+        if changed:
+            logging.info(f"Playlists of '{account}' updated: {len(playlists)}")
+        return playlists, changed
+
+    def forget(self, account: str) -> None:
+        """Удаляет плейлисты аккаунта из кеша, например после удаления аккаунта."""
+        with self._lock:
+            removed = self._accounts.pop(account, None)
+        if removed is not None:
+            self._save()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f'Failed to read playlist cache: {e}')
+            return
+        accounts = data.get('accounts', {})
+        if isinstance(accounts, dict):
+            self._accounts = {name: entry for name, entry in accounts.items()
+                              if isinstance(entry, dict) and isinstance(entry.get('pages'), list)}
+
+    def _save(self) -> None:
+        """Атомарно записывает кеш."""
+        if not self.path:
+            return
+        with self._lock:
+            data = {'accounts': dict(self._accounts)}
+        with self._save_lock:
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.warning(f'Failed to save playlist cache: {e}')
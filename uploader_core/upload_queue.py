@@ -0,0 +1,457 @@
+"""
+Upload queue for YouTube: parallel uploads across accounts with persisted state.
+Очередь загрузки на YouTube: параллельные загрузки по аккаунтам с сохранением состояния.
+
+UploadQueue держит не больше jobs одновременных загрузок всего и не больше
+account_jobs на один аккаунт. О каждом элементе сообщается через обратные
+вызовы: прогресс, успешная загрузка, ошибка. Обратные вызовы приходят из
+рабочих потоков; UI пересылает их в свой поток сигналами Qt.
+
+Состояние очереди пишется в JSON при каждом изменении статуса, поэтому
+после перезапуска незавершенные элементы продолжают загружаться, а
+пачка из сотен файлов может грузиться без присмотра. Вместе с элементом
+сохраняется адрес его сессии resumable upload: прерванный файл
+продолжается с последнего подтвержденного сервером байта.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from typing import Callable, Dict, Iterable, List, Optional
+
+from uploader_core.client_pool import YouTubeClientPool
+from uploader_core.youtube_api import (
+    UploadCancelledError, add_to_playlist, describe_error, is_retryable_error,
+    upload_chunk_size, upload_video, video_body
+)
+from utils.constants import (
+    UPLOAD_ACCOUNT_JOBS_DEFAULT, UPLOAD_BACKOFF_SECONDS, UPLOAD_CHUNK_MB, UPLOAD_JOBS_DEFAULT, UPLOAD_RETRIES
+)
+from utils.resource_utils import session_report
+
+
+# Состояния элемента очереди
+UPLOAD_PENDING = 'pending'
+UPLOAD_RUNNING = 'running'
+UPLOAD_RETRYING = 'retrying'
+UPLOAD_DONE = 'done'
+UPLOAD_FAILED = 'failed'
+UPLOAD_CANCELLED = 'cancelled'
+
+UPLOAD_ACTIVE_STATES = (UPLOAD_PENDING, UPLOAD_RUNNING, UPLOAD_RETRYING)
+UPLOAD_FINISHED_STATES = (UPLOAD_DONE, UPLOAD_FAILED, UPLOAD_CANCELLED)
+
+
+@dataclass
+class UploadItem:
+    """Один элемент очереди загрузки: файл, аккаунт и метаданные видео."""
+    account: str
+    video_path: str
+    title: str
+    description: str = ''
+    tags: List[str] = field(default_factory=list)
+    privacy_status: str = 'private'
+    category: str = '22'
+    publish_at: Optional[str] = None
+    playlist_id: Optional[str] = None
+    playlist_title: str = ''
+    made_for_kids: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = UPLOAD_PENDING
+    percent: float = 0.0
+    attempts: int = 0
+    video_id: str = ''
+    error: str = ''
+    warning: str = ''  # Видео загружено, но, например, не добавлено в плейлист
+    added_at: float = field(default_factory=time.time)
+    finished_at: float = 0.0
+    session_uri: str = ''  # Адрес сессии resumable upload незавершенной загрузки
+    session_stamp: str = ''  # Размер и время изменения файла, для которого открыта сессия
+
+    def body(self) -> Dict:
+        """Метаданные для videos().insert."""
+        return video_body(self.title, self.description, self.tags, self.privacy_status,
+                          self.category, self.publish_at, self.made_for_kids)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UploadItem':
+        """Элемент из сохраненного состояния (лишние ключи игнорируются)."""
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+
+def _file_stamp(path: str) -> str:
+    """Размер и время изменения файла: сессия продолжается, только если файл не менялся."""
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def upload_item(youtube, item: UploadItem, progress_callback: Callable[[int], None],
+                cancel_event: threading.Event, chunk_size: int = upload_chunk_size(),
+                on_session: Optional[Callable[[UploadItem], None]] = None) -> str:
+    """
+    Загружает элемент очереди через YouTube Data API и добавляет видео в плейлист.
+
+    Если у элемента сохранена сессия для того же файла, загрузка
+    продолжается с нее. Ошибка добавления в плейлист не считается ошибкой
+    загрузки: она сохраняется в item.warning.
+
+    Args:
+        youtube: Клиент API аккаунта (из YouTubeClientPool)
+        item: Элемент очереди
+        progress_callback: Получает процент загрузки
+        cancel_event: Событие отмены
+        chunk_size: Размер части в байтах
+        on_session: Вызывается, когда у элемента появилась новая сессия (чтобы сохранить ее)
+
+    Returns:
+        ID загруженного видео
+    """
+    stamp = _file_stamp(item.video_path)
+    session_uri = item.session_uri if item.session_uri and item.session_stamp == stamp else None
+
+    def remember_session(uri: str) -> None:
+        item.session_uri = uri
+        item.session_stamp = stamp
+        if on_session:
+            on_session(item)
+
+    video_id = upload_video(youtube, item.video_path, item.body(), progress_callback, cancel_event,
+                            chunk_size=chunk_size, session_uri=session_uri, on_session=remember_session)
+    item.session_uri = ''
+    item.session_stamp = ''
+    if item.playlist_id and video_id:
+        try:
+            add_to_playlist(youtube, item.playlist_id, video_id)
+        except Exception as e:
+            item.warning = f'Видео загружено, но не добавлено в плейлист: {describe_error(e)}'
+            logging.warning(f"Video {video_id} was not added to playlist {item.playlist_id}: {e}")
+    return video_id
+
+
+class UploadQueue:
+    """
+    Очередь параллельной загрузки видео на YouTube.
+
+    Элементы запускаются по порядку добавления; элемент, аккаунт которого
+    уже занял account_jobs слотов, пропускается, пока слот не освободится,
+    и очередь берет следующий элемент другого аккаунта. Временные ошибки
+    (5xx, обрыв соединения) сначала повторяются для отдельной части файла
+    (upload_video), затем всей загрузкой до retries раз с экспоненциальной
+    задержкой; повтор продолжает сохраненную сессию. Ошибки API 4xx,
+    отсутствие файла и отмена не повторяются.
+    """
+
+    def __init__(self, state_path: Optional[str], clients: YouTubeClientPool,
+                 jobs: int = UPLOAD_JOBS_DEFAULT, account_jobs: int = UPLOAD_ACCOUNT_JOBS_DEFAULT,
+                 retries: int = UPLOAD_RETRIES, backoff: float = UPLOAD_BACKOFF_SECONDS,
+                 chunk_mb: float = UPLOAD_CHUNK_MB,
+                 on_update: Optional[Callable[[UploadItem], None]] = None,
+                 on_finished: Optional[Callable[[UploadItem], None]] = None,
+                 on_failed: Optional[Callable[[UploadItem], None]] = None,
+                 upload_func: Callable = upload_item):
+        """
+        Args:
+            state_path: JSON с состоянием очереди (None - не сохранять)
+            clients: Пул клиентов API по аккаунтам
+            jobs: Сколько загрузок идут одновременно всего
+            account_jobs: Сколько загрузок одновременно на один аккаунт
+            retries: Сколько раз повторять загрузку после временной ошибки
+            backoff: Задержка перед первым повтором, секунды (дальше удваивается)
+            chunk_mb: Размер части файла, МБ
+            on_update: Вызывается при изменении состояния или прогресса элемента
+            on_finished: Вызывается, когда видео загружено
+            on_failed: Вызывается, когда элемент окончательно не загружен
+            upload_func: Функция загрузки (youtube, item, progress_callback, cancel_event,
+                chunk_size=, on_session=) -> ID видео
+        """
+        self.state_path = state_path
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.on_update = on_update
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self._clients = clients
+        self._upload = upload_func
+        self._jobs = max(1, jobs)
+        self._account_jobs = max(1, account_jobs)
+        self.chunk_mb = chunk_mb
+        self._items: Dict[str, UploadItem] = {}
+        self._active: Dict[str, int] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        # Незавершенные элементы прошлого запуска продолжают загружаться
+        self._load()
+        self._pump()
+
+    @property
+    def jobs(self) -> int:
+        return self._jobs
+
+    @jobs.setter
+    def jobs(self, value: int) -> None:
+        """Меняет число одновременных загрузок; уже идущие не прерываются."""
+        with self._lock:
+            self._jobs = max(1, value)
+        self._pump()
+
+    @property
+    def account_jobs(self) -> int:
+        return self._account_jobs
+
+    @account_jobs.setter
+    def account_jobs(self, value: int) -> None:
+        """Меняет число одновременных загрузок одного аккаунта."""
+        with self._lock:
+            self._account_jobs = max(1, value)
+        self._pump()
+
+    @property
+    def chunk_mb(self) -> float:
+        return self._chunk_mb
+
+    @chunk_mb.setter
+    def chunk_mb(self, value: float) -> None:
+        """Меняет размер части; действует на загрузки, которые начнутся после изменения."""
+        self._chunk_mb = max(0.25, value)
+
+    def items(self) -> List[UploadItem]:
+        """Снимок очереди в порядке добавления."""
+        with self._lock:
+            return list(self._items.values())
+
+    def add(self, items: Iterable[UploadItem]) -> List[UploadItem]:
+        """
+        Добавляет элементы в очередь.
+
+        Файл, который уже ждет или загружается в тот же аккаунт, пропускается.
+
+        Returns:
+            Добавленные элементы
+        """
+        added = []
+        with self._lock:
+            queued = {(item.account, os.path.normcase(os.path.abspath(item.video_path)))
+                      for item in self._items.values() if item.status in UPLOAD_ACTIVE_STATES}
+            for item in items:
+                key = (item.account, os.path.normcase(os.path.abspath(item.video_path)))
+                if key in queued:
+                    logging.info(f"Skipping duplicate upload of '{item.video_path}' to '{item.account}'")
+                    continue
+                queued.add(key)
+                item.status = UPLOAD_PENDING
+                self._items[item.id] = item
+                added.append(item)
+            if added:
+                self._idle.clear()
+        for item in added:
+            self._notify(self.on_update, item)
+        self._save()
+        self._pump()
+        return added
+
+    def cancel(self, account: Optional[str] = None, item_ids: Optional[Iterable[str]] = None) -> None:
+        """
+        Отменяет ожидающие и идущие загрузки.
+
+        Args:
+            account: Только элементы этого аккаунта (None - всех)
+            item_ids: Только эти элементы (None - все подходящие)
+        """
+        wanted = set(item_ids) if item_ids is not None else None
+        cancelled = []
+        with self._lock:
+            for item in self._items.values():
+                if account is not None and item.account != account:
+                    continue
+                if wanted is not None and item.id not in wanted:
+                    continue
+                if item.status == UPLOAD_PENDING:
+                    item.status = UPLOAD_CANCELLED
+                    cancelled.append(item)
+                elif item.id in self._cancel_events:
+                    self._cancel_events[item.id].set()
+        for item in cancelled:
+            self._notify(self.on_update, item)
+        self._save()
+        self._pump()
+
+    def retry_failed(self) -> List[UploadItem]:
+        """Возвращает в очередь элементы с ошибкой и отмененные."""
+        retried = []
+        with self._lock:
+            for item in self._items.values():
+                if item.status in (UPLOAD_FAILED, UPLOAD_CANCELLED):
+                    item.status = UPLOAD_PENDING
+                    item.percent = 0.0
+                    item.attempts = 0
+                    item.error = ''
+                    retried.append(item)
+            if retried:
+                self._idle.clear()
+        for item in retried:
+            self._notify(self.on_update, item)
+        self._save()
+        self._pump()
+        return retried
+
+    def clear_finished(self) -> List[UploadItem]:
+        """Убирает из очереди загруженные, отмененные и неудачные элементы."""
+        with self._lock:
+            removed = [item for item in self._items.values() if item.status in UPLOAD_FINISHED_STATES]
+            for item in removed:
+                del self._items[item.id]
+        self._save()
+        return removed
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждет, пока очередь опустеет. False, если вышел таймаут."""
+        return self._idle.wait(timeout)
+
+    def _load(self) -> None:
+        """Читает сохраненное состояние; прерванные загрузки снова ждут своей очереди."""
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f'Failed to read upload queue state: {e}')
+            return
+
+        for entry in data.get('items', []):
+            try:
+                item = UploadItem.from_dict(entry)
+            except TypeError as e:
+                logging.warning(f'Skipping broken upload queue entry: {e}')
+                continue
+            if item.status in (UPLOAD_RUNNING, UPLOAD_RETRYING):
+                item.status = UPLOAD_PENDING
+                item.percent = 0.0
+            self._items[item.id] = item
+        pending = sum(1 for item in self._items.values() if item.status == UPLOAD_PENDING)
+        if pending:
+            self._idle.clear()
+            logging.info(f'Upload queue restored: {pending} pending of {len(self._items)}')
+
+    def _save(self) -> None:
+        """Атомарно записывает состояние очереди."""
+        if not self.state_path:
+            return
+        with self._lock:
+            data = {'items': [asdict(item) for item in self._items.values()]}
+        with self._save_lock:
+            temp_path = f'{self.state_path}.{os.getpid()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                os.replace(temp_path, self.state_path)
+            except OSError as e:
+                logging.warning(f'Failed to save upload queue state: {e}')
+
+    def _pump(self) -> None:
+        """Запускает ожидающие элементы, пока есть свободные слоты (общие и аккаунта)."""
+        with self._lock:
+            to_start = []
+            running = sum(self._active.values())
+            for item in self._items.values():
+                if running >= self._jobs:
+                    break
+                if item.status != UPLOAD_PENDING or self._active.get(item.account, 0) >= self._account_jobs:
+                    continue
+                item.status = UPLOAD_RUNNING
+                self._active[item.account] = self._active.get(item.account, 0) + 1
+                self._cancel_events[item.id] = threading.Event()
+                running += 1
+                to_start.append(item)
+            if not running and not any(item.status == UPLOAD_PENDING for item in self._items.values()):
+                self._idle.set()
+        for item in to_start:
+            threading.Thread(target=self._run_item, args=(item,), daemon=True).start()
+
+    def _run_item(self, item: UploadItem) -> None:
+        try:
+            self._upload_with_retries(item)
+        finally:
+            with self._lock:
+                self._active[item.account] -= 1
+                self._cancel_events.pop(item.id, None)
+            self._save()
+            self._pump()
+
+    def _upload_with_retries(self, item: UploadItem) -> None:
+        with self._lock:
+            cancel_event = self._cancel_events[item.id]
+
+        def on_progress(percent: int) -> None:
+            item.percent = float(percent)
+            self._notify(self.on_update, item)
+
+        while True:
+            item.attempts += 1
+            item.status = UPLOAD_RUNNING
+            item.percent = 0.0
+            self._notify(self.on_update, item)
+            self._save()
+            try:
+                if not os.path.isfile(item.video_path):
+                    raise FileNotFoundError(f'Видеофайл не найден: {item.video_path}')
+                # Клиент и соединение аккаунта берутся из пула; PermissionError, если нет доступа
+                with self._clients.client(item.account) as youtube, \
+                        session_report('uploads').track('upload', os.path.basename(item.video_path), item.video_path):
+                    # Время, CPU и объем загрузки попадают в отчет logs/resources/uploads_*.jsonl
+                    item.video_id = self._upload(youtube, item, on_progress, cancel_event,
+                                                 chunk_size=upload_chunk_size(self._chunk_mb),
+                                                 on_session=lambda _item: self._save())
+                item.status = UPLOAD_DONE
+                item.percent = 100.0
+                item.error = ''
+                item.finished_at = time.time()
+                self._notify(self.on_update, item)
+                self._notify(self.on_finished, item)
+                return
+            except UploadCancelledError as e:
+                final_status = UPLOAD_CANCELLED
+                item.error = str(e)
+            except Exception as e:
+                item.error = describe_error(e)
+                if is_retryable_error(e) and item.attempts <= self.retries and not cancel_event.is_set():
+                    delay = self.backoff * 2 ** (item.attempts - 1) * random.uniform(0.8, 1.2)
+                    logging.warning(f"Upload of '{item.video_path}' failed (attempt {item.attempts}), "
+                                    f"retrying in {delay:.1f}s: {item.error}")
+                    item.status = UPLOAD_RETRYING
+                    self._notify(self.on_update, item)
+                    if not cancel_event.wait(delay):
+                        continue
+                    item.error = f"Upload of '{item.video_path}' was cancelled."
+                    final_status = UPLOAD_CANCELLED
+                else:
+                    final_status = UPLOAD_FAILED
+
+            item.status = final_status
+            item.finished_at = time.time()
+            self._notify(self.on_update, item)
+            if final_status == UPLOAD_FAILED:
+                logging.error(f"Upload of '{item.video_path}' to '{item.account}' failed: {item.error}")
+                self._notify(self.on_failed, item)
+            return
+
+    @staticmethod
+    def _notify(callback: Optional[Callable[[UploadItem], None]], item: UploadItem) -> None:
+        if callback is None:
+            return
+        try:
+            callback(item)
+        except Exception as e:
+            logging.error(f'Upload callback failed: {e}')
@@ -0,0 +1,317 @@
+"""
+YouTube Data API calls without Qt: upload, playlists.
+Вызовы YouTube Data API без Qt: загрузка видео, плейлисты.
+
+Функции используются воркерами вкладки аккаунта и очередью загрузки
+(uploader_core/upload_queue.py), поэтому не зависят от PyQt5.
+
+Видео отправляется частями (resumable upload). Временная ошибка при
+отправке части повторяется с последнего байта, подтвержденного сервером,
+а адрес сессии загрузки передается наружу, чтобы после перезапуска
+приложения продолжить ту же сессию, а не начинать файл заново.
+"""
+
+import logging
+import random
+import socket
+import ssl
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import httplib2
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+
+from utils.constants import (
+    UPLOAD_BACKOFF_MAX_SECONDS, UPLOAD_CHUNK_BACKOFF_SECONDS, UPLOAD_CHUNK_MB, UPLOAD_CHUNK_RETRIES
+)
+
+# Ответы сервера, после которых загрузку стоит повторить
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+# Сессия загрузки истекла или неизвестна серверу: файл начинается заново
+EXPIRED_SESSION_STATUS_CODES = (404, 410)
+# Ответ на условный запрос (If-None-Match), если данные не изменились
+NOT_MODIFIED_STATUS_CODE = 304
+# Размер части resumable upload должен быть кратен 256 КБ
+UPLOAD_CHUNK_ALIGN = 256 * 1024
+
+
+class UploadCancelledError(RuntimeError):
+    """Загрузка остановлена через cancel_event."""
+
+
+class _ChunkedFileUpload(MediaFileUpload):
+    """
+    MediaFileUpload, который отдает часть файла байтами, а не потоком.
+
+    httplib2 сам повторяет запрос после разрыва соединения; поток к этому
+    моменту уже прочитан, и повтор ушел бы без тела. Байты части
+    отправляются повторно целиком.
+    """
+
+    def has_stream(self) -> bool:
+        return False
+
+
+def build_youtube(credentials):
+    """Клиент YouTube Data API v3 для учетных данных аккаунта."""
+    return build('youtube', 'v3', credentials=credentials, cache_discovery=False)
+
+
+def video_body(title: str, description: str, tags: List[str], privacy_status: str, category: str,
+               publish_at: Optional[str] = None, made_for_kids: bool = False) -> Dict:
+    """
+    Метаданные видео для videos().insert.
+
+    Args:
+        title: Заголовок
+        description: Описание
+        tags: Теги
+        privacy_status: private, unlisted или public
+        category: ID категории
+        publish_at: Время публикации ISO 8601 (только для private)
+        made_for_kids: Видео для детей
+
+    Returns:
+        Тело запроса со snippet и status
+    """
+    body = {
+        'snippet': {
+            'title': title,
+            'description': description,
+            'tags': [tag.strip() for tag in tags if tag.strip()],
+            'categoryId': category
+        },
+        'status': {
+            'privacyStatus': privacy_status,
+            'selfDeclaredMadeForKids': made_for_kids
+        }
+    }
+
+    # Время публикации работает только для приватного видео
+    if publish_at and privacy_status == 'private':
+        body['status']['publishAt'] = publish_at
+    return body
+
+
+def upload_chunk_size(chunk_mb: float = UPLOAD_CHUNK_MB) -> int:
+    """Размер части в байтах, округленный вверх до кратного 256 КБ."""
+    size = max(1, int(chunk_mb * 1024 * 1024))
+    return -(-size // UPLOAD_CHUNK_ALIGN) * UPLOAD_CHUNK_ALIGN
+
+
+def _resume_session(request, session_uri: str, size: int) -> Optional[Dict]:
+    """
+    Запрашивает состояние сохраненной сессии загрузки ("bytes */N").
+
+    Args:
+        request: Запрос videos().insert
+        session_uri: Адрес сессии из прошлой попытки
+        size: Размер файла
+
+    Returns:
+        Ответ API, если файл уже получен сервером полностью, иначе None.
+        Если сессия жива, request продолжит ее с подтвержденного байта;
+        если истекла - начнет новую.
+
+    Raises:
+        HttpError: При другой ошибке API
+    """
+    resp, content = request.http.request(
+        session_uri, 'PUT', body=b'',
+        headers={'Content-Range': f'bytes */{size}', 'Content-Length': '0'}
+    )
+    if resp.status in (200, 201):
+        return request.postproc(resp, content)
+    if resp.status == 308:
+        request.resumable_uri = resp.get('location', session_uri)
+        request.resumable_progress = int(resp['range'].split('-')[1]) + 1 if 'range' in resp else 0
+        logging.info(f'Resuming upload session from byte {request.resumable_progress} of {size}')
+        return None
+    if resp.status in EXPIRED_SESSION_STATUS_CODES:
+        logging.info(f'Upload session expired ({resp.status}), starting the file over')
+        return None
+    raise HttpError(resp, content, uri=session_uri)
+
+
+def upload_video(youtube, video_path: str, body: Dict,
+                 progress_callback: Optional[Callable[[int], None]] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 chunk_size: int = upload_chunk_size(),
+                 session_uri: Optional[str] = None,
+                 on_session: Optional[Callable[[str], None]] = None,
+                 retries: int = UPLOAD_CHUNK_RETRIES,
+                 backoff: float = UPLOAD_CHUNK_BACKOFF_SECONDS) -> str:
+    """
+    Загружает видео частями (resumable upload).
+
+    После временной ошибки (5xx, обрыв соединения) клиент запрашивает у
+    сервера последний полученный байт и отправляет файл дальше с него;
+    повторы идут с экспоненциальной задержкой, счетчик сбрасывается после
+    каждой успешно отправленной части.
+
+    Args:
+        youtube: Клиент из build_youtube
+        video_path: Путь к файлу
+        body: Метаданные из video_body
+        progress_callback: Получает процент загрузки
+        cancel_event: Событие отмены; проверяется между частями файла
+        chunk_size: Размер части в байтах (кратен 256 КБ, см. upload_chunk_size)
+        session_uri: Адрес сессии прерванной загрузки этого файла
+        on_session: Получает адрес новой сессии, чтобы сохранить его
+        retries: Сколько раз подряд повторять неудачную часть
+        backoff: Задержка перед первым повтором, секунды (дальше удваивается)
+
+    Returns:
+        ID загруженного видео
+
+    Raises:
+        UploadCancelledError: Если загрузка отменена
+        HttpError: При ошибке API
+    """
+    media = _ChunkedFileUpload(video_path, chunksize=chunk_size, resumable=True)
+    request = youtube.videos().insert(
+        part=','.join(body.keys()),
+        body=body,
+        media_body=media
+    )
+
+    def check_cancel(wait: float = 0.0) -> None:
+        """Ждет wait секунд; UploadCancelledError, если загрузку отменили."""
+        if cancel_event is None:
+            time.sleep(wait)
+            return
+        if cancel_event.wait(wait):
+            raise UploadCancelledError(f"Upload of '{video_path}' was cancelled.")
+
+    known_uri = session_uri
+    resume_uri = session_uri
+    failures = 0
+    response = None
+    while response is None:
+        check_cancel()
+        try:
+            if resume_uri:
+                response = _resume_session(request, resume_uri, media.size())
+                resume_uri = None
+                if response is not None:
+                    break
+            status, response = request.next_chunk()
+            failures = 0
+            if status and progress_callback:
+                progress_callback(int(status.progress() * 100))
+        except Exception as e:
+            failures += 1
+            if not is_retryable_error(e) or failures > retries:
+                raise
+            delay = min(UPLOAD_BACKOFF_MAX_SECONDS, backoff * 2 ** (failures - 1)) * random.uniform(0.8, 1.2)
+            logging.warning(f"Chunk of '{video_path}' failed at byte {request.resumable_progress} "
+                            f"(attempt {failures}), retrying in {delay:.1f}s: {describe_error(e)}")
+            check_cancel(delay)
+        finally:
+            # Новая сессия сохраняется сразу, даже если первая часть не дошла
+            if request.resumable_uri and request.resumable_uri != known_uri:
+                known_uri = request.resumable_uri
+                if on_session:
+                    on_session(known_uri)
+    return response.get('id')
+
+
+def add_to_playlist(youtube, playlist_id: str, video_id: str) -> None:
+    """Добавляет видео в плейлист."""
+    youtube.playlistItems().insert(
+        part='snippet',
+        body={
+            'snippet': {
+                'playlistId': playlist_id,
+                'resourceId': {
+                    'kind': 'youtube#video',
+                    'videoId': video_id
+                }
+            }
+        }
+    ).execute()
+
+
+def _playlist_entry(playlist: Dict) -> Dict:
+    return {
+        'id': playlist['id'],
+        'title': playlist['snippet']['title'],
+        'description': playlist['snippet'].get('description', ''),
+        'item_count': playlist['contentDetails'].get('itemCount', 0)
+    }
+
+
+def list_playlists_page(youtube, page_token: Optional[str] = None, etag: Optional[str] = None) -> Optional[Dict]:
+    """
+    Одна страница плейлистов аккаунта.
+
+    Args:
+        youtube: Клиент из build_youtube
+        page_token: Токен страницы (None - первая)
+        etag: ETag этой страницы из прошлого ответа; с ним запрос условный (If-None-Match)
+
+    Returns:
+        Словарь с etag, items (как в list_playlists) и next_page_token
+        или None, если страница не изменилась с прошлого ответа (304)
+
+    Raises:
+        HttpError: При ошибке API
+    """
+    request = youtube.playlists().list(
+        part='snippet,contentDetails',
+        mine=True,
+        maxResults=50,
+        pageToken=page_token
+    )
+    if etag:
+        request.headers['If-None-Match'] = etag
+    try:
+        response = request.execute()
+    except HttpError as e:
+        if etag and e.resp.status == NOT_MODIFIED_STATUS_CODE:
+            return None
+        raise
+    return {
+        'etag': response.get('etag', ''),
+        'items': [_playlist_entry(playlist) for playlist in response.get('items', [])],
+        'next_page_token': response.get('nextPageToken')
+    }
+
+
+def list_playlists(youtube) -> List[Dict]:
+    """
+    Плейлисты аккаунта.
+
+    Returns:
+        Список словарей с id, title, description и item_count
+    """
+    playlists = []
+    next_page_token = None
+
+    while True:
+        page = list_playlists_page(youtube, next_page_token)
+        playlists.extend(page['items'])
+        next_page_token = page['next_page_token']
+        if not next_page_token:
+            break
+    return playlists
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Временная ошибка (5xx, обрыв или таймаут соединения), после которой загрузку можно повторить."""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUS_CODES
+    if isinstance(error, FileNotFoundError):
+        return False
+    return isinstance(error, (httplib2.HttpLib2Error, ConnectionError, TimeoutError, socket.timeout, ssl.SSLError))
+
+
+def describe_error(error: Exception) -> str:
+    """Текст ошибки для интерфейса и журнала."""
+    if isinstance(error, HttpError):
+        content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else error.content
+        return f'Ошибка API YouTube: {error.resp.status} {content}'
+    return str(error) or type(error).__name__
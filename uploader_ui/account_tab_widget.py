@@ -7,20 +7,28 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import QDateTime, QThreadPool
 import qtawesome as qta
 
+import logging
+import os
+
 from uploader_core.ai_worker import AIWorker
-from uploader_core.youtube_worker import YouTubeWorker, PlaylistWorker
+from uploader_core.upload_queue import UploadItem
+from uploader_core.youtube_worker import PlaylistWorker
 
 
 class AccountTabWidget(QWidget):
     """Виджет для управления одним аккаунтом YouTube"""
     
-    def __init__(self, account_name, config_manager, auth_manager, parent=None):
+    def __init__(self, account_name, config_manager, auth_manager, upload_queue, client_pool, playlist_cache,
+                 parent=None):
         super().__init__(parent)
         
         # Сохранение параметров
         self.account_name = account_name
         self.config_manager = config_manager
         self.auth_manager = auth_manager
+        self.upload_queue = upload_queue
+        self.client_pool = client_pool
+        self.playlist_cache = playlist_cache
         
         # Пул потоков для фоновых задач
         self.thread_pool = QThreadPool()
@@ -50,6 +58,12 @@ class AccountTabWidget(QWidget):
         # Добавление в основной layout
         self.main_layout.addWidget(self.sub_tabs)
         self.setLayout(self.main_layout)
+        
+        # Плейлисты из кеша показываются сразу, изменения подтягиваются в фоне
+        cached_playlists = self.playlist_cache.playlists(self.account_name)
+        if cached_playlists is not None:
+            self._fill_playlist_combo(cached_playlists)
+        self._refresh_playlists_in_background()
     
     def _tab_changed(self, index):
         """Обработчик смены вкладки"""
@@ -173,14 +187,18 @@ class AccountTabWidget(QWidget):
         
         layout.addWidget(ai_group)
         
-        # Кнопка загрузки
+        # Кнопка загрузки: видео встает в общую очередь загрузки
         self.upload_btn = QPushButton(
             qta.icon('fa5s.upload', color='white'),
-            ' Загрузить видео'
+            ' Добавить в очередь загрузки'
         )
         self.upload_btn.clicked.connect(self._run_upload)
         
+        self.upload_status_label = QLabel('')
+        self.upload_status_label.setStyleSheet('color: gray;')
+        
         layout.addWidget(self.upload_btn)
+        layout.addWidget(self.upload_status_label)
         layout.addStretch()
     
     def _create_scheduled_upload_tab(self):
@@ -323,7 +341,7 @@ class AccountTabWidget(QWidget):
         QMessageBox.critical(self, 'Ошибка AI', str(error_message))
     
     def _run_upload(self):
-        """Запуск загрузки видео на YouTube"""
+        """Добавление видео из формы в очередь загрузки на YouTube"""
         # Получаем данные из формы
         video_path = self.video_path_edit.text()
         title = self.title_edit.text()
@@ -338,7 +356,7 @@ class AccountTabWidget(QWidget):
             return
         
         # Получаем учетные данные для аутентификации
-        credentials = self.auth_manager.get_credentials(self.account_name)
+        credentials = self.client_pool.credentials(self.account_name)
         if not credentials:
             QMessageBox.critical(
                 self, 'Ошибка',
@@ -346,16 +364,42 @@ class AccountTabWidget(QWidget):
             )
             return
         
-        # Отключаем кнопку загрузки
-        self.upload_btn.setEnabled(False)
-        self.upload_btn.setText(' Загрузка...')
-        
-        # Подготавливаем параметры загрузки
-        worker = YouTubeWorker(
-            credentials=credentials,
+        added = self.upload_queue.add([self._form_item(video_path, title)])
+        if added:
+            self.upload_status_label.setText(f'В очереди загрузки: {title}')
+            self._clear_manual_upload_form()
+        else:
+            self.upload_status_label.setText('Это видео уже в очереди загрузки.')
+    
+    def queue_videos(self, video_paths):
+        """
+        Добавление пачки видео в очередь загрузки с настройками из формы.
+        
+        Заголовок берется из формы, если видео одно и заголовок заполнен,
+        иначе из имени файла. Описание, теги, приватность, категория,
+        плейлист и аудитория общие для всей пачки.
+        
+        Returns:
+            Список добавленных элементов очереди
+        """
+        form_title = self.title_edit.text()
+        items = []
+        for video_path in video_paths:
+            title = form_title if form_title and len(video_paths) == 1 else os.path.splitext(os.path.basename(video_path))[0]
+            items.append(self._form_item(video_path, title))
+        
+        added = self.upload_queue.add(items)
+        self.upload_status_label.setText(f'Добавлено в очередь загрузки: {len(added)}')
+        return added
+    
+    def _form_item(self, video_path, title):
+        """Элемент очереди загрузки с метаданными из формы"""
+        playlist_id = self.playlist_combo.currentData()
+        return UploadItem(
+            account=self.account_name,
             video_path=video_path,
             title=title,
-            description=description,
+            description=self.description_edit.toPlainText(),
             tags=self.tags_edit.text().split(','),
             privacy_status=self.privacy_combo.currentData(),
             category=self.category_combo.currentData(),
@@ -364,67 +408,31 @@ class AccountTabWidget(QWidget):
                 if self.publish_at_checkbox.isChecked()
                 else None
             ),
-            playlist_id=self.playlist_combo.currentData(),
+            playlist_id=playlist_id,
+            playlist_title=self.playlist_combo.currentText() if playlist_id else '',
             made_for_kids=self.made_for_kids_combo.currentData()
         )
-        
-        # Подключаем обработчики сигналов
-        worker.signals.finished.connect(self._on_upload_finished)
-        worker.signals.error.connect(self._on_upload_error)
-        worker.signals.progress.connect(
-            lambda p: self.upload_btn.setText(f' Загрузка... {p}%')
-        )
-        
-        # Запускаем загрузку
-        self.thread_pool.start(worker)
     
-    def _on_upload_finished(self, video_id):
-        """Обработчик успешной загрузки"""
-        # Восстанавливаем состояние кнопки
-        self.upload_btn.setEnabled(True)
-        self.upload_btn.setText(' Загрузить видео')
-        
-        # Формируем сообщение об успехе
-        message = f'Видео успешно загружено! ID: {video_id}'
-        
-        # Добавляем информацию о плейлисте, если видео было добавлено в плейлист
-        selected_playlist_id = self.playlist_combo.currentData()
-        if selected_playlist_id:
-            selected_playlist_text = self.playlist_combo.currentText()
-            message += f'\n\nВидео добавлено в плейлист: {selected_playlist_text}'
-        
-        # Уведомляем пользователя
-        QMessageBox.information(self, 'Успех', message)
-        
-        # Добавляем запись в историю
+    def record_upload(self, item):
+        """Запись загруженного из очереди видео в историю аккаунта"""
         history_entry = {
             'account': self.account_name,
-            'video_id': video_id,
-            'title': self.title_edit.text(),
-            'path': self.video_path_edit.text(),
+            'video_id': item.video_id,
+            'title': item.title,
+            'path': item.video_path,
             'timestamp': QDateTime.currentDateTime().toString('yyyy-MM-dd HH:mm:ss')
         }
         
         # Добавляем информацию о плейлисте, если видео было добавлено в плейлист
-        selected_playlist_id = self.playlist_combo.currentData()
-        if selected_playlist_id:
-            selected_playlist_text = self.playlist_combo.currentText()
-            history_entry['playlist'] = selected_playlist_text
+        if item.playlist_id and not item.warning:
+            history_entry['playlist'] = item.playlist_title
         
         self.config_manager.add_history_entry(history_entry)
+        self.upload_status_label.setText(f'Загружено: {item.title} (ID: {item.video_id})')
         
-        # Очищаем форму и обновляем историю
-        self._clear_manual_upload_form()
-        self._populate_history_table()
-    
-    def _on_upload_error(self, error):
-        """Обработчик ошибки загрузки"""
-        # Восстанавливаем состояние кнопки
-        self.upload_btn.setEnabled(True)
-        self.upload_btn.setText(' Загрузить видео')
-        
-        # Показываем ошибку
-        QMessageBox.critical(self, 'Ошибка загрузки', str(error))
+        # Обновляем историю, если она открыта
+        if self.sub_tabs.currentWidget() == self.history_widget:
+            self._populate_history_table()
     
     def _clear_manual_upload_form(self):
         """Очистка формы ручной загрузки"""
@@ -440,7 +448,7 @@ class AccountTabWidget(QWidget):
     def _load_playlists(self):
         """Загрузка списка плейлистов пользователя"""
         # Получаем учетные данные для аутентификации
-        credentials = self.auth_manager.get_credentials(self.account_name)
+        credentials = self.client_pool.credentials(self.account_name)
         if not credentials:
             QMessageBox.critical(
                 self, 'Ошибка',
@@ -453,17 +461,24 @@ class AccountTabWidget(QWidget):
         self.refresh_playlists_btn.setText('Загрузка...')
         
         # Создаем и запускаем worker для загрузки плейлистов
-        worker = PlaylistWorker(credentials)
+        worker = PlaylistWorker(self.client_pool, self.playlist_cache, self.account_name)
         worker.signals.finished.connect(self._on_playlists_loaded)
         worker.signals.error.connect(self._on_playlists_error)
         
         self.thread_pool.start(worker)
     
-    def _on_playlists_loaded(self, playlists):
-        """Обработчик успешной загрузки плейлистов"""
-        # Восстанавливаем состояние кнопки
-        self.refresh_playlists_btn.setEnabled(True)
-        self.refresh_playlists_btn.setText('Обновить')
+    def _refresh_playlists_in_background(self):
+        """Тихое обновление плейлистов при открытии вкладки (без сообщений)"""
+        worker = PlaylistWorker(self.client_pool, self.playlist_cache, self.account_name)
+        worker.signals.finished.connect(self._on_background_playlists_loaded)
+        worker.signals.error.connect(
+            lambda error: logging.warning(f"Background playlist refresh for '{self.account_name}' failed: {error}")
+        )
+        self.thread_pool.start(worker)
+    
+    def _fill_playlist_combo(self, playlists):
+        """Заполнение списка плейлистов с сохранением выбранного"""
+        selected_id = self.playlist_combo.currentData()
         
         # Очищаем комбобокс (кроме первого элемента)
         while self.playlist_combo.count() > 1:
@@ -474,11 +489,27 @@ class AccountTabWidget(QWidget):
             display_text = f"{playlist['title']} ({playlist['item_count']} видео)"
             self.playlist_combo.addItem(display_text, playlist['id'])
         
+        if selected_id:
+            self.playlist_combo.setCurrentIndex(max(0, self.playlist_combo.findData(selected_id)))
+    
+    def _on_background_playlists_loaded(self, playlists, changed):
+        """Обработчик фонового обновления: список меняется, только если плейлисты изменились"""
+        if changed:
+            self._fill_playlist_combo(playlists)
+    
+    def _on_playlists_loaded(self, playlists, changed):
+        """Обработчик успешной загрузки плейлистов"""
+        # Восстанавливаем состояние кнопки
+        self.refresh_playlists_btn.setEnabled(True)
+        self.refresh_playlists_btn.setText('Обновить')
+        
+        self._fill_playlist_combo(playlists)
+        
         # Уведомляем пользователя
-        QMessageBox.information(
-            self, 'Плейлисты загружены',
-            f'Загружено {len(playlists)} плейлистов.'
-        )
+        message = f'Загружено {len(playlists)} плейлистов.'
+        if not changed:
+            message += ' Изменений нет.'
+        QMessageBox.information(self, 'Плейлисты загружены', message)
     
     def _on_playlists_error(self, error):
         """Обработчик ошибки загрузки плейлистов"""
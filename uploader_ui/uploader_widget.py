@@ -1,12 +1,41 @@
 import os
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QTabWidget, QMessageBox, QInputDialog, QFileDialog, 
-                             QLineEdit, QDialog, QFormLayout)
-from PyQt5.QtCore import Qt
+                             QLineEdit, QDialog, QFormLayout, QGroupBox, QLabel,
+                             QListWidget, QListWidgetItem, QSpinBox, QSplitter)
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
 import qtawesome as qta
 from uploader_core.config_manager import ConfigManager
 from uploader_core.auth_manager import AuthManager
+from uploader_core.client_pool import YouTubeClientPool
+from uploader_core.playlist_cache import PlaylistCache
+from uploader_core.upload_queue import (
+    UploadQueue, UPLOAD_PENDING, UPLOAD_RUNNING, UPLOAD_RETRYING,
+    UPLOAD_DONE, UPLOAD_FAILED, UPLOAD_CANCELLED
+)
 from uploader_ui.account_tab_widget import AccountTabWidget
+from utils.constants import (
+    UPLOAD_ACCOUNT_JOBS_DEFAULT, UPLOAD_CHUNK_MB, UPLOAD_CHUNK_MB_MAX, UPLOAD_JOBS_DEFAULT, UPLOAD_JOBS_MAX
+)
+
+
+class UploadSignals(QObject):
+    # UploadQueue callbacks come from its worker threads,
+    # signals deliver UploadItem to the UI thread
+    updated = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+# Upload status captions in the queue list
+UPLOAD_STATUS_TEXT = {
+    UPLOAD_PENDING: 'в очереди',
+    UPLOAD_RUNNING: 'загрузка',
+    UPLOAD_RETRYING: 'повтор',
+    UPLOAD_DONE: 'готово',
+    UPLOAD_FAILED: 'ошибка',
+    UPLOAD_CANCELLED: 'отменено',
+}
 
 
 class UploaderWidget(QWidget):
@@ -16,12 +45,18 @@ class UploaderWidget(QWidget):
         # Initialize managers
         self.config_manager = ConfigManager()
         self.auth_manager = AuthManager(self.config_manager)
+        # API clients and credentials are reused across uploads and playlist requests
+        self.client_pool = YouTubeClientPool(self.auth_manager.get_credentials)
+        # Playlists are shown from the cache and refreshed with ETags in the background
+        self.playlist_cache = PlaylistCache(self.config_manager.playlist_cache_path)
         
         # Initialize account tabs dictionary
         self.account_tabs = {}
+        self.upload_list_items = {}
         
         # Setup UI and load accounts
         self._setup_ui()
+        self._setup_upload_queue()
         self._load_accounts()
     
     def _setup_ui(self):
@@ -49,14 +84,146 @@ class UploaderWidget(QWidget):
         self.tabs.setTabsClosable(True)
         self.tabs.tabCloseRequested.connect(self._close_tab_handler)
         
-        # Add tabs widget to main layout
-        self.main_layout.addWidget(self.tabs)
+        # Upload queue panel under the account tabs
+        queue_group = QGroupBox('Очередь загрузки')
+        queue_layout = QVBoxLayout(queue_group)
+        
+        queue_controls_layout = QHBoxLayout()
+        queue_controls_layout.addWidget(QLabel('Одновременно всего:'))
+        self.upload_jobs_spin = QSpinBox()
+        self.upload_jobs_spin.setRange(1, UPLOAD_JOBS_MAX)
+        self.upload_jobs_spin.setValue(self.config_manager.get_setting('upload_jobs', UPLOAD_JOBS_DEFAULT))
+        self.upload_jobs_spin.setToolTip('Сколько видео загружается одновременно во все аккаунты')
+        queue_controls_layout.addWidget(self.upload_jobs_spin)
+        
+        queue_controls_layout.addWidget(QLabel('на аккаунт:'))
+        self.upload_account_jobs_spin = QSpinBox()
+        self.upload_account_jobs_spin.setRange(1, UPLOAD_JOBS_MAX)
+        self.upload_account_jobs_spin.setValue(
+            self.config_manager.get_setting('upload_account_jobs', UPLOAD_ACCOUNT_JOBS_DEFAULT)
+        )
+        self.upload_account_jobs_spin.setToolTip('Сколько видео одного аккаунта загружается одновременно')
+        queue_controls_layout.addWidget(self.upload_account_jobs_spin)
+        
+        queue_controls_layout.addWidget(QLabel('Часть, МБ:'))
+        self.upload_chunk_spin = QSpinBox()
+        self.upload_chunk_spin.setRange(1, UPLOAD_CHUNK_MB_MAX)
+        self.upload_chunk_spin.setValue(self.config_manager.get_setting('upload_chunk_mb', UPLOAD_CHUNK_MB))
+        self.upload_chunk_spin.setToolTip('Файл отправляется частями; после обрыва связи повторяется только '
+                                          'текущая часть')
+        queue_controls_layout.addWidget(self.upload_chunk_spin)
+        queue_controls_layout.addStretch()
+        
+        self.upload_retry_btn = QPushButton('Повторить ошибки')
+        self.upload_cancel_btn = QPushButton('Отменить все')
+        self.upload_clear_btn = QPushButton('Очистить завершенные')
+        queue_controls_layout.addWidget(self.upload_retry_btn)
+        queue_controls_layout.addWidget(self.upload_cancel_btn)
+        queue_controls_layout.addWidget(self.upload_clear_btn)
+        queue_layout.addLayout(queue_controls_layout)
+        
+        self.upload_list_widget = QListWidget()
+        queue_layout.addWidget(self.upload_list_widget)
+        
+        self.upload_summary_label = QLabel('')
+        queue_layout.addWidget(self.upload_summary_label)
+        
+        # Add tabs and queue to main layout
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.tabs)
+        splitter.addWidget(queue_group)
+        splitter.setSizes([600, 200])
+        self.main_layout.addWidget(splitter)
+    
+    def _setup_upload_queue(self):
+        """Create the upload queue shared by all account tabs"""
+        self.upload_signals = UploadSignals()
+        self.upload_signals.updated.connect(self._on_upload_updated)
+        self.upload_signals.finished.connect(self._on_upload_finished)
+        self.upload_signals.failed.connect(self._on_upload_failed)
+        
+        # Unfinished uploads from the previous run continue right away
+        self.upload_queue = UploadQueue(
+            self.config_manager.upload_queue_path,
+            self.client_pool,
+            jobs=self.upload_jobs_spin.value(),
+            account_jobs=self.upload_account_jobs_spin.value(),
+            chunk_mb=self.upload_chunk_spin.value(),
+            on_update=self.upload_signals.updated.emit,
+            on_finished=self.upload_signals.finished.emit,
+            on_failed=self.upload_signals.failed.emit
+        )
+        for item in self.upload_queue.items():
+            self._on_upload_updated(item)
+        
+        self.upload_jobs_spin.valueChanged.connect(self._on_upload_jobs_changed)
+        self.upload_account_jobs_spin.valueChanged.connect(self._on_upload_account_jobs_changed)
+        self.upload_chunk_spin.valueChanged.connect(self._on_upload_chunk_changed)
+        self.upload_retry_btn.clicked.connect(self.upload_queue.retry_failed)
+        self.upload_cancel_btn.clicked.connect(lambda: self.upload_queue.cancel())
+        self.upload_clear_btn.clicked.connect(self._clear_finished_uploads)
+    
+    def _on_upload_jobs_changed(self, value):
+        self.upload_queue.jobs = value
+        self.config_manager.set_setting('upload_jobs', value)
+    
+    def _on_upload_account_jobs_changed(self, value):
+        self.upload_queue.account_jobs = value
+        self.config_manager.set_setting('upload_account_jobs', value)
+    
+    def _on_upload_chunk_changed(self, value):
+        self.upload_queue.chunk_mb = value
+        self.config_manager.set_setting('upload_chunk_mb', value)
+    
+    def _on_upload_updated(self, item):
+        """Show item status and progress in the queue list"""
+        it = self.upload_list_items.get(item.id)
+        if it is None:
+            it = QListWidgetItem()
+            self.upload_list_items[item.id] = it
+            self.upload_list_widget.addItem(it)
+        
+        status = UPLOAD_STATUS_TEXT.get(item.status, item.status)
+        if item.status == UPLOAD_RUNNING:
+            status = f'{item.percent:.0f}%'
+        elif item.status == UPLOAD_RETRYING:
+            status = f'повтор {item.attempts}'
+        it.setText(f'[{status}] {item.account} · {item.title} ({os.path.basename(item.video_path)})')
+        it.setToolTip(item.error or item.warning)
+        self._update_upload_summary()
+    
+    def _on_upload_finished(self, item):
+        """Write uploaded video to the account history"""
+        self._on_upload_updated(item)
+        if item.account in self.account_tabs:
+            self.account_tabs[item.account].record_upload(item)
+    
+    def _on_upload_failed(self, item):
+        self._on_upload_updated(item)
+    
+    def _clear_finished_uploads(self):
+        for item in self.upload_queue.clear_finished():
+            it = self.upload_list_items.pop(item.id, None)
+            if it is not None:
+                self.upload_list_widget.takeItem(self.upload_list_widget.row(it))
+        self._update_upload_summary()
+    
+    def _update_upload_summary(self):
+        counts = {}
+        for item in self.upload_queue.items():
+            counts[item.status] = counts.get(item.status, 0) + 1
+        self.upload_summary_label.setText(' · '.join(
+            f'{UPLOAD_STATUS_TEXT[status]}: {counts[status]}' for status in UPLOAD_STATUS_TEXT if counts.get(status)
+        ))
     
     def _load_accounts(self):
         """Load existing accounts from configuration"""
         accounts = self.config_manager.get_accounts()
         for account_name in accounts.keys():
             self._create_account_tab(account_name)
+        
+        # Load tokens and build clients in the background before the first upload
+        self.client_pool.prewarm(accounts.keys())
     
     def _add_account_handler(self):
         """Handle adding a new account"""
@@ -95,11 +262,12 @@ class UploaderWidget(QWidget):
             os.listdir(client_secrets_path)[0]
         )
         
-        # Authenticate the account
+        # Authenticate the account; a cached client of the same name is outdated now
         self.auth_manager.authenticate(account_name, secrets_file)
+        self.client_pool.invalidate(account_name)
         
         # Check if authentication was successful
-        if self.auth_manager.get_credentials(account_name):
+        if self.client_pool.credentials(account_name):
             QMessageBox.information(
                 self,
                 'Успех',
@@ -123,7 +291,10 @@ class UploaderWidget(QWidget):
         tab_widget = AccountTabWidget(
             account_name,
             self.config_manager,
-            self.auth_manager
+            self.auth_manager,
+            self.upload_queue,
+            self.client_pool,
+            self.playlist_cache
         )
         
         # Create icon for tab
@@ -152,11 +323,16 @@ class UploaderWidget(QWidget):
         )
         
         if reply == QMessageBox.Yes:
+            # Stop queued uploads of the account
+            self.upload_queue.cancel(account=account_name)
+            
             # Remove account from configuration
             self.config_manager.remove_account(account_name)
             
             # Remove credentials
             self.auth_manager.remove_credentials(account_name)
+            self.client_pool.invalidate(account_name)
+            self.playlist_cache.forget(account_name)
             
             # Remove tab
             self.tabs.removeTab(index)
@@ -196,4 +372,27 @@ class UploaderWidget(QWidget):
                 self,
                 'Ошибка',
                 f"Не найден виджет для аккаунта '{account_name}'."
-            )
\ No newline at end of file
+            )
+    
+    def receive_videos_for_upload(self, video_paths, account_name):
+        """Queue a batch of processed videos for upload to specific account"""
+        if account_name not in self.account_tabs:
+            QMessageBox.warning(
+                self,
+                'Ошибка',
+                f"Не найден виджет для аккаунта '{account_name}'."
+            )
+            return
+        
+        # Metadata of the batch comes from the account upload form
+        account_widget = self.account_tabs[account_name]
+        self.tabs.setCurrentWidget(account_widget)
+        account_widget.sub_tabs.setCurrentIndex(0)
+        added = account_widget.queue_videos(video_paths)
+        
+        QMessageBox.information(
+            self,
+            'Видео в очереди',
+            f"В очередь загрузки аккаунта '{account_name}' добавлено видео: {len(added)} из {len(video_paths)}.\n"
+            'Описание, теги, приватность и плейлист взяты из формы загрузки аккаунта.'
+        )
@@ -1,8 +1,8 @@
 APP_NAME = "ReelsMaker Pro [mod by llimonix]"
 APP_VERSION = "1.1.1"
 LOG_FILE = "app.log"
-FFMPEG_EXE_PATH = "bin/ffmpeg.exe"
-YTDLP_EXE_PATH = "bin/yt-dlp.exe"
+# Папка с ffmpeg, ffprobe и yt-dlp рядом с приложением (имена файлов зависят от ОС)
+TOOLS_BIN_DIR = "bin"
 
 VIDEO_EXTENSIONS = [
     ".mp4", ".mov", ".avi", ".mkv", ".flv", ".wmv"
@@ -50,6 +50,16 @@ REELS_HEIGHT = 1920
 REELS_FORMAT_NAME = f"Reels/TikTok ({REELS_WIDTH}x{REELS_HEIGHT})"
 OUTPUT_FORMATS = ["Оригинальный", REELS_FORMAT_NAME]
 
+# Режимы размытого фона для Reels
+BLUR_MODE_QUALITY = "quality"
+BLUR_MODE_FAST = "fast"
+BLUR_MODES = {
+    "Качество (полный размер)": BLUR_MODE_QUALITY,
+    "Быстро (уменьшенный фон)": BLUR_MODE_FAST,
+}
+BLUR_SIGMA = 25
+BLUR_FAST_DOWNSCALE = 8
+
 CODECS = {
     "CPU (H.264 | libx264)": "libx264",
     "NVIDIA (H.264 | h264_nvenc)": "h264_nvenc",
@@ -60,6 +70,54 @@ CODECS = {
     "AMD (H.265 | hevc_amf)": "hevc_amf",
 }
 
+# Профили кодирования
+ENCODE_PROFILE_FASTEST = "fastest"
+ENCODE_PROFILE_BALANCED = "balanced"
+ENCODE_PROFILE_SMALLEST = "smallest"
+ENCODE_PROFILE_TARGET_SIZE = "target_size"
+ENCODE_PROFILES = {
+    "Сбалансированный": ENCODE_PROFILE_BALANCED,
+    "Максимальная скорость": ENCODE_PROFILE_FASTEST,
+    "Минимальный размер": ENCODE_PROFILE_SMALLEST,
+    "Целевой размер файла": ENCODE_PROFILE_TARGET_SIZE,
+}
+DEFAULT_TARGET_SIZE_MB = 50
+# При стольких ожидающих файлах медленные пресеты x264 заменяются на AUTO_FASTER_PRESET
+AUTO_FASTER_BACKLOG = 4
+AUTO_FASTER_PRESET = "faster"
+
+# Очередь скачивания yt-dlp
+DOWNLOAD_JOBS_DEFAULT = 3
+DOWNLOAD_JOBS_MAX = 8
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF_SECONDS = 2
+# Предельный размер кеша скачанных видео
+DOWNLOAD_CACHE_MAX_MB = 5 * 1024
+
+# Очередь загрузки на YouTube: всего одновременно и на один аккаунт
+UPLOAD_JOBS_DEFAULT = 4
+UPLOAD_JOBS_MAX = 16
+UPLOAD_ACCOUNT_JOBS_DEFAULT = 2
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF_SECONDS = 5
+# Файл отправляется частями этого размера (кратен 256 КБ, как требует API);
+# после временной ошибки отправка части повторяется с того же байта
+UPLOAD_CHUNK_MB = 8
+UPLOAD_CHUNK_MB_MAX = 256
+UPLOAD_CHUNK_RETRIES = 5
+UPLOAD_CHUNK_BACKOFF_SECONDS = 1
+UPLOAD_BACKOFF_MAX_SECONDS = 60
+# Сколько свободных клиентов YouTube API (с открытыми соединениями) держать на аккаунт
+YOUTUBE_CLIENTS_IDLE_MAX = UPLOAD_JOBS_MAX
+
+# Предельное число одновременных процессов каждого инструмента (utils/process_utils.py);
+# для FFmpeg предел считается от числа ядер
+PROCESS_LIMIT_FFPROBE = 8
+PROCESS_LIMIT_YTDLP = DOWNLOAD_JOBS_MAX + 2
+# Таймауты коротких вызовов: анализ файла ffprobe и получение информации yt-dlp, секунды
+FFPROBE_TIMEOUT = 120
+YTDLP_INFO_TIMEOUT = 180
+
 WHISPER_MODELS = ["tiny", "base", "small", "medium", "large"]
 
 WHISPER_LANGUAGES = [
@@ -0,0 +1,672 @@
+"""
+Download queue for yt-dlp: parallel downloads with retries and deduplication.
+Очередь скачивания yt-dlp: параллельные загрузки, повторы и дедупликация.
+
+DownloadManager принимает ссылки на видео и плейлисты, держит не больше
+jobs одновременных процессов yt-dlp и сообщает о каждом элементе через
+обратные вызовы: прогресс, успешное завершение, ошибка. Готовый файл
+отдается сразу, не дожидаясь остальных загрузок. Обратные вызовы
+приходят из рабочих потоков; UI пересылает их в свой поток сигналами Qt.
+
+DownloadCache хранит скачанные видео между сеансами под ключом
+"экстрактор:ID", поэтому повторная ссылка не скачивается заново.
+
+open_stream готовит обработку без промежуточного файла: yt-dlp пишет
+видео в stdout, FFmpeg читает его как вход pipe:0. Если формат так
+не отдать, download_now скачивает файл синхронно через ту же очередь.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from utils.constants import (
+    DOWNLOAD_BACKOFF_SECONDS, DOWNLOAD_CACHE_MAX_MB, DOWNLOAD_JOBS_DEFAULT, DOWNLOAD_RETRIES
+)
+from utils.ffmpeg_utils import PipedInput
+from utils.path_utils import get_cache_directory
+from utils.youtube_utils import (
+    DEFAULT_FORMAT_SELECTOR, DownloadCancelledError, download_video, get_playlist_urls, get_video_info,
+    select_download_format, select_stream_format, stream_command
+)
+
+
+# Состояния элемента очереди
+DOWNLOAD_PENDING = 'pending'
+DOWNLOAD_RUNNING = 'running'
+DOWNLOAD_RETRYING = 'retrying'
+DOWNLOAD_DONE = 'done'
+DOWNLOAD_FAILED = 'failed'
+DOWNLOAD_CANCELLED = 'cancelled'
+
+_YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def video_key(url: str) -> str:
+    """
+    Ключ для поиска повторов: ID для ссылок YouTube, иначе нормализованный URL.
+
+    watch?v=ID, youtu.be/ID, /shorts/ID и /embed/ID одного видео дают один ключ.
+    """
+    url = url.strip()
+    parsed = urlparse(url if '://' in url else f'https://{url}')
+    host = parsed.netloc.lower().split(':')[0]
+    if host.startswith('www.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+
+    video_id = None
+    if host == 'youtu.be':
+        video_id = parsed.path.strip('/').split('/')[0]
+    elif host.endswith('youtube.com'):
+        video_id = parse_qs(parsed.query).get('v', [None])[0]
+        if not video_id:
+            parts = parsed.path.strip('/').split('/')
+            if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live'):
+                video_id = parts[1]
+    if video_id and _YOUTUBE_ID.match(video_id):
+        return f'youtube:{video_id}'
+
+    return f'{host}{parsed.path.rstrip("/")}' + (f'?{parsed.query}' if parsed.query else '')
+
+
+def _section_suffix(section: Optional[Tuple[float, float]]) -> str:
+    """Часть ключа для скачанного отрезка: отрезок и целое видео - разные записи."""
+    return f'@{section[0]:g}-{section[1]:g}' if section else ''
+
+
+def is_video_url(value: str) -> bool:
+    """Элемент очереди обработки - ссылка, а не путь к файлу."""
+    return value.strip().lower().startswith(('http://', 'https://'))
+
+
+def source_name(url: str) -> str:
+    """Имя для файлов, полученных по ссылке: youtube_<ID> или очищенный URL."""
+    return re.sub(r'[^\w.-]', '_', video_key(url))[:80]
+
+
+def is_playlist_url(url: str) -> bool:
+    """Ссылка на плейлист или канал, а не на одно видео."""
+    parsed = urlparse(url.strip())
+    query = parse_qs(parsed.query)
+    if 'v' in query:
+        return False
+    path = parsed.path.rstrip('/')
+    return 'list' in query or path.endswith('/playlist') or path.endswith('/videos') or '/@' in path
+
+
+@dataclass
+class DownloadItem:
+    """Один элемент очереди скачивания."""
+    url: str
+    key: str
+    status: str = DOWNLOAD_PENDING
+    percent: float = 0.0
+    attempts: int = 0
+    path: str = ''
+    error: str = ''
+    cached: bool = False  # Файл взят из DownloadCache без скачивания
+    fit_box: Optional[Tuple[int, int]] = None  # Рамка кадра для выбора разрешения
+    section: Optional[Tuple[float, float]] = None  # Отрезок (начало, конец) в секундах
+
+
+def _read_metadata(path: str) -> Dict:
+    """Последняя JSON-строка файла метаданных yt-dlp или пустой словарь."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f.read().splitlines() if line.strip()]
+        return json.loads(lines[-1]) if lines else {}
+    except (OSError, ValueError):
+        return {}
+
+
+class DownloadCache:
+    """
+    Постоянный кеш скачанных видео с ограничением размера (LRU).
+
+    Запись хранится под ключом "экстрактор:ID" (например, youtube:dQw4w9WgXcQ,
+    для отрезка - с суффиксом @начало-конец) вместе с метаданными формата
+    из yt-dlp. Ссылки, ключ которых нельзя
+    вычислить без yt-dlp, запоминаются как псевдонимы записи. Индекс
+    (index.json) лежит рядом с файлами и переживает перезапуск. При
+    превышении max_bytes удаляются давно не использованные записи, кроме
+    выданных в текущем сеансе: их файлы могут стоять в очереди обработки.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DOWNLOAD_CACHE_MAX_MB * 1024 * 1024):
+        """
+        Args:
+            directory: Папка кеша (по умолчанию cache/downloads приложения)
+            max_bytes: Предельный размер кеша в байтах
+        """
+        self.directory = directory or get_cache_directory('downloads')
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._session_keys = set()
+        self._entries, self._aliases = self._load()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _load(self) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """Читает индекс; записи без файла на диске отбрасываются."""
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        entries = {key: entry for key, entry in data.get('entries', {}).items()
+                   if os.path.isfile(os.path.join(self.directory, entry.get('file', '')))}
+        aliases = {alias: key for alias, key in data.get('aliases', {}).items() if key in entries}
+        return entries, aliases
+
+    def _save(self) -> None:
+        """Атомарно записывает индекс (вызывается под self._lock)."""
+        temp_path = f'{self._index_path()}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self._entries, 'aliases': self._aliases}, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self._index_path())
+        except OSError as e:
+            logging.warning(f'Failed to save download cache index: {e}')
+
+    def total_size(self) -> int:
+        """Суммарный размер файлов кеша в байтах."""
+        with self._lock:
+            return sum(entry.get('size', 0) for entry in self._entries.values())
+
+    def lookup(self, url: str, section: Optional[Tuple[float, float]] = None,
+               fit_box: Optional[Tuple[int, int]] = None) -> Optional[Dict]:
+        """
+        Ищет скачанное видео по ссылке.
+
+        Args:
+            url: Ссылка на видео
+            section: Отрезок (начало, конец) или None для целого видео
+            fit_box: Рамка кадра; запись меньшего разрешения не подходит
+
+        Returns:
+            Копия записи с полным путем в 'path' или None
+        """
+        url_key = video_key(url) + _section_suffix(section)
+        with self._lock:
+            key = url_key if url_key in self._entries else self._aliases.get(url_key)
+            entry = self._entries.get(key) if key else None
+            if entry is None:
+                return None
+            width, height = entry.get('width'), entry.get('height')
+            if fit_box and width and height and width < fit_box[0] and height < fit_box[1]:
+                return None
+            path = os.path.join(self.directory, entry['file'])
+            if not os.path.isfile(path):
+                self._drop(key)
+                self._save()
+                return None
+            entry['last_used'] = time.time()
+            self._session_keys.add(key)
+            self._save()
+            return dict(entry, key=key, path=path)
+
+    def new_download_path(self) -> str:
+        """Временный путь для скачивания внутри папки кеша (переименовывается в store)."""
+        return os.path.join(self.directory, f'part_{uuid.uuid4().hex}.mp4')
+
+    def store(self, url: str, file_path: str, metadata: Optional[Dict] = None,
+              section: Optional[Tuple[float, float]] = None) -> str:
+        """
+        Переносит скачанный файл в кеш и сохраняет запись.
+
+        Args:
+            url: Ссылка, по которой скачан файл
+            file_path: Скачанный файл (обычно из new_download_path)
+            metadata: JSON от yt-dlp (extractor_key, id, format_id, width, height, ...)
+            section: Скачанный отрезок или None для целого видео
+
+        Returns:
+            Путь к файлу в кеше
+        """
+        metadata = metadata or {}
+        extractor = str(metadata.get('extractor_key') or '').lower()
+        video_id = metadata.get('id')
+        suffix = _section_suffix(section)
+        key = (f'{extractor}:{video_id}' if extractor and video_id else video_key(url)) + suffix
+        file_name = re.sub(r'[^\w.-]', '_', key) + os.path.splitext(file_path)[1]
+        cached_path = os.path.join(self.directory, file_name)
+        os.replace(file_path, cached_path)
+
+        with self._lock:
+            self._entries[key] = {
+                'file': file_name,
+                'url': url,
+                'size': os.path.getsize(cached_path),
+                'last_used': time.time(),
+                'extractor': extractor,
+                'id': video_id,
+                'format_id': metadata.get('format_id'),
+                'width': metadata.get('width'),
+                'height': metadata.get('height'),
+                'duration': metadata.get('duration'),
+                'title': metadata.get('title'),
+                'section': list(section) if section else None,
+            }
+            url_key = video_key(url) + suffix
+            if url_key != key:
+                self._aliases[url_key] = key
+            self._session_keys.add(key)
+            self._evict()
+            self._save()
+        return cached_path
+
+    def _drop(self, key: str) -> None:
+        self._entries.pop(key, None)
+        for alias in [alias for alias, target in self._aliases.items() if target == key]:
+            del self._aliases[alias]
+
+    def _evict(self) -> None:
+        """Удаляет самые старые записи, пока кеш больше max_bytes (под self._lock)."""
+        total = sum(entry.get('size', 0) for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k].get('last_used', 0)):
+            if total <= self.max_bytes:
+                break
+            if key in self._session_keys:
+                continue
+            entry = self._entries[key]
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError as e:
+                logging.warning(f"Failed to evict cached download '{entry['file']}': {e}")
+                continue
+            total -= entry.get('size', 0)
+            self._drop(key)
+            logging.info(f"Evicted cached download {key} ({entry.get('size', 0) / (1024 * 1024):.1f} MB)")
+
+
+class DownloadManager:
+    """
+    Очередь параллельного скачивания.
+
+    Ссылки на видео, которые уже в очереди, пропускаются; для уже
+    скачанного видео сразу повторяется on_finished. С кешем (DownloadCache)
+    видео из прошлых сеансов отдается без скачивания. Неудачная загрузка
+    повторяется до retries раз с экспоненциальной задержкой; отсутствие
+    yt-dlp и отмена не повторяются.
+    """
+
+    def __init__(self, out_dir: str, jobs: int = DOWNLOAD_JOBS_DEFAULT,
+                 retries: int = DOWNLOAD_RETRIES, backoff: float = DOWNLOAD_BACKOFF_SECONDS,
+                 on_update: Optional[Callable[[DownloadItem], None]] = None,
+                 on_finished: Optional[Callable[[DownloadItem], None]] = None,
+                 on_failed: Optional[Callable[[DownloadItem], None]] = None,
+                 download_func: Callable = download_video,
+                 playlist_func: Callable[[str], List[str]] = get_playlist_urls,
+                 info_func: Optional[Callable[[str], Dict]] = get_video_info,
+                 cache: Optional[DownloadCache] = None):
+        """
+        Args:
+            out_dir: Папка для скачанных файлов (без кеша)
+            jobs: Сколько загрузок идут одновременно
+            retries: Сколько раз повторять неудачную загрузку
+            backoff: Задержка перед первым повтором, секунды (дальше удваивается)
+            on_update: Вызывается при изменении состояния или прогресса элемента
+            on_finished: Вызывается, когда файл элемента готов
+            on_failed: Вызывается, когда элемент окончательно не скачан
+            download_func: Функция скачивания (url, out_path, progress_callback, cancel_event,
+                metadata_path, format_selector, section, info_path), по умолчанию yt-dlp
+            playlist_func: Функция, разворачивающая плейлист в список ссылок
+            info_func: Функция, возвращающая информацию о видео с форматами (None - без нее)
+            cache: Постоянный кеш скачанных видео
+        """
+        self.out_dir = out_dir
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.on_update = on_update
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self._download = download_func
+        self._expand_playlist = playlist_func
+        self._get_info = info_func
+        self.cache = cache
+        self._jobs = max(1, jobs)
+        self._items: Dict[str, DownloadItem] = {}
+        self._pending: Deque[DownloadItem] = deque()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    @property
+    def jobs(self) -> int:
+        return self._jobs
+
+    @jobs.setter
+    def jobs(self, value: int) -> None:
+        """Меняет число одновременных загрузок; уже идущие не прерываются."""
+        with self._lock:
+            self._jobs = max(1, value)
+        self._pump()
+
+    def items(self) -> List[DownloadItem]:
+        """Снимок очереди в порядке добавления."""
+        with self._lock:
+            return list(self._items.values())
+
+    def add(self, urls: Iterable[str], fit_box: Optional[Tuple[int, int]] = None,
+            section: Optional[Tuple[float, float]] = None) -> List[DownloadItem]:
+        """
+        Добавляет ссылки в очередь.
+
+        Плейлисты разворачиваются в фоне, их видео добавляются по мере
+        получения списка.
+
+        Args:
+            urls: Ссылки на видео или плейлисты
+            fit_box: Рамка итогового кадра (filter_graph.source_fit_box): скачивается
+                самый маленький формат, который не придется увеличивать; None - лучший
+            section: Скачать только отрезок (начало, конец) в секундах
+
+        Returns:
+            Новые элементы очереди (повторы и плейлисты не входят)
+        """
+        added = []
+        for url in urls:
+            url = url.strip()
+            if not url:
+                continue
+            if is_playlist_url(url):
+                threading.Thread(target=self._add_playlist, args=(url, fit_box, section), daemon=True).start()
+                continue
+            item = self._enqueue(url, fit_box, section)
+            if item is not None:
+                added.append(item)
+        self._pump()
+        return added
+
+    def cancel(self) -> None:
+        """Отменяет ожидающие и идущие загрузки; ссылки, добавленные позже, скачиваются."""
+        with self._lock:
+            self._cancel_event.set()
+            self._cancel_event = threading.Event()
+            cancelled = list(self._pending)
+            self._pending.clear()
+            for item in cancelled:
+                item.status = DOWNLOAD_CANCELLED
+        for item in cancelled:
+            self._notify(self.on_update, item)
+        self._pump()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждет, пока очередь опустеет. False, если вышел таймаут."""
+        return self._idle.wait(timeout)
+
+    def _enqueue(self, url: str, fit_box: Optional[Tuple[int, int]] = None,
+                 section: Optional[Tuple[float, float]] = None) -> Optional[DownloadItem]:
+        key = video_key(url) + _section_suffix(section)
+        with self._lock:
+            existing = self._items.get(key)
+            if existing is not None and existing.status in (DOWNLOAD_PENDING, DOWNLOAD_RUNNING, DOWNLOAD_RETRYING):
+                logging.info(f"Skipping duplicate download '{url}' ({key})")
+                return None
+            already_done = (existing is not None and existing.status == DOWNLOAD_DONE
+                            and os.path.exists(existing.path))
+            if not already_done:
+                item = DownloadItem(url=url, key=key, fit_box=fit_box, section=section)
+                # Повторно добавленный элемент встает в конец очереди
+                self._items.pop(key, None)
+                self._items[key] = item
+                self._pending.append(item)
+                self._idle.clear()
+
+        if already_done:
+            logging.info(f"'{url}' is already downloaded: {existing.path}")
+            self._notify(self.on_finished, existing)
+            return None
+        self._notify(self.on_update, item)
+        return item
+
+    def _add_playlist(self, url: str, fit_box: Optional[Tuple[int, int]],
+                      section: Optional[Tuple[float, float]]) -> None:
+        try:
+            entries = self._expand_playlist(url)
+        except Exception as e:
+            item = DownloadItem(url=url, key=video_key(url), status=DOWNLOAD_FAILED, error=str(e))
+            logging.error(f"Failed to expand playlist '{url}': {e}")
+            self._notify(self.on_failed, item)
+            return
+        for entry in entries:
+            self._enqueue(entry, fit_box, section)
+        self._pump()
+
+    def _pump(self) -> None:
+        """Запускает ожидающие элементы, пока есть свободные слоты."""
+        with self._lock:
+            to_start = []
+            while self._pending and self._active < self._jobs:
+                to_start.append(self._pending.popleft())
+                self._active += 1
+            if not self._pending and not self._active:
+                self._idle.set()
+        for item in to_start:
+            threading.Thread(target=self._run_item, args=(item,), daemon=True).start()
+
+    def _run_item(self, item: DownloadItem) -> None:
+        try:
+            self._download_with_retries(item)
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._pump()
+
+    def _download_with_retries(self, item: DownloadItem) -> None:
+        with self._lock:
+            cancel_event = self._cancel_event
+
+        if self.cache is not None:
+            entry = self.cache.lookup(item.url, item.section, item.fit_box)
+            if entry is not None:
+                logging.info(f"'{item.url}' found in download cache: {entry['path']}")
+                item.status = DOWNLOAD_DONE
+                item.path = entry['path']
+                item.percent = 100.0
+                item.cached = True
+                self._notify(self.on_update, item)
+                self._notify(self.on_finished, item)
+                return
+            out_path = self.cache.new_download_path()
+        else:
+            out_path = os.path.join(self.out_dir, f'yt_{uuid.uuid4()}.mp4')
+        stem = os.path.splitext(out_path)[0]
+        metadata_path = f'{stem}.info.json'
+        format_selector, info_path = self._plan_format(item, f'{stem}.source.json')
+
+        def on_progress(percent: float) -> None:
+            item.percent = percent
+            self._notify(self.on_update, item)
+
+        while True:
+            item.attempts += 1
+            item.status = DOWNLOAD_RUNNING
+            item.percent = 0.0
+            self._notify(self.on_update, item)
+            try:
+                self._download(item.url, out_path, progress_callback=on_progress,
+                               cancel_event=cancel_event, metadata_path=metadata_path,
+                               format_selector=format_selector, section=item.section, info_path=info_path)
+                if not os.path.exists(out_path):
+                    raise IOError(f'Файл не был создан после скачивания: {out_path}')
+                if self.cache is not None:
+                    out_path = self.cache.store(item.url, out_path, _read_metadata(metadata_path), item.section)
+                for service_path in (metadata_path, info_path):
+                    if service_path and os.path.exists(service_path):
+                        os.remove(service_path)
+                item.status = DOWNLOAD_DONE
+                item.path = out_path
+                item.percent = 100.0
+                self._notify(self.on_update, item)
+                self._notify(self.on_finished, item)
+                return
+            except (DownloadCancelledError, FileNotFoundError) as e:
+                final_status = DOWNLOAD_CANCELLED if isinstance(e, DownloadCancelledError) else DOWNLOAD_FAILED
+                item.error = str(e)
+            except Exception as e:
+                item.error = str(e)
+                if item.attempts <= self.retries and not cancel_event.is_set():
+                    delay = self.backoff * 2 ** (item.attempts - 1) * random.uniform(0.8, 1.2)
+                    logging.warning(f"Download of '{item.url}' failed (attempt {item.attempts}), "
+                                    f"retrying in {delay:.1f}s: {e}")
+                    item.status = DOWNLOAD_RETRYING
+                    self._notify(self.on_update, item)
+                    if not cancel_event.wait(delay):
+                        continue
+                    item.error = f"Download of '{item.url}' was cancelled."
+                    final_status = DOWNLOAD_CANCELLED
+                else:
+                    final_status = DOWNLOAD_FAILED
+
+            self._remove_partial_files(out_path)
+            item.status = final_status
+            self._notify(self.on_update, item)
+            if final_status == DOWNLOAD_FAILED:
+                logging.error(f"Download of '{item.url}' failed: {item.error}")
+                self._notify(self.on_failed, item)
+            return
+
+    def _plan_format(self, item: DownloadItem, info_path: str) -> Tuple[str, Optional[str]]:
+        """
+        Выбирает формат по информации о видео и сохраняет ее для yt-dlp.
+
+        Returns:
+            (селектор формата, путь к JSON для --load-info-json или None)
+        """
+        if self._get_info is None:
+            return DEFAULT_FORMAT_SELECTOR, None
+        try:
+            info = self._get_info(item.url)
+        except Exception as e:
+            logging.warning(f"Could not get formats for '{item.url}', using the default format: {e}")
+            return DEFAULT_FORMAT_SELECTOR, None
+
+        format_selector = select_download_format(info, item.fit_box)
+        try:
+            with open(info_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f)
+        except OSError as e:
+            logging.warning(f"Could not save video info for '{item.url}': {e}")
+            info_path = None
+        return format_selector, info_path
+
+    @staticmethod
+    def _remove_partial_files(out_path: str) -> None:
+        """Удаляет недокачанные части (.part, .ytdl, отдельные потоки)."""
+        directory = os.path.dirname(out_path) or '.'
+        stem = os.path.splitext(os.path.basename(out_path))[0]
+        try:
+            for name in os.listdir(directory):
+                if name.startswith(stem):
+                    os.remove(os.path.join(directory, name))
+        except OSError as e:
+            logging.warning(f'Failed to remove partial download {out_path}: {e}')
+
+    @staticmethod
+    def _notify(callback: Optional[Callable[[DownloadItem], None]], item: DownloadItem) -> None:
+        if callback is None:
+            return
+        try:
+            callback(item)
+        except Exception as e:
+            logging.error(f'Download callback failed: {e}')
+
+
+def open_stream(url: str, fit_box: Optional[Tuple[int, int]] = None,
+                info_func: Callable[[str], Dict] = get_video_info) -> Optional[PipedInput]:
+    """
+    Готовит вход FFmpeg из канала yt-dlp вместо скачанного файла.
+
+    Информация о видео берется из кеша get_video_info и сохраняется в JSON
+    для --load-info-json, поэтому yt-dlp не извлекает ее повторно.
+
+    Args:
+        url: Ссылка на видео
+        fit_box: Рамка итогового кадра (filter_graph.source_fit_box)
+        info_func: Функция, возвращающая информацию о видео с форматами
+
+    Returns:
+        PipedInput или None, если подходящего формата для канала нет
+        (например, есть только отдельные потоки видео и аудио)
+
+    Raises:
+        FileNotFoundError: Если yt-dlp не найден
+        RuntimeError: Если не удалось получить информацию о видео
+    """
+    info = info_func(url)
+    chosen = select_stream_format(info, fit_box)
+    if chosen is None:
+        logging.info(f"'{url}' has no single-file format for streaming, it will be downloaded")
+        return None
+
+    name = source_name(url)
+    info_path = os.path.join(get_cache_directory('stream_info'), f'{name}.json')
+    try:
+        os.makedirs(os.path.dirname(info_path), exist_ok=True)
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+    except OSError as e:
+        logging.warning(f"Could not save video info for '{url}', yt-dlp will extract it again: {e}")
+        info_path = None
+
+    logging.info(f"Streaming '{url}' as format {chosen['format_id']} ({chosen['width']}x{chosen['height']})")
+    return PipedInput(
+        command=stream_command(url, chosen['format_id'], info_path),
+        name=name,
+        duration=float(info.get('duration') or 0),
+        width=int(chosen['width']),
+        height=int(chosen['height']),
+        sample_rate=int(chosen.get('asr') or 0),
+    )
+
+
+def download_now(url: str, out_dir: str, fit_box: Optional[Tuple[int, int]] = None,
+                 cache: Optional[DownloadCache] = None,
+                 cancel_event: Optional[threading.Event] = None) -> str:
+    """
+    Скачивает одно видео и ждет результата (с кешем и повторами DownloadManager).
+
+    Args:
+        url: Ссылка на видео
+        out_dir: Папка для файла, если кеш не задан
+        fit_box: Рамка итогового кадра для выбора разрешения
+        cache: Постоянный кеш скачанных видео
+        cancel_event: Событие отмены
+
+    Returns:
+        Путь к скачанному файлу
+
+    Raises:
+        DownloadCancelledError: Если скачивание отменено
+        RuntimeError: Если видео не удалось скачать
+    """
+    manager = DownloadManager(out_dir, jobs=1, cache=cache)
+    items = manager.add([url], fit_box=fit_box)
+    if not items:
+        raise RuntimeError(f"'{url}' is not a video link")
+    item = items[0]
+    while not manager.wait(0.5):
+        if cancel_event is not None and cancel_event.is_set():
+            manager.cancel()
+
+    if item.status == DOWNLOAD_DONE:
+        return item.path
+    if item.status == DOWNLOAD_CANCELLED:
+        raise DownloadCancelledError(f"Download of '{url}' was cancelled.")
+    raise RuntimeError(item.error or f"Download of '{url}' failed")
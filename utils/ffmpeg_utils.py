@@ -6,109 +6,248 @@ FFmpeg utilities module for video processing.
 import os
 import subprocess
 import random
-import platform
 import shlex
 import shutil
 import re
 import logging
+import hashlib
+import math
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from dataclasses import dataclass, replace
+from fractions import Fraction
 from typing import List, Optional, Tuple, Dict, Callable
 
-# Импорт констант (предполагаемые значения)
-try:
-    from utils.constants import (
-        FFMPEG_EXE_PATH, 
-        FILTERS, 
-        OVERLAY_POSITIONS, 
-        REELS_WIDTH, 
-        REELS_HEIGHT, 
-        REELS_FORMAT_NAME
-    )
-except ImportError:
-    # Fallback значения если модуль constants недоступен
-    FFMPEG_EXE_PATH = "bin/ffmpeg.exe"
-    FILTERS = {}
-    OVERLAY_POSITIONS = {}
-    REELS_WIDTH = 1080
-    REELS_HEIGHT = 1920
-    REELS_FORMAT_NAME = f"Reels/TikTok ({REELS_WIDTH}x{REELS_HEIGHT})"
+from utils.constants import (
+    REELS_FORMAT_NAME,
+    BLUR_MODE_QUALITY,
+    ENCODE_PROFILE_FASTEST,
+    ENCODE_PROFILE_BALANCED,
+    ENCODE_PROFILE_SMALLEST,
+    ENCODE_PROFILE_TARGET_SIZE,
+    DEFAULT_TARGET_SIZE_MB,
+    FFPROBE_TIMEOUT
+)
+from utils.path_utils import get_cache_directory
+from utils.resource_utils import ChildMonitor, bind_active_stages
+from utils.scheduling_utils import ThreadPlan, set_process_affinity, split_thread_plan
+from utils.segment_utils import Segment, plan_segments, shift_srt
+from utils.process_utils import (
+    TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP, ManagedProcess, ProcessCancelledError, open_process, run_process
+)
+from utils.progress_utils import ProgressEvent, parse_progress_block
+from utils.tool_utils import find_tool, has_encoder
+from utils.filter_graph import (
+    GraphSpec,
+    is_video_passthrough,
+    is_audio_passthrough,
+    expected_output_duration,
+    resolve_filter_templates,
+    compile_filter_graph,
+    VIDEO_OUTPUT_LABEL,
+    AUDIO_OUTPUT_LABEL
+)
 
 
-from utils.path_utils import get_ffmpeg_path
+# Сколько последних строк лога FFmpeg хранить для сообщения об ошибке
+FFMPEG_LOG_TAIL_LINES = 200
 
+# Размер блока при чтении вывода FFmpeg
+FFMPEG_READ_CHUNK_SIZE = 64 * 1024
 
 
-def find_executable(base_path: str, exe_name: str) -> Optional[str]:
-    """
-    Поиск исполняемого файла по указанному пути или в системном PATH.
+# Сторож FFmpeg: сколько секунд out_time может не расти и во сколько раз
+# время работы может превысить ожидаемую длительность выхода
+FFMPEG_STALL_TIMEOUT = 120
+FFMPEG_TIME_LIMIT_FACTOR = 20
+FFMPEG_MIN_TIME_LIMIT = 600
+FFMPEG_WATCHDOG_INTERVAL = 0.5
+
+
+class FFmpegWatchdogError(RuntimeError):
+    """FFmpeg остановлен сторожем: завис (stalled) или работал слишком долго (timeout)."""
     
-    Args:
-        base_path: Базовый путь к исполняемому файлу
-        exe_name: Имя исполняемого файла
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class FFmpegCancelledError(FFmpegWatchdogError):
+    """FFmpeg остановлен по запросу пользователя."""
+    
+    def __init__(self, message: str):
+        super().__init__(message, 'cancelled')
+
+
+class _WatchdogState:
+    """Общее состояние читателя прогресса и сторожа."""
+    
+    def __init__(self):
+        self.out_time = -1.0
+        self.last_advance = time.monotonic()
+        self.reason = None
+        self.finished = threading.Event()
+
+
+def _supervise(monitor: ChildMonitor, state: _WatchdogState, stall_timeout: float,
+               time_limit: Optional[float], cancel_event: Optional[threading.Event]) -> None:
+    """
+    Следит за процессом FFmpeg и убивает его при отмене, зависании
+    (out_time не растет stall_timeout секунд) или превышении time_limit.
+    Заодно снимает счетчики ввода-вывода процесса для отчета о ресурсах.
+    """
+    started = time.monotonic()
+    while not state.finished.is_set():
+        if cancel_event is not None:
+            cancel_event.wait(FFMPEG_WATCHDOG_INTERVAL)
+        else:
+            state.finished.wait(FFMPEG_WATCHDOG_INTERVAL)
+        if state.finished.is_set():
+            return
+        monitor.sample()
         
-    Returns:
-        Путь к найденному исполняемому файлу или None
+        now = time.monotonic()
+        if cancel_event is not None and cancel_event.is_set():
+            state.reason = 'cancelled'
+        elif stall_timeout and now - state.last_advance > stall_timeout:
+            state.reason = 'stalled'
+        elif time_limit and now - started > time_limit:
+            state.reason = 'timeout'
+        
+        if state.reason:
+            monitor.kill()
+            return
+
+
+def _iter_lines(stream, chunk_size: int = FFMPEG_READ_CHUNK_SIZE):
     """
-    if os.path.exists(base_path):
-        return base_path
-    
-    logging.info(f"Info: Executable not found at '{base_path}'. Trying system PATH for '{exe_name}'...")
-    
-    exe_in_path = shutil.which(exe_name)
-    if exe_in_path:
-        logging.info(f"Info: Using '{exe_name}' found in system PATH: {exe_in_path}")
-        return exe_in_path
+    Читает небуферизованный бинарный поток блоками и отдает декодированные строки.
     
-    logging.warning(f"Warning: '{exe_name}' not found at '{base_path}' or in system PATH.")
-    return None
+    read() на таком потоке возвращает все, что уже есть в канале (до
+    chunk_size байт), поэтому системный вызов делается на блок, а не на строку.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8', errors='replace').strip()
+    if pending:
+        yield pending.decode('utf-8', errors='replace').strip()
+
+
+def _collect_log(stream, log_tail: deque, source: str = 'FFmpeg') -> None:
+    """Складывает лог процесса (stderr) в кольцевой буфер последних строк."""
+    for line in _iter_lines(stream):
+        if line:
+            logging.debug(f'{source}: {line}')
+            log_tail.append(line)
+
+
+# Допустимая недостача длительности выхода, если источник канала завершился с ошибкой, секунды
+PIPED_INPUT_TOLERANCE = 1.0
 
 
-# Настройка путей к FFmpeg и FFprobe
-FFMPEG_PATH_BASE = get_ffmpeg_path()
-FFPROBE_PATH_BASE = FFMPEG_PATH_BASE.replace('ffmpeg.exe', 'ffprobe.exe')
+@dataclass(frozen=True)
+class PipedInput:
+    """
+    Вход, который FFmpeg читает из stdout другого процесса (pipe:0).
+    
+    Файл на диск не пишется, а свойства потока, которые обычно дает ffprobe,
+    известны заранее (например, из информации yt-dlp о выбранном формате).
+    """
+    command: List[str]
+    name: str
+    duration: float = 0.0
+    width: int = 0
+    height: int = 0
+    has_audio: bool = True
+    sample_rate: int = 0
+    tool: str = TOOL_YTDLP  # Тип процесса-источника для предела process_utils
 
-FFMPEG_PATH_EFFECTIVE = find_executable(FFMPEG_PATH_BASE, 'ffmpeg')
-FFPROBE_PATH_EFFECTIVE = find_executable(FFPROBE_PATH_BASE, 'ffprobe')
+
+def _finish_source_process(source: ManagedProcess) -> Optional[int]:
+    """
+    Дожидается процесса-источника после завершения FFmpeg.
+    
+    Returns:
+        Код возврата или None, если источник еще работал (FFmpeg остановился
+        раньше конца входа, например по -t) и был завершен здесь
+    """
+    if not source.running():
+        return source.wait()
+    source.kill()
+    source.wait()
+    return None
 
 
 def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input", 
-               duration: float = 0, progress_callback: Optional[Callable[[int], None]] = None) -> None:
+               duration: float = 0, progress_callback: Optional[Callable[[int], None]] = None,
+               progress_event_callback: Optional[Callable[[ProgressEvent], None]] = None,
+               cancel_event: Optional[threading.Event] = None,
+               stall_timeout: float = FFMPEG_STALL_TIMEOUT,
+               time_limit_factor: float = FFMPEG_TIME_LIMIT_FACTOR,
+               cpu_set: Optional[Tuple[int, ...]] = None,
+               input_command: Optional[List[str]] = None,
+               input_tool: str = TOOL_YTDLP) -> None:
     """
     Запуск команды FFmpeg с обработкой прогресса.
     
+    Процесс запускается через process_utils и ждет свободного слота FFmpeg.
+    Прогресс читается из отдельного канала -progress (stdout) с -nostats,
+    лог уровня warning - из stderr в фоновом потоке. Из лога хранятся
+    только последние FFMPEG_LOG_TAIL_LINES строк.
+    
+    Сторож в отдельном потоке убивает процесс сразу после cancel_event.set(),
+    если out_time не растет stall_timeout секунд или если процесс работает
+    дольше time_limit_factor x duration (но не меньше FFMPEG_MIN_TIME_LIMIT).
+    
+    С input_command FFmpeg читает stdout процесса-источника (вход pipe:0 в cmd).
+    Источник, упавший раньше времени, обрывает вход, а FFmpeg при этом
+    завершается успешно, поэтому ошибкой считается код возврата источника
+    при out_time меньше ожидаемой длительности.
+    
     Args:
         cmd: Список аргументов команды FFmpeg
         input_file_for_log: Имя входного файла для логирования
         duration: Продолжительность видео в секундах
         progress_callback: Функция обратного вызова для отчета о прогрессе
+        progress_event_callback: Получает полный ProgressEvent (fps, speed, bitrate, ETA...)
+        cancel_event: Событие отмены; после set() процесс немедленно завершается
+        stall_timeout: Секунд без роста out_time до остановки (0 - не следить)
+        time_limit_factor: Предел времени работы в длительностях выхода (0 - без предела)
+        cpu_set: Ядра, к которым привязывается процесс (None - без привязки)
+        input_command: Команда процесса, stdout которого подается FFmpeg на stdin
+        input_tool: Тип процесса-источника (TOOL_YTDLP, TOOL_FFMPEG, ...)
         
     Raises:
-        FileNotFoundError: Если FFmpeg не найден
-        subprocess.CalledProcessError: Если FFmpeg завершился с ошибкой
+        FileNotFoundError: Если FFmpeg или процесс-источник не найден
+        subprocess.CalledProcessError: Если FFmpeg или процесс-источник завершился с ошибкой
+        FFmpegCancelledError: Если выполнение отменено через cancel_event
+        FFmpegWatchdogError: Если FFmpeg завис или превысил лимит времени
         RuntimeError: При других ошибках выполнения
     """
-    if not FFMPEG_PATH_EFFECTIVE:
+    ffmpeg_path = find_tool(TOOL_FFMPEG)
+    if not ffmpeg_path:
         raise FileNotFoundError('FFmpeg executable not found. Cannot run command.')
     
-    # Настройка для Windows
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
     # Построение финальной команды
-    final_cmd = [FFMPEG_PATH_EFFECTIVE]
+    final_cmd = [ffmpeg_path]
     
     # Добавление параметров логирования если их нет
     if '-loglevel' not in cmd:
-        final_cmd.extend(['-loglevel', 'debug'])
+        final_cmd.extend(['-loglevel', 'warning'])
     
-    # Добавление прогресса если нужен
-    if progress_callback:
-        final_cmd.extend(['-progress', 'pipe:1'])
+    # Прогресс идет отдельным машиночитаемым каналом, статистика в лог не пишется
+    final_cmd.extend(['-nostats', '-progress', 'pipe:1'])
     
     if '-hide_banner' not in cmd:
         final_cmd.append('-hide_banner')
@@ -119,71 +258,152 @@ def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input",
     command_for_log = ' '.join(shlex.quote(str(c)) for c in final_cmd)
     logging.info(f'Running FFmpeg command: {command_for_log}')
     
+    # Процессы закрываются в обратном порядке: сначала FFmpeg, затем источник
+    processes = ExitStack()
     try:
-        process_cwd = os.path.dirname(FFMPEG_PATH_EFFECTIVE)
-        
-        process = subprocess.Popen(
-            final_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            bufsize=1,
-            cwd=process_cwd
+        process_cwd = os.path.dirname(ffmpeg_path)
+        
+        # Процесс-источник входа pipe:0; его лог собирается отдельно
+        source = None
+        source_tail = deque(maxlen=FFMPEG_LOG_TAIL_LINES)
+        if input_command:
+            logging.info(f'Running source command: {" ".join(shlex.quote(str(c)) for c in input_command)}')
+            source = processes.enter_context(open_process(input_tool, input_command, cancel_event, bufsize=0))
+            threading.Thread(target=_collect_log, args=(source.stderr, source_tail, 'Source'), daemon=True).start()
+        
+        process = processes.enter_context(open_process(
+            TOOL_FFMPEG, final_cmd, cancel_event,
+            cwd=process_cwd,
+            stdin=source.stdout if source else subprocess.DEVNULL,
+            bufsize=0
+        ))
+        
+        if source:
+            # Канал остается открытым только у FFmpeg: его выход завершает источник
+            source.stdout.close()
+        
+        if cpu_set:
+            set_process_affinity(process.pid, cpu_set, getattr(process.popen, '_handle', None))
+        
+        log_tail = deque(maxlen=FFMPEG_LOG_TAIL_LINES)
+        log_reader = threading.Thread(target=_collect_log, args=(process.stderr, log_tail), daemon=True)
+        log_reader.start()
+        
+        time_limit = None
+        if time_limit_factor and duration > 0:
+            time_limit = max(FFMPEG_MIN_TIME_LIMIT, duration * time_limit_factor)
+        
+        monitor = process.monitor
+        watchdog_state = _WatchdogState()
+        watchdog = threading.Thread(
+            target=_supervise,
+            args=(monitor, watchdog_state, stall_timeout, time_limit, cancel_event),
+            daemon=True
         )
+        watchdog.start()
         
-        output_lines = []
-        time_regex = re.compile(r'out_time_ms=(\d+)')
-        
-        # Чтение вывода и отслеживание прогресса
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                break
-                
-            line = line.strip()
-            if line:
-                logging.debug(f'FFmpeg: {line}')
-                output_lines.append(line)
-                
-                # Обработка прогресса
-                if progress_callback and duration > 0 and line.startswith('out_time_ms'):
-                    match = time_regex.search(line)
-                    if match:
-                        elapsed_ms = int(match.group(1))
-                        progress = int(elapsed_ms / (duration * 1000000) * 100)
-                        progress_callback(min(progress, 100))
+        # Чтение блоков прогресса (key=value, блок завершается строкой progress=...)
+        block = {}
+        last_event = None
+        for line in _iter_lines(process.stdout):
+            key, sep, value = line.partition('=')
+            if not sep:
+                continue
+            block[key] = value
+            
+            if key == 'progress':
+                event = parse_progress_block(block, duration)
+                block = {}
+                # Пока мультиплексор ждет второй поток, out_time бывает N/A - не откатываем прогресс
+                if last_event and event.out_time < last_event.out_time and not event.finished:
+                    event = replace(event, out_time=last_event.out_time)
+                last_event = event
+                if last_event.out_time > watchdog_state.out_time:
+                    watchdog_state.out_time = last_event.out_time
+                    watchdog_state.last_advance = time.monotonic()
+                if progress_callback and duration > 0:
+                    progress_callback(last_event.percent)
+                if progress_event_callback:
+                    progress_event_callback(last_event)
         
         process.stdout.close()
         return_code = process.wait()
+        watchdog_state.finished.set()
+        log_reader.join()
+        watchdog.join()
+        process.stderr.close()
+        source_code = _finish_source_process(source) if source else 0
+        source_log = ''
+        if source_code:
+            source_log = (f'\nSource process exited with code {source_code}:\n'
+                          + '\n'.join(list(source_tail)[-15:]))
+        
+        file_name = os.path.basename(input_file_for_log)
+        if watchdog_state.reason == 'cancelled':
+            logging.info(f"FFmpeg cancelled for '{file_name}'")
+            raise FFmpegCancelledError(f"FFmpeg cancelled for file '{file_name}'")
+        if watchdog_state.reason:
+            message = (
+                f"FFmpeg killed by watchdog ({watchdog_state.reason}) for file '{file_name}' "
+                f'at out_time={max(0.0, watchdog_state.out_time):.1f}s.\n'
+                f'Last lines of output:\n' + '\n'.join(list(log_tail)[-15:])
+            )
+            logging.error(message)
+            raise FFmpegWatchdogError(message, watchdog_state.reason)
         
         if return_code != 0:
             error_message = (
                 f'FFmpeg failed with exit code {return_code} for file \'{os.path.basename(input_file_for_log)}\'.\n'
                 f'Command: {command_for_log}\n'
-                f'Last lines of output:\n' + '\n'.join(output_lines[-15:])
+                f'Last lines of output:\n' + '\n'.join(list(log_tail)[-15:]) + source_log
             )
+            logging.error(error_message)
             raise subprocess.CalledProcessError(
                 return_code, 
                 final_cmd, 
-                output='\n'.join(output_lines),
-                stderr='\n'.join(output_lines)
+                output='\n'.join(log_tail),
+                stderr='\n'.join(log_tail)
             )
         
+        if source_code:
+            out_time = last_event.out_time if last_event else 0.0
+            if duration <= 0 or out_time < duration - PIPED_INPUT_TOLERANCE:
+                message = (f"Source process failed for file '{file_name}' "
+                           f'at out_time={max(0.0, out_time):.1f}s.{source_log}')
+                logging.error(message)
+                raise subprocess.CalledProcessError(source_code, input_command, output=message, stderr=message)
+            logging.warning(f"Source process exited with code {source_code} after the output was complete for '{file_name}'")
+        
         logging.info(f"FFmpeg successfully processed '{os.path.basename(input_file_for_log)}'")
+        if last_event:
+            logging.info(
+                f'FFmpeg stats: frames={last_event.frame} fps={last_event.fps:.1f} '
+                f'speed={last_event.speed:.2f}x bitrate={last_event.bitrate_kbps:.0f}kbit/s '
+                f'size={last_event.total_size} out_time={last_event.out_time:.2f}s'
+            )
         
-    except FileNotFoundError:
+    except (subprocess.CalledProcessError, FFmpegWatchdogError):
+        raise
+    except ProcessCancelledError:
+        logging.info(f"FFmpeg cancelled before start for '{os.path.basename(input_file_for_log)}'")
+        raise FFmpegCancelledError(f"FFmpeg cancelled for file '{os.path.basename(input_file_for_log)}'")
+    except FileNotFoundError as e:
+        if input_command and e.filename == input_command[0]:
+            raise FileNotFoundError(f"Source executable not found at '{input_command[0]}'.")
         raise FileNotFoundError(
-            f"FFmpeg executable not found at '{FFMPEG_PATH_EFFECTIVE}'. "
+            f"FFmpeg executable not found at '{ffmpeg_path}'. "
             "Please ensure FFmpeg is installed and accessible."
         )
     except Exception as e:
         raise RuntimeError(
             f"An error occurred while running FFmpeg for file '{os.path.basename(input_file_for_log)}': {e}"
         )
+    finally:
+        processes.close()
+
+
+# Предел времени анализа черных полос, секунды
+CROP_DETECT_TIMEOUT = 60
 
 
 def detect_crop_dimensions(path: str) -> Optional[str]:
@@ -202,14 +422,15 @@ def detect_crop_dimensions(path: str) -> Optional[str]:
     """
     logging.info(f'Detecting crop dimensions for {os.path.basename(path)} using ffmpeg...')
     
-    if not FFMPEG_PATH_EFFECTIVE:
+    ffmpeg_path = find_tool(TOOL_FFMPEG)
+    if not ffmpeg_path:
         error_msg = 'FFmpeg executable not found. Cannot perform crop detection.'
         logging.error(error_msg)
         raise FileNotFoundError(error_msg)
     
     try:
         cmd = [
-            FFMPEG_PATH_EFFECTIVE,
+            ffmpeg_path,
             '-hide_banner',
             '-ss', '5',  # Начинаем с 5-й секунды
             '-t', '10',   # Анализируем 10 секунд
@@ -220,19 +441,17 @@ def detect_crop_dimensions(path: str) -> Optional[str]:
             '-'
         ]
         
-        process = subprocess.Popen(
-            cmd,
-            stderr=subprocess.PIPE,
-            stdout=subprocess.DEVNULL,
-            text=True,
-            encoding='utf-8',
-            errors='replace'
-        )
+        # Из лога берутся только строки с информацией об обрезке
+        crop_lines = []
         
-        _, stderr_output = process.communicate(timeout=60)
+        def collect_crop_line(line: str) -> None:
+            if 'crop=' in line:
+                crop_lines.append(line)
         
-        # Поиск строк с информацией об обрезке
-        crop_lines = [line for line in stderr_output.split('\n') if 'crop=' in line]
+        try:
+            run_process(TOOL_FFMPEG, cmd, timeout=CROP_DETECT_TIMEOUT, on_stderr_line=collect_crop_line, keep_lines=0)
+        except subprocess.TimeoutExpired:
+            logging.warning(f'cropdetect timed out for {os.path.basename(path)}, using the values found so far')
         
         if not crop_lines:
             logging.warning(f'cropdetect found no crop values for {os.path.basename(path)}')
@@ -264,12 +483,13 @@ def get_video_dimensions(path: str) -> Tuple[int, int]:
     Returns:
         Кортеж (ширина, высота) или (0, 0) при ошибке
     """
-    if not FFPROBE_PATH_EFFECTIVE:
+    ffprobe_path = find_tool(TOOL_FFPROBE)
+    if not ffprobe_path:
         logging.warning('ffprobe not found, cannot get video dimensions.')
         return (0, 0)
     
     cmd = [
-        FFPROBE_PATH_EFFECTIVE,
+        ffprobe_path,
         '-v', 'error',
         '-select_streams', 'v:0',
         '-show_entries', 'stream=width,height',
@@ -278,29 +498,8 @@ def get_video_dimensions(path: str) -> Tuple[int, int]:
     ]
     
     try:
-        # Настройка для Windows
-        creationflags = 0
-        startupinfo = None
-        
-        if platform.system() == 'Windows':
-            creationflags = subprocess.CREATE_NO_WINDOW
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-        
-        process_cwd = os.path.dirname(FFPROBE_PATH_EFFECTIVE)
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            cwd=process_cwd
-        )
+        result = run_process(TOOL_FFPROBE, cmd, timeout=FFPROBE_TIMEOUT,
+                             cwd=os.path.dirname(ffprobe_path), check=True)
         
         dims = result.stdout.strip().split('x')
         if len(dims) == 2:
@@ -313,13 +512,70 @@ def get_video_dimensions(path: str) -> Tuple[int, int]:
         logging.error(f"Error running ffprobe for '{os.path.basename(path)}': {e.stderr.strip()}")
         return (0, 0)
     except FileNotFoundError:
-        logging.error(f"Error: ffprobe executable not found at '{FFPROBE_PATH_EFFECTIVE}'.")
+        logging.error(f"Error: ffprobe executable not found at '{ffprobe_path}'.")
         return (0, 0)
     except Exception as e:
         logging.error(f"Unexpected error getting dimensions for '{os.path.basename(path)}': {e}")
         return (0, 0)
 
 
+def get_stream_info(path: str, stream: str = 'v:0') -> Dict[str, str]:
+    """
+    Получение кодека и пиксельного формата потока с помощью ffprobe.
+    
+    Args:
+        path: Путь к видеофайлу
+        stream: Селектор потока ffprobe ('v:0', 'a:0')
+        
+    Returns:
+        Словарь вида {'codec_name': 'h264', 'pix_fmt': 'yuv420p', 'r_frame_rate': '30/1'}
+        (для аудио - 'sample_rate') или пустой словарь при ошибке
+    """
+    ffprobe_path = find_tool(TOOL_FFPROBE)
+    if not ffprobe_path:
+        logging.warning('ffprobe not found, cannot get stream info.')
+        return {}
+    
+    cmd = [
+        ffprobe_path,
+        '-v', 'error',
+        '-select_streams', stream,
+        '-show_entries', 'stream=codec_name,pix_fmt,r_frame_rate,sample_rate',
+        '-of', 'default=noprint_wrappers=1',
+        path
+    ]
+    
+    try:
+        result = run_process(TOOL_FFPROBE, cmd, timeout=FFPROBE_TIMEOUT,
+                             cwd=os.path.dirname(ffprobe_path), check=True)
+        
+        info = {}
+        for line in result.stdout.splitlines():
+            key, sep, value = line.strip().partition('=')
+            if sep and value and value != 'unknown':
+                info[key] = value
+        return info
+        
+    except Exception as e:
+        logging.error(f"Error getting stream info ({stream}) for '{os.path.basename(path)}': {e}")
+        return {}
+
+
+def _known_dimensions(path: str) -> Optional[Tuple[int, int]]:
+    """Размеры видео для планировщика графа или None, если их не удалось получить."""
+    width, height = get_video_dimensions(path)
+    if width > 0 and height > 0:
+        return (width, height)
+    return None
+
+
+def _piped_dimensions(piped_input: PipedInput) -> Optional[Tuple[int, int]]:
+    """Размеры входа из канала, если они известны заранее."""
+    if piped_input.width > 0 and piped_input.height > 0:
+        return (piped_input.width, piped_input.height)
+    return None
+
+
 def get_video_duration(path: str) -> float:
     """
     Получение продолжительности видео в секундах.
@@ -330,12 +586,13 @@ def get_video_duration(path: str) -> float:
     Returns:
         Продолжительность в секундах или 0 при ошибке
     """
-    if not FFPROBE_PATH_EFFECTIVE:
+    ffprobe_path = find_tool(TOOL_FFPROBE)
+    if not ffprobe_path:
         logging.warning('ffprobe not found, cannot get video duration.')
         return 0
     
     cmd = [
-        FFPROBE_PATH_EFFECTIVE,
+        ffprobe_path,
         '-v', 'error',
         '-show_entries', 'format=duration',
         '-of', 'default=noprint_wrappers=1:nokey=1',
@@ -343,29 +600,8 @@ def get_video_duration(path: str) -> float:
     ]
     
     try:
-        # Настройка для Windows
-        creationflags = 0
-        startupinfo = None
-        
-        if platform.system() == 'Windows':
-            creationflags = subprocess.CREATE_NO_WINDOW
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-        
-        process_cwd = os.path.dirname(FFPROBE_PATH_EFFECTIVE)
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            cwd=process_cwd
-        )
+        result = run_process(TOOL_FFPROBE, cmd, timeout=FFPROBE_TIMEOUT,
+                             cwd=os.path.dirname(ffprobe_path), check=True)
         
         return float(result.stdout.strip())
         
@@ -373,6 +609,588 @@ def get_video_duration(path: str) -> float:
         return 0
 
 
+def get_keyframe_times(path: str) -> List[float]:
+    """
+    Время ключевых кадров видео в секундах от начала файла.
+    
+    Читаются только заголовки пакетов (без декодирования), время
+    отсчитывается от start_time контейнера, как и у -ss.
+    
+    Args:
+        path: Путь к видеофайлу
+    
+    Returns:
+        Отсортированный список времен или пустой список при ошибке
+    """
+    ffprobe_path = find_tool(TOOL_FFPROBE)
+    if not ffprobe_path:
+        logging.warning('ffprobe not found, cannot get keyframes.')
+        return []
+    
+    cmd = [
+        ffprobe_path,
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'format=start_time:packet=pts_time,flags',
+        '-of', 'compact=p=0',
+        path
+    ]
+    
+    try:
+        result = run_process(TOOL_FFPROBE, cmd, timeout=FFPROBE_TIMEOUT,
+                             cwd=os.path.dirname(ffprobe_path), check=True)
+        
+        start_time = 0.0
+        keyframes = []
+        for line in result.stdout.splitlines():
+            fields = dict(item.partition('=')[::2] for item in line.strip().split('|'))
+            if 'start_time' in fields:
+                start_time = float(fields['start_time']) if fields['start_time'] not in ('', 'N/A') else 0.0
+            elif fields.get('flags', '').startswith('K') and fields.get('pts_time') not in (None, '', 'N/A'):
+                keyframes.append(float(fields['pts_time']))
+        
+        return sorted(k - start_time for k in keyframes)
+    
+    except Exception as e:
+        logging.error(f"Error getting keyframes for '{os.path.basename(path)}': {e}")
+        return []
+
+
+# Расширения оверлеев, которые подаются как один кадр
+STILL_OVERLAY_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+# Пиксельный формат с альфа-каналом для каждого выходного формата
+_ALPHA_PIX_FMTS = {
+    'yuv420p': 'yuva420p',
+    'yuv422p': 'yuva422p',
+    'yuv444p': 'yuva444p',
+}
+
+
+@dataclass(frozen=True)
+class PreparedOverlay:
+    """Оверлей, заранее подготовленный для наложения (см. prepare_overlay)."""
+    path: str
+    is_still: bool
+
+
+def prepare_overlay(overlay_file: str, output_pix_fmt: str = 'yuv420p') -> Optional[PreparedOverlay]:
+    """
+    Подготавливает оверлей один раз на всю пачку файлов.
+    
+    Картинка или GIF переводится в пиксельный формат выхода с альфа-каналом
+    и премультиплицированной альфой и сохраняется в кеш на диске (FFV1),
+    поэтому при наложении FFmpeg больше не конвертирует оверлей на каждом
+    кадре. Ключ кеша учитывает путь, размер и время изменения файла.
+    
+    Args:
+        overlay_file: Путь к файлу оверлея (PNG, JPG, GIF...)
+        output_pix_fmt: Пиксельный формат итогового видео
+        
+    Returns:
+        PreparedOverlay или None, если формат оверлея не поддерживается
+        
+    Raises:
+        RuntimeError: Если FFmpeg не смог подготовить оверлей
+    """
+    extension = os.path.splitext(overlay_file)[1].lower()
+    is_still = extension in STILL_OVERLAY_EXTENSIONS
+    if not is_still and extension != '.gif':
+        return None
+    
+    stat = os.stat(overlay_file)
+    overlay_pix_fmt = _ALPHA_PIX_FMTS.get(output_pix_fmt, 'yuva420p')
+    cache_key = hashlib.sha1(
+        f'{os.path.abspath(overlay_file)}|{stat.st_size}|{stat.st_mtime_ns}|{overlay_pix_fmt}'.encode('utf-8')
+    ).hexdigest()
+    cached_path = os.path.join(get_cache_directory('overlays'), f'{cache_key}.mkv')
+    
+    if not os.path.exists(cached_path):
+        temp_path = f'{cached_path}.{os.getpid()}.tmp.mkv'
+        cmd = [
+            '-y', '-loglevel', 'error',
+            '-i', overlay_file,
+            '-vf', f'format=rgba,premultiply=inplace=1,format={overlay_pix_fmt}',
+        ]
+        if is_still:
+            cmd.extend(['-frames:v', '1'])
+        cmd.extend(['-an', '-c:v', 'ffv1', temp_path])
+        
+        try:
+            run_ffmpeg(cmd, input_file_for_log=overlay_file)
+            os.replace(temp_path, cached_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        logging.info(f"Overlay '{os.path.basename(overlay_file)}' prepared: {cached_path}")
+    
+    return PreparedOverlay(path=cached_path, is_still=is_still)
+
+
+def _prepare_overlay_or_none(overlay_file: str) -> Optional[PreparedOverlay]:
+    """prepare_overlay без исключений: при ошибке оверлей накладывается как есть."""
+    try:
+        return prepare_overlay(overlay_file)
+    except Exception as e:
+        logging.warning(f"Could not prepare overlay '{os.path.basename(overlay_file)}', using it as is: {e}")
+        return None
+
+
+# Частота дискретизации подготовленного аудио оверлея, если у видео нет звука
+OVERLAY_AUDIO_DEFAULT_SAMPLE_RATE = 48000
+
+
+def prepare_overlay_audio(audio_file: str, sample_rate: int = OVERLAY_AUDIO_DEFAULT_SAMPLE_RATE) -> str:
+    """
+    Декодирует аудио оверлея один раз на всю пачку файлов.
+    
+    Дорожка сохраняется в кеш на диске как стерео PCM (WAV) с частотой
+    дискретизации исходного видео, поэтому задания не декодируют и не
+    передискретизируют ее заново. Ключ кеша учитывает путь, размер,
+    время изменения файла и частоту.
+    
+    Args:
+        audio_file: Путь к аудио оверлея
+        sample_rate: Частота дискретизации результата
+        
+    Returns:
+        Путь к подготовленному WAV файлу
+        
+    Raises:
+        RuntimeError: Если FFmpeg не смог декодировать аудио
+    """
+    stat = os.stat(audio_file)
+    cache_key = hashlib.sha1(
+        f'{os.path.abspath(audio_file)}|{stat.st_size}|{stat.st_mtime_ns}|{sample_rate}'.encode('utf-8')
+    ).hexdigest()
+    cached_path = os.path.join(get_cache_directory('overlay_audio'), f'{cache_key}.wav')
+    
+    if not os.path.exists(cached_path):
+        temp_path = f'{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp.wav'
+        cmd = [
+            '-y', '-loglevel', 'error',
+            '-i', audio_file,
+            '-vn', '-ac', '2', '-ar', str(sample_rate),
+            '-c:a', 'pcm_s16le', temp_path
+        ]
+        
+        try:
+            run_ffmpeg(cmd, input_file_for_log=audio_file)
+            os.replace(temp_path, cached_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        logging.info(f"Overlay audio '{os.path.basename(audio_file)}' prepared: {cached_path}")
+    
+    return cached_path
+
+
+def _source_sample_rate(in_path: str) -> int:
+    """Частота дискретизации первой аудиодорожки или 0, если ее не удалось определить."""
+    try:
+        return int(get_stream_info(in_path, 'a:0').get('sample_rate', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _prepare_overlay_audio_or_none(audio_file: str, sample_rate: int) -> Optional[str]:
+    """prepare_overlay_audio с частотой исходного видео; при ошибке None (аудио берется как есть)."""
+    try:
+        return prepare_overlay_audio(audio_file, sample_rate)
+    except Exception as e:
+        logging.warning(f"Could not prepare overlay audio '{os.path.basename(audio_file)}', using it as is: {e}")
+        return None
+
+
+# Кодеки, которые можно скопировать в MP4 без перекодирования
+MP4_COPY_VIDEO_CODECS = ('h264', 'hevc', 'av1', 'mpeg4')
+MP4_COPY_AUDIO_CODECS = ('aac', 'mp3')
+
+
+def _can_copy_video(in_path: str, spec: GraphSpec) -> bool:
+    """Видео не меняется графом и подходит для -c:v copy."""
+    if not is_video_passthrough(spec):
+        return False
+    info = get_stream_info(in_path, 'v:0')
+    return info.get('codec_name') in MP4_COPY_VIDEO_CODECS and info.get('pix_fmt') == spec.output_pix_fmt
+
+
+def _can_copy_audio(in_path: str, spec: GraphSpec) -> bool:
+    """Исходный звук не меняется графом и подходит для -c:a copy."""
+    if not spec.has_audio_output or not is_audio_passthrough(spec):
+        return False
+    return get_stream_info(in_path, 'a:0').get('codec_name') in MP4_COPY_AUDIO_CODECS
+
+
+# Битрейт AAC на выходе
+AUDIO_BITRATE_KBPS = 128
+
+# Пресеты x264 от быстрого к медленному
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+
+# Профиль -> (пресет x264, CRF/CQ)
+X264_PROFILE_SETTINGS = {
+    ENCODE_PROFILE_FASTEST: ('ultrafast', 23),
+    ENCODE_PROFILE_BALANCED: ('veryfast', 24),
+    ENCODE_PROFILE_SMALLEST: ('slow', 27),
+}
+HW_PROFILE_QUALITY = {
+    ENCODE_PROFILE_FASTEST: 26,
+    ENCODE_PROFILE_BALANCED: 24,
+    ENCODE_PROFILE_SMALLEST: 28,
+}
+# Пресеты аппаратных кодировщиков (None - по умолчанию кодировщика)
+NVENC_PROFILE_PRESETS = {ENCODE_PROFILE_FASTEST: 'p1', ENCODE_PROFILE_SMALLEST: 'p6'}
+QSV_PROFILE_PRESETS = {ENCODE_PROFILE_FASTEST: 'veryfast', ENCODE_PROFILE_SMALLEST: 'veryslow'}
+AMF_PROFILE_QUALITY = {ENCODE_PROFILE_FASTEST: 'speed', ENCODE_PROFILE_SMALLEST: 'quality'}
+
+# Доля контейнера MP4 и запаса, на которую уменьшается целевой битрейт
+TARGET_SIZE_OVERHEAD = 0.03
+
+
+@dataclass(frozen=True)
+class EncodeProfile:
+    """Настройки кодирования видео."""
+    name: str = ENCODE_PROFILE_BALANCED
+    target_size_mb: float = DEFAULT_TARGET_SIZE_MB  # Только для ENCODE_PROFILE_TARGET_SIZE
+    two_pass: bool = False  # Двухпроходное кодирование (libx264 с целевым битрейтом)
+    preset_cap: Optional[str] = None  # Пресет x264 не медленнее этого (очередь забита)
+
+
+def target_video_bitrate_kbps(target_size_mb: float, duration: float,
+                              audio_kbps: float = AUDIO_BITRATE_KBPS) -> int:
+    """
+    Битрейт видео, при котором файл длительностью duration уложится в target_size_mb.
+    
+    Returns:
+        Битрейт в кбит/с или 0, если длительность неизвестна
+    """
+    if duration <= 0 or target_size_mb <= 0:
+        return 0
+    total_kbps = target_size_mb * 8 * 1024 * (1 - TARGET_SIZE_OVERHEAD) / duration
+    return max(100, int(total_kbps - audio_kbps))
+
+
+def _capped_preset(preset: str, cap: Optional[str]) -> str:
+    """Ограничивает пресет x264 сверху более быстрым cap."""
+    if cap in X264_PRESETS and X264_PRESETS.index(preset) > X264_PRESETS.index(cap):
+        return cap
+    return preset
+
+
+def video_encoder_args(codec: str, profile: EncodeProfile, duration: float = 0) -> List[str]:
+    """
+    Аргументы видеокодировщика для профиля (без -c:v).
+    
+    Args:
+        codec: Видеокодек (libx264, h264_nvenc, hevc_qsv...)
+        profile: Профиль кодирования
+        duration: Длительность выхода (нужна для целевого размера)
+        
+    Returns:
+        Список аргументов FFmpeg
+    """
+    name = profile.name
+    bitrate = 0
+    if name == ENCODE_PROFILE_TARGET_SIZE:
+        bitrate = target_video_bitrate_kbps(profile.target_size_mb, duration)
+        if not bitrate:
+            logging.warning('Output duration unknown, target size mode falls back to the balanced profile')
+        name = ENCODE_PROFILE_BALANCED
+    
+    args = []
+    if 'nvenc' in codec:
+        if NVENC_PROFILE_PRESETS.get(name):
+            args.extend(['-preset', NVENC_PROFILE_PRESETS[name]])
+        if not bitrate:
+            args.extend(['-cq', str(HW_PROFILE_QUALITY[name])])
+    elif 'amf' in codec:
+        if AMF_PROFILE_QUALITY.get(name):
+            args.extend(['-quality', AMF_PROFILE_QUALITY[name]])
+        if not bitrate:
+            args.extend(['-cq', str(HW_PROFILE_QUALITY[name])])
+    elif 'qsv' in codec:
+        if QSV_PROFILE_PRESETS.get(name):
+            args.extend(['-preset', QSV_PROFILE_PRESETS[name]])
+        if not bitrate:
+            args.extend(['-global_quality', str(HW_PROFILE_QUALITY[name])])
+    else:
+        preset, crf = X264_PROFILE_SETTINGS[name]
+        args.extend(['-preset', _capped_preset(preset, profile.preset_cap)])
+        if not bitrate:
+            args.extend(['-crf', str(crf)])
+    
+    if bitrate:
+        # Ограничение пиков, чтобы файл не превысил лимит площадки
+        args.extend(['-b:v', f'{bitrate}k', '-maxrate', f'{int(bitrate * 1.5)}k', '-bufsize', f'{bitrate * 2}k'])
+    return args
+
+
+def _two_pass_enabled(codec: str, profile: EncodeProfile, duration: float) -> bool:
+    """Двухпроходное кодирование имеет смысл только для libx264 с целевым битрейтом."""
+    return (profile.two_pass and codec == 'libx264' and profile.name == ENCODE_PROFILE_TARGET_SIZE
+            and target_video_bitrate_kbps(profile.target_size_mb, duration) > 0)
+
+
+def _pass_percent(callback: Optional[Callable[[int], None]], pass_index: int,
+                  passes: int) -> Optional[Callable[[int], None]]:
+    """Пересчитывает процент прохода в общий процент всех проходов."""
+    if callback is None or passes == 1:
+        return callback
+    return lambda percent: callback((pass_index * 100 + percent) // passes)
+
+
+def _pass_progress(callback: Optional[Callable[[ProgressEvent], None]], pass_index: int,
+                   passes: int) -> Optional[Callable[[ProgressEvent], None]]:
+    """Пересчитывает прогресс прохода в общий прогресс всех проходов."""
+    if callback is None or passes == 1:
+        return callback
+    
+    def on_event(event: ProgressEvent) -> None:
+        out_time = (pass_index * event.duration + event.out_time) / passes
+        callback(replace(event, out_time=out_time, speed=event.speed / passes,
+                         finished=event.finished and pass_index == passes - 1))
+    return on_event
+
+
+# Минимальная длительность сегмента (секунды исходного видео) при сегментном кодировании
+SEGMENT_MIN_DURATION = 30
+SEGMENT_VIDEO_LABEL = 'vseg'
+
+
+def _frame_rate(path: str) -> Optional[Fraction]:
+    """Частота кадров видео (r_frame_rate) или None, если она неизвестна."""
+    try:
+        rate = Fraction(get_stream_info(path, 'v:0').get('r_frame_rate', ''))
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate if rate > 0 else None
+
+
+def _concat_list_line(path: str) -> str:
+    """Строка списка concat-демультиплексора с экранированием кавычек."""
+    escaped = os.path.abspath(path).replace('\\', '/').replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def _process_segmented(
+    in_path: str,
+    out_path: str,
+    spec: GraphSpec,
+    segments: List[Segment],
+    frame_rate: Fraction,
+    source_duration: float,
+    duration: float,
+    overlay_input_path: Optional[str],
+    overlay_audio_path: Optional[str],
+    codec: str,
+    encode_profile: EncodeProfile,
+    copy_audio: bool,
+    strip_metadata: bool,
+    thread_plan: ThreadPlan,
+    progress_callback: Optional[Callable[[int], None]],
+    progress_event_callback: Optional[Callable[[ProgressEvent], None]],
+    cancel_event: Optional[threading.Event]
+) -> None:
+    """
+    Сегментное кодирование: отрезки видео параллельно, затем склейка без перекодирования.
+    
+    Каждый отрезок начинается с ключевого кадра и кодируется отдельным
+    FFmpeg с тем же (уже разрешенным) графом, поэтому случайные параметры
+    совпадают во всех отрезках. Субтитры сдвигаются на начало отрезка,
+    анимированный оверлей - на позицию отрезка в выходе. Звук кодируется
+    одним заданием на всю длину параллельно с видео, так что темп и микс
+    не зависят от границ отрезков. Части склеиваются concat-демультиплексором
+    с -c copy.
+    
+    Кадры каждого отрезка выравниваются по общей сетке выхода (fps с
+    частотой исходника от абсолютного времени отрезка), а отрезок
+    обрезается ровно до первого кадра следующего, поэтому при изменении
+    скорости склейка не сдвигает видео относительно звука и субтитров.
+    
+    Raises:
+        FFmpegCancelledError: Если обработка отменена
+        subprocess.CalledProcessError, FFmpegWatchdogError: Ошибка любого из заданий
+    """
+    work_dir = tempfile.mkdtemp(prefix='segments_', dir=os.path.dirname(os.path.abspath(out_path)))
+    stop_event = threading.Event()
+    done_event = threading.Event()
+    
+    # Внешняя отмена или ошибка одного задания останавливает все остальные
+    def relay_cancel() -> None:
+        while not done_event.is_set() and not stop_event.is_set():
+            if cancel_event.wait(FFMPEG_WATCHDOG_INTERVAL):
+                stop_event.set()
+    
+    if cancel_event is not None:
+        threading.Thread(target=relay_cancel, daemon=True).start()
+    
+    # Прогресс файла - сумма прогресса отрезков
+    progress_lock = threading.Lock()
+    segment_events = {}
+    video_duration = source_duration / spec.speed_factor
+    
+    def segment_progress(index: int) -> Callable[[ProgressEvent], None]:
+        def on_event(event: ProgressEvent) -> None:
+            with progress_lock:
+                segment_events[index] = event
+                events = list(segment_events.values())
+                out_time = sum(e.out_time for e in events)
+                total_size = sum(e.total_size for e in events)
+                combined = ProgressEvent(
+                    frame=sum(e.frame for e in events),
+                    fps=sum(e.fps for e in events if not e.finished),
+                    speed=sum(e.speed for e in events if not e.finished),
+                    bitrate_kbps=total_size * 8 / 1000 / out_time if out_time > 0 else 0.0,
+                    total_size=total_size,
+                    out_time=out_time,
+                    duration=video_duration
+                )
+                if progress_callback:
+                    progress_callback(combined.percent)
+                if progress_event_callback:
+                    progress_event_callback(combined)
+        return on_event
+    
+    # Зацикленный оверлей продолжает анимацию с позиции отрезка
+    overlay_seekable = overlay_input_path is not None and not spec.overlay_still and \
+        not overlay_input_path.lower().endswith(STILL_OVERLAY_EXTENSIONS)
+    overlay_period = get_video_duration(overlay_input_path) if overlay_seekable and spec.overlay_looped else 0
+    
+    def _output_slot(source_time: float) -> int:
+        # Номер первого кадра выхода не раньше source_time исходника
+        return math.ceil(Fraction(source_time / spec.speed_factor) * frame_rate - Fraction(1, 10 ** 6))
+    
+    def encode_segment(segment: Segment) -> str:
+        plan = split_thread_plan(thread_plan, len(segments), segment.index)
+        segment_path = os.path.join(work_dir, f'segment_{segment.index:03}.mp4')
+        
+        cmd = plan.global_args()
+        if segment.start > 0:
+            cmd.extend(['-ss', f'{segment.start:.6f}'])
+        if segment.end is not None:
+            cmd.extend(['-t', f'{segment.end - segment.start:.6f}'])
+        cmd.extend(plan.input_args())
+        cmd.extend(['-i', in_path])
+        
+        if overlay_input_path:
+            # Оверлей накладывается после setpts, то есть во времени выхода
+            overlay_offset = segment.start / spec.speed_factor
+            if overlay_period > 0:
+                overlay_offset %= overlay_period
+            if overlay_seekable and overlay_offset > 0 and (overlay_period > 0 or not spec.overlay_looped):
+                cmd.extend(['-ss', f'{overlay_offset:.6f}'])
+            if spec.overlay_looped:
+                cmd.extend(['-stream_loop', '-1'])
+            cmd.extend(['-i', overlay_input_path])
+        
+        # Субтитры накладываются до setpts, то есть во времени исходника
+        segment_spec = replace(spec, has_audio=False, overlay_audio_input=None)
+        if spec.srt_path:
+            segment_srt = os.path.join(work_dir, f'segment_{segment.index:03}.srt')
+            shift_srt(spec.srt_path, segment_srt, segment.start, segment.end)
+            segment_spec = replace(segment_spec, srt_path=segment_srt)
+        
+        # Кадры на сетке 1/frame_rate от начала всего выхода, затем отсчет от нуля.
+        # Если граф теряет последний кадр (overlay с shortest=1), он повторяется,
+        # чтобы отрезок занял ровно свое место до следующего.
+        first_slot = _output_slot(segment.start)
+        frame_count = _output_slot(source_duration if segment.end is None else segment.end) - first_slot
+        offset = segment.start / spec.speed_factor
+        fc_string = compile_filter_graph(segment_spec) + (
+            f';[{VIDEO_OUTPUT_LABEL}]setpts=PTS+{offset:.6f}/TB,'
+            f'fps=fps={frame_rate}:start_time={float(first_slot / frame_rate):.6f},'
+            f'tpad=stop_mode=clone:stop=-1,setpts=PTS-STARTPTS[{SEGMENT_VIDEO_LABEL}]'
+        )
+        cmd.extend(['-filter_complex', fc_string])
+        cmd.extend(['-map', f'[{SEGMENT_VIDEO_LABEL}]', '-an', '-frames:v', str(frame_count)])
+        cmd.extend(['-c:v', codec])
+        cmd.extend(video_encoder_args(codec, encode_profile, duration))
+        cmd.extend(plan.output_args(codec))
+        cmd.extend(['-map_metadata', '-1', '-y', segment_path])
+        
+        run_ffmpeg(cmd, input_file_for_log=in_path,
+                   duration=segment.source_duration(source_duration) / spec.speed_factor,
+                   progress_event_callback=segment_progress(segment.index),
+                   cancel_event=stop_event, cpu_set=plan.cpu_set)
+        return segment_path
+    
+    def encode_audio(audio_path: str) -> None:
+        cmd = ['-i', in_path]
+        audio_spec = replace(spec, include_video=False, overlay_input=None, overlay_audio_input=None)
+        if overlay_audio_path:
+            cmd.extend(['-i', overlay_audio_path])
+            audio_spec = replace(audio_spec, overlay_audio_input=1)
+        cmd.extend(['-filter_complex', compile_filter_graph(audio_spec)])
+        cmd.extend(['-map', f'[{AUDIO_OUTPUT_LABEL}]', '-vn'])
+        cmd.extend(['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE_KBPS}k', '-y', audio_path])
+        run_ffmpeg(cmd, input_file_for_log=in_path, duration=duration, cancel_event=stop_event)
+    
+    audio_path = None
+    if not copy_audio and spec.has_audio_output:
+        audio_path = os.path.join(work_dir, 'audio.m4a')
+    
+    try:
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(segments) + 1) as executor:
+            futures = []
+            if audio_path:
+                futures.append(executor.submit(bind_active_stages(encode_audio), audio_path))
+            segment_futures = [executor.submit(bind_active_stages(encode_segment), s) for s in segments]
+            futures.extend(segment_futures)
+            
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+                    stop_event.set()
+        
+        if errors:
+            file_name = os.path.basename(in_path)
+            if cancel_event is not None and cancel_event.is_set():
+                raise FFmpegCancelledError(f"FFmpeg cancelled for file '{file_name}'")
+            # Остальные задания остановлены из-за первой ошибки - сообщаем именно ее
+            real_errors = [e for e in errors if not isinstance(e, FFmpegCancelledError)]
+            raise (real_errors or errors)[0]
+        
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for future in segment_futures:
+                f.write(_concat_list_line(future.result()))
+        
+        # Склейка: видео из отрезков, звук и метаданные из исходника или аудиозадания
+        cmd = ['-y', '-f', 'concat', '-safe', '0', '-i', list_path, '-i', in_path]
+        if audio_path:
+            cmd.extend(['-i', audio_path])
+        cmd.extend(['-map', '0:v:0'])
+        if audio_path:
+            cmd.extend(['-map', '2:a:0'])
+        elif copy_audio:
+            cmd.extend(['-map', '1:a:0'])
+        cmd.extend(['-c', 'copy'])
+        if strip_metadata:
+            cmd.extend(['-map_metadata', '-1', '-map_chapters', '-1'])
+        else:
+            cmd.extend(['-map_metadata', '1', '-map_chapters', '1'])
+        if spec.shortest:
+            cmd.append('-shortest')
+        cmd.append(out_path)
+        
+        run_ffmpeg(cmd, input_file_for_log=in_path, duration=duration, cancel_event=cancel_event)
+        
+        if progress_callback:
+            progress_callback(100)
+        if progress_event_callback:
+            progress_event_callback(ProgressEvent(out_time=video_duration, duration=video_duration, finished=True,
+                                                  total_size=os.path.getsize(out_path)))
+    finally:
+        done_event.set()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
 def process_single(
     in_path: str,
     out_path: str,
@@ -383,6 +1201,7 @@ def process_single(
     overlay_pos: str = "center",
     output_format: str = "mp4",
     blur_background: bool = False,
+    blur_mode: str = BLUR_MODE_QUALITY,
     mute_audio: bool = False,
     strip_metadata: bool = False,
     codec: str = "libx264",
@@ -392,13 +1211,36 @@ def process_single(
     overlay_audio_path: Optional[str] = None,
     original_volume: float = 1.0,
     overlay_volume: float = 1.0,
-    progress_callback: Optional[Callable[[int], None]] = None
+    progress_callback: Optional[Callable[[int], None]] = None,
+    progress_event_callback: Optional[Callable[[ProgressEvent], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    safe_mode: bool = False,
+    thread_plan: Optional[ThreadPlan] = None,
+    encode_profile: Optional[EncodeProfile] = None,
+    segment_jobs: int = 1,
+    piped_input: Optional[PipedInput] = None
 ) -> None:
     """
     Обработка одного видеофайла с применением различных эффектов.
     
+    Безопасный режим (safe_mode) используется для повтора после срабатывания
+    сторожа: программный libx264 вместо аппаратного кодека, без копирования
+    потоков и подготовленного оверлея, с жестким ограничением длительности -t.
+    
+    При segment_jobs > 1 длинный файл делится по ключевым кадрам на отрезки
+    не короче SEGMENT_MIN_DURATION, которые кодируются параллельно и
+    склеиваются без перекодирования (см. _process_segmented). GIF на входе,
+    копирование видео, двухпроходное кодирование и безопасный режим
+    всегда обрабатываются одним процессом.
+    
+    С piped_input вход читается из stdout процесса-источника (например,
+    yt-dlp -o -) и обработка идет одновременно со скачиванием. Свойства
+    входа берутся из piped_input вместо ffprobe; копирование потоков,
+    сегменты и два прохода в этом режиме не используются - им нужен
+    повторный доступ к файлу.
+    
     Args:
-        in_path: Путь к входному файлу
+        in_path: Путь к входному файлу (с piped_input - только имя для логов)
         out_path: Путь к выходному файлу
         filters: Список названий фильтров для применения
         zoom_p: Процент увеличения (100 = без изменений)
@@ -407,6 +1249,7 @@ def process_single(
         overlay_pos: Позиция оверлея
         output_format: Формат выходного файла
         blur_background: Размытие фона для формата reels
+        blur_mode: Режим размытия фона (BLUR_MODE_QUALITY или BLUR_MODE_FAST)
         mute_audio: Отключение звука
         strip_metadata: Удаление метаданных
         codec: Видеокодек
@@ -417,285 +1260,213 @@ def process_single(
         original_volume: Громкость оригинального аудио
         overlay_volume: Громкость аудио оверлея
         progress_callback: Функция обратного вызова для прогресса
+        progress_event_callback: Функция обратного вызова для ProgressEvent
+        cancel_event: Событие отмены обработки
+        safe_mode: Безопасная конфигурация для повторной попытки
+        thread_plan: Бюджет потоков и ядер задания при параллельной обработке
+        encode_profile: Профиль кодирования (по умолчанию сбалансированный)
+        segment_jobs: Сколько отрезков файла кодировать одновременно
+        piped_input: Вход из канала вместо файла in_path
     """
+    if safe_mode:
+        codec = 'libx264'
+    elif not has_encoder(codec):
+        # Сборка FFmpeg без выбранного аппаратного кодировщика
+        logging.warning(f"Encoder '{codec}' is not available in this FFmpeg build, using libx264")
+        codec = 'libx264'
+    thread_plan = thread_plan or ThreadPlan()
+    encode_profile = encode_profile or EncodeProfile()
+    
     # Определение типов входных файлов
-    is_gif_input = in_path.lower().endswith('.gif')
+    is_gif_input = not piped_input and in_path.lower().endswith('.gif')
     is_gif_overlay = overlay_file and overlay_file.lower().endswith('.gif')
+    has_overlay_audio = bool(overlay_audio_path and os.path.exists(overlay_audio_path))
+    
+    # GIF зацикливается только под длину наложенного аудио (с -shortest),
+    # иначе бесконечный вход не дал бы FFmpeg завершиться
+    loop_input = is_gif_input and has_overlay_audio
     
-    cmd = []
+    cmd = thread_plan.global_args()
     input_streams = []
     
     # Настройка входного потока
     if is_gif_input:
-        cmd.extend(['-stream_loop', '-1', '-i', in_path])
+        if loop_input:
+            cmd.extend(['-stream_loop', '-1'])
+        cmd.extend(thread_plan.input_args())
+        cmd.extend(['-i', in_path])
         input_streams.append({'type': 'video', 'index': 0, 'path': in_path})
         has_real_audio = False
+    elif piped_input:
+        cmd.extend(thread_plan.input_args())
+        cmd.extend(['-i', 'pipe:0'])
+        input_streams.append({'type': 'video+audio', 'index': 0, 'path': 'pipe:0'})
+        has_real_audio = piped_input.has_audio
     else:
+        cmd.extend(thread_plan.input_args())
         cmd.extend(['-i', in_path])
         input_streams.append({'type': 'video+audio', 'index': 0, 'path': in_path})
         has_real_audio = True
     
-    # Метки потоков
-    main_video_stream_label = '[0:v]'
-    main_audio_stream_label = '[0:a]' if has_real_audio else None
-    overlay_stream_label = None
+    # Индексы дополнительных входов
+    overlay_input_index = None
+    overlay_audio_index = None
+    
+    prepared_overlay = None
     
     # Добавление файла оверлея
     if overlay_file and os.path.exists(overlay_file):
         overlay_input_index = len(input_streams)
+        prepared_overlay = None if safe_mode else _prepare_overlay_or_none(overlay_file)
+        overlay_input_path = prepared_overlay.path if prepared_overlay else overlay_file
         
         if is_gif_overlay:
-            cmd.extend(['-stream_loop', '-1', '-i', overlay_file])
+            cmd.extend(['-stream_loop', '-1', '-i', overlay_input_path])
         else:
-            cmd.extend(['-i', overlay_file])
+            cmd.extend(['-i', overlay_input_path])
         
-        input_streams.append({'type': 'overlay', 'index': overlay_input_index, 'path': overlay_file})
-        overlay_stream_label = f'[{overlay_input_index}:v]'
-    else:
-        is_gif_overlay = False
+        input_streams.append({'type': 'overlay', 'index': overlay_input_index, 'path': overlay_input_path})
     
-    # Добавление аудио оверлея
-    overlay_audio_stream_label = None
-    if overlay_audio_path and os.path.exists(overlay_audio_path):
+    # Добавление аудио оверлея (декодированного заранее, если получилось)
+    # с частотой исходного звука; к ней же приводятся дорожки перед amerge
+    mix_sample_rate = OVERLAY_AUDIO_DEFAULT_SAMPLE_RATE
+    if has_overlay_audio:
         overlay_audio_index = len(input_streams)
+        if not safe_mode:
+            source_sample_rate = piped_input.sample_rate if piped_input else _source_sample_rate(in_path)
+            mix_sample_rate = source_sample_rate or OVERLAY_AUDIO_DEFAULT_SAMPLE_RATE
+            overlay_audio_path = _prepare_overlay_audio_or_none(overlay_audio_path, mix_sample_rate) \
+                or overlay_audio_path
         cmd.extend(['-i', overlay_audio_path])
         input_streams.append({'type': 'audio_overlay', 'index': overlay_audio_index, 'path': overlay_audio_path})
-        overlay_audio_stream_label = f'[{overlay_audio_index}:a]'
-    
-    # Построение filter_complex
-    filter_complex_parts = []
-    last_video_node = main_video_stream_label
-    node_idx = 0
-    
-    # Применение фильтра обрезки
-    if crop_filter:
-        new_node_label = f'[v{node_idx}]'
-        filter_complex_parts.append(f'{last_video_node}{crop_filter}{new_node_label}')
-        last_video_node = new_node_label
-        node_idx += 1
-    
-    # Настройка целевых размеров
-    target_w, target_h = REELS_WIDTH, REELS_HEIGHT
-    is_reels_format = output_format == REELS_FORMAT_NAME
-    
-    # Форматирование для reels
-    if is_reels_format:
-        if blur_background:
-            # С размытым фоном
-            filter_complex_parts.append(
-                f'{last_video_node}split[original][original_copy];'
-                f'[original_copy]scale={target_w}:{target_h}:force_original_aspect_ratio=increase,'
-                f'crop={target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2,'
-                f'gblur=sigma=25[bg];'
-                f'[original]scale={target_w}:{target_h}:force_original_aspect_ratio=decrease[fg];'
-                f'[bg][fg]overlay=x=(W-w)/2:y=(H-h)/2:shortest=1[formatted]'
-            )
-        else:
-            # С черными полосами
-            filter_complex_parts.append(
-                f'{last_video_node}scale={target_w}:{target_h}:force_original_aspect_ratio=decrease,'
-                f'pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black[formatted]'
+    
+    # Построение filter_complex из общего графа фильтров
+    spec = GraphSpec(
+        filter_templates=resolve_filter_templates(filters),
+        zoom_factor=zoom_p / 100,
+        speed_factor=speed_p / 100,
+        reels=output_format == REELS_FORMAT_NAME,
+        blur_background=blur_background,
+        blur_mode=blur_mode,
+        crop_filter=crop_filter,
+        srt_path=srt_path if srt_path and subtitle_style else None,
+        subtitle_font_size=(subtitle_style or {}).get('font_size', 36),
+        overlay_input=overlay_input_index,
+        overlay_pos=overlay_pos,
+        overlay_prepared=prepared_overlay is not None,
+        overlay_still=bool(prepared_overlay and prepared_overlay.is_still),
+        overlay_looped=bool(is_gif_overlay),
+        has_audio=has_real_audio,
+        mute_audio=mute_audio,
+        original_volume=original_volume,
+        overlay_audio_input=overlay_audio_index,
+        overlay_volume=overlay_volume,
+        source_size=_piped_dimensions(piped_input) if piped_input else _known_dimensions(in_path),
+        loop_input=loop_input,
+        shortest=loop_input or (not is_gif_input and not has_overlay_audio)
+    )
+    
+    # Ожидаемая длительность результата: скорость, зацикливание и -shortest
+    source_duration = piped_input.duration if piped_input else get_video_duration(in_path)
+    overlay_audio_duration = get_video_duration(overlay_audio_path) if has_overlay_audio else 0
+    duration = expected_output_duration(spec, source_duration, overlay_audio_duration)
+    
+    # При известных длительностях дорожки смешиваются через amerge + pan вместо amix
+    if not safe_mode and has_real_audio and not mute_audio and source_duration > 0 and overlay_audio_duration > 0:
+        spec = replace(spec, audio_mix_duration=max(source_duration, overlay_audio_duration),
+                       audio_mix_sample_rate=mix_sample_rate)
+    
+    # Нетронутые потоки копируются без перекодирования
+    # Копия исходного видео не гарантирует целевой размер файла
+    copy_video = (not safe_mode and not is_gif_input and not piped_input
+                  and encode_profile.name != ENCODE_PROFILE_TARGET_SIZE and _can_copy_video(in_path, spec))
+    copy_audio = not safe_mode and not is_gif_input and not piped_input and _can_copy_audio(in_path, spec)
+    spec = replace(spec, include_video=not copy_video, has_audio=has_real_audio and not copy_audio)
+    two_pass = (not copy_video and not safe_mode and not piped_input
+                and _two_pass_enabled(codec, encode_profile, duration))
+    
+    # Сегментное кодирование длинного файла
+    if segment_jobs > 1 and not safe_mode and not copy_video and not is_gif_input and not two_pass \
+            and not piped_input \
+            and source_duration >= 2 * SEGMENT_MIN_DURATION:
+        frame_rate = _frame_rate(in_path)
+        segments = plan_segments(get_keyframe_times(in_path) if frame_rate else [], source_duration,
+                                 segment_jobs, SEGMENT_MIN_DURATION)
+        if len(segments) > 1:
+            logging.info(f"Encoding '{os.path.basename(in_path)}' in {len(segments)} segments: "
+                         + ', '.join(f'{seg.start:.2f}' for seg in segments))
+            _process_segmented(
+                in_path, out_path, spec, segments, frame_rate, source_duration, duration,
+                overlay_input_path=input_streams[overlay_input_index]['path'] if overlay_input_index else None,
+                overlay_audio_path=overlay_audio_path if has_overlay_audio else None,
+                codec=codec, encode_profile=encode_profile, copy_audio=copy_audio,
+                strip_metadata=strip_metadata, thread_plan=thread_plan,
+                progress_callback=progress_callback, progress_event_callback=progress_event_callback,
+                cancel_event=cancel_event
             )
-        last_video_node = '[formatted]'
-    
-    # Применение фильтров
-    for f_name in filters:
-        f_template = FILTERS.get(f_name)
-        if not f_template or f_name == 'Нет фильтра':
-            continue
-        
-        final_template = ''
-        
-        if f_name == 'Случайный фильтр':
-            # Выбор случайного фильтра
-            possible_filters = [k for k, v in FILTERS.items() 
-                              if v and k not in ('Нет фильтра', 'Случайный фильтр', 'Случ. цвет (яркость/контраст/...)')]
-            if possible_filters:
-                chosen_filter_name = random.choice(possible_filters)
-                final_template = FILTERS[chosen_filter_name]
-        elif f_name == 'Случ. цвет (яркость/контраст/...)':
-            # Случайные цветовые параметры
-            br = random.uniform(-0.15, 0.15)
-            ct = random.uniform(0.8, 1.2)
-            sat = random.uniform(0.8, 1.3)
-            hue = random.uniform(-5, 5)
-            final_template = f_template.format(br=br, ct=ct, sat=sat, hue=hue)
-        else:
-            final_template = f_template
-        
-        if final_template:
-            new_node_label = f'[v{node_idx}]'
-            filter_complex_parts.append(f'{last_video_node}{final_template}{new_node_label}')
-            last_video_node = new_node_label
-            node_idx += 1
-    
-    # Применение зума
-    zoom_factor = zoom_p / 100
-    if abs(zoom_factor - 1) > 1e-5:
-        if zoom_factor >= 1:
-            # Увеличение с последующей обрезкой
-            scale_node = f'[v{node_idx}]'
-            node_idx += 1
-            filter_complex_parts.append(f'{last_video_node}scale=iw*{zoom_factor}:ih*{zoom_factor}:flags=bicubic{scale_node}')
-            
-            crop_node = f'[v{node_idx}]'
-            node_idx += 1
-            
-            if is_reels_format:
-                filter_complex_parts.append(f'{scale_node}crop={target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2{crop_node}')
-            else:
-                filter_complex_parts.append(f'{scale_node}crop=iw/{zoom_factor}:ih/{zoom_factor}:(in_w-iw/{zoom_factor})/2:(in_h-ih/{zoom_factor})/2{crop_node}')
-            
-            last_video_node = crop_node
-        else:
-            # Уменьшение
-            scale_node = f'[v{node_idx}]'
-            node_idx += 1
-            filter_complex_parts.append(f'{last_video_node}scale=iw*{zoom_factor}:ih*{zoom_factor}:flags=bicubic{scale_node}')
-            last_video_node = scale_node
-    
-    # Добавление субтитров
-    if srt_path and subtitle_style:
-        sanitized_srt_path = srt_path.replace('\\', '/').replace(':', '\\:')
-        font_size = subtitle_style.get('font_size', 36)
-        position_code = 2  # Внизу по центру
-        vertical_margin = 70
-        
-        style_params = [
-            f'Alignment={position_code}',
-            'MarginL=25',
-            'MarginR=25',
-            f'MarginV={vertical_margin}',
-            'FontName=Arial',
-            f'FontSize={font_size}',
-            'PrimaryColour=&HFFFFFF',
-            'BorderStyle=1',
-            'OutlineColour=&H000000',
-            'Outline=2',
-            'Shadow=1'
-        ]
-        
-        style_string = '\\,'.join(style_params)
-        new_node_label = f'[v{node_idx}]'
-        node_idx += 1
-        
-        filter_complex_parts.append(f"{last_video_node}subtitles='{sanitized_srt_path}':force_style='{style_string}'{new_node_label}")
-        last_video_node = new_node_label
-    
-    # Обработка аудио
-    speed_factor = speed_p / 100
-    audio_nodes_to_mix = []
-    final_audio_node = None
-    
-    # Оригинальное аудио
-    if has_real_audio and not mute_audio:
-        vol_node = '[a_orig_vol]'
-        filter_complex_parts.append(f'{main_audio_stream_label}volume={original_volume}{vol_node}')
-        audio_nodes_to_mix.append(vol_node)
-    
-    # Аудио оверлей
-    if overlay_audio_stream_label:
-        vol_node = '[a_over_vol]'
-        filter_complex_parts.append(f'{overlay_audio_stream_label}volume={overlay_volume}{vol_node}')
-        audio_nodes_to_mix.append(vol_node)
-    
-    # Микширование аудио
-    if len(audio_nodes_to_mix) > 1:
-        mixed_audio_node = '[a_mixed]'
-        filter_complex_parts.append(f'{"".join(audio_nodes_to_mix)}amix=inputs={len(audio_nodes_to_mix)}:duration=longest[a_mixed]')
-        final_audio_node = mixed_audio_node
-    elif len(audio_nodes_to_mix) == 1:
-        final_audio_node = audio_nodes_to_mix[0]
-    
-    # Изменение скорости аудио
-    if final_audio_node and abs(speed_factor - 1) > 1e-5:
-        speed_audio_node_in = final_audio_node
-        tempo_filters = []
-        current_tempo = speed_factor
-        
-        # Разбиение больших изменений темпа
-        while current_tempo > 2:
-            tempo_filters.append('atempo=2.0')
-            current_tempo /= 2
-        
-        min_tempo = 0.5
-        while current_tempo < min_tempo:
-            tempo_filters.append(f'atempo={min_tempo}')
-            current_tempo /= min_tempo
-        
-        if abs(current_tempo - 1) > 1e-5 and min_tempo <= current_tempo <= 2:
-            tempo_filters.append(f'atempo={current_tempo}')
-        
-        if tempo_filters:
-            audio_filters_str = ','.join(tempo_filters)
-            new_audio_node = '[a_speed]'
-            filter_complex_parts.append(f'{speed_audio_node_in}{audio_filters_str}{new_audio_node}')
-            final_audio_node = new_audio_node
-    
-    # Изменение скорости видео
-    if abs(speed_factor - 1) > 1e-5:
-        new_node_label = '[v_speed]'
-        filter_complex_parts.append(f'{last_video_node}setpts=PTS/{speed_factor}{new_node_label}')
-        last_video_node = new_node_label
-    
-    # Добавление видео оверлея
-    if overlay_stream_label:
-        pos_params = OVERLAY_POSITIONS.get(overlay_pos, 'x=(W-w)/2:y=(H-h)/2')
-        
-        alpha_node = f'[ovl{node_idx}]'
-        node_idx += 1
-        overlay_node = f'[v{node_idx}]'
-        node_idx += 1
-        
-        filter_complex_parts.append(f'{overlay_stream_label}format=rgba{alpha_node}')
-        filter_complex_parts.append(f'{last_video_node}{alpha_node}overlay={pos_params}{overlay_node}')
-        last_video_node = overlay_node
-    
-    # Финальное форматирование
-    filter_complex_parts.append(f'{last_video_node}format=pix_fmts=yuv420p[vout]')
-    
-    if final_audio_node:
-        filter_complex_parts.append(f'{final_audio_node}anull[aout]')
+            return
     
     # Сборка filter_complex
-    fc_string = ';'.join(filter(None, filter_complex_parts))
-    cmd.extend(['-filter_complex', fc_string])
-    cmd.extend(['-map', '[vout]'])
+    fc_string = compile_filter_graph(spec)
+    if fc_string:
+        cmd.extend(['-filter_complex', fc_string])
+    
+    cmd.extend(['-map', '0:v:0' if copy_video else f'[{VIDEO_OUTPUT_LABEL}]'])
     
     # Настройка аудио
-    if final_audio_node:
-        cmd.extend(['-map', '[aout]'])
-        cmd.extend(['-c:a', 'aac', '-b:a', '128k'])
+    if copy_audio:
+        cmd.extend(['-map', '0:a:0', '-c:a', 'copy'])
+    elif spec.has_audio_output:
+        cmd.extend(['-map', f'[{AUDIO_OUTPUT_LABEL}]'])
+        cmd.extend(['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE_KBPS}k'])
     else:
         cmd.append('-an')
-        if is_gif_input:
-            cmd.extend(['-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100', '-shortest'])
     
     # Настройка видеокодека
-    cmd.extend(['-c:v', codec])
-    
-    if 'nvenc' in codec or 'amf' in codec:
-        cmd.extend(['-cq', '24'])
-    elif 'qsv' in codec:
-        cmd.extend(['-global_quality', '24'])
+    if copy_video:
+        cmd.extend(['-c:v', 'copy'])
     else:
-        cmd.extend(['-preset', 'veryfast', '-crf', '24'])
+        cmd.extend(['-c:v', codec])
+        cmd.extend(video_encoder_args(codec, encode_profile, duration))
+        cmd.extend(thread_plan.output_args(codec))
     
     # Удаление метаданных
     if strip_metadata:
         cmd.extend(['-map_metadata', '-1', '-map_chapters', '-1'])
     
     # Дополнительные параметры
-    if not is_gif_input and not overlay_audio_path:
+    if spec.shortest:
         cmd.append('-shortest')
     
-    # Финальная команда
-    final_cmd = ['-y'] + cmd
-    final_cmd.append(out_path)
+    # В безопасном режиме длительность выхода ограничивается явно
+    if safe_mode and duration > 0:
+        cmd.extend(['-t', f'{duration:.3f}'])
+    
+    # Проходы кодирования: один, либо анализ в null-muxer и финальный проход
+    passes = [['-y'] + cmd + [out_path]]
+    passlog_prefix = None
+    if two_pass:
+        passlog_prefix = os.path.join(tempfile.gettempdir(), f'x264pass_{uuid.uuid4().hex}')
+        passes = [
+            ['-y'] + cmd + ['-pass', '1', '-passlogfile', passlog_prefix, '-f', 'null', os.devnull],
+            ['-y'] + cmd + ['-pass', '2', '-passlogfile', passlog_prefix, out_path],
+        ]
     
-    # Запуск FFmpeg
-    duration = get_video_duration(in_path)
-    run_ffmpeg(final_cmd, input_file_for_log=in_path, duration=duration, progress_callback=progress_callback)
+    try:
+        for pass_index, final_cmd in enumerate(passes):
+            # Запуск FFmpeg
+            run_ffmpeg(final_cmd, input_file_for_log=in_path, duration=duration,
+                       progress_callback=_pass_percent(progress_callback, pass_index, len(passes)),
+                       progress_event_callback=_pass_progress(progress_event_callback, pass_index, len(passes)),
+                       cancel_event=cancel_event, cpu_set=thread_plan.cpu_set,
+                       input_command=piped_input.command if piped_input else None,
+                       input_tool=piped_input.tool if piped_input else TOOL_YTDLP)
+    finally:
+        if passlog_prefix:
+            pass_dir = os.path.dirname(passlog_prefix)
+            for name in os.listdir(pass_dir):
+                if name.startswith(os.path.basename(passlog_prefix)):
+                    os.remove(os.path.join(pass_dir, name))
 
 
 def generate_preview(
@@ -707,6 +1478,7 @@ def generate_preview(
     overlay_pos: str = "center",
     output_format: str = "jpg",
     blur_background: bool = False,
+    blur_mode: str = BLUR_MODE_QUALITY,
     crop_filter: Optional[str] = None
 ) -> None:
     """
@@ -721,6 +1493,7 @@ def generate_preview(
         overlay_pos: Позиция оверлея
         output_format: Формат выходного файла
         blur_background: Размытие фона для формата reels
+        blur_mode: Режим размытия фона (BLUR_MODE_QUALITY или BLUR_MODE_FAST)
         crop_filter: Фильтр обрезки
     """
     is_gif_input = in_path.lower().endswith('.gif')
@@ -739,140 +1512,37 @@ def generate_preview(
         cmd.extend(['-ss', str(mid_point)])
     
     # Входные файлы
-    input_files = ['-i', in_path]
-    
-    if overlay_file and os.path.exists(overlay_file):
-        input_files.extend(['-i', overlay_file])
-    
-    cmd.extend(input_files)
+    cmd.extend(['-i', in_path])
     
-    # Построение filter_complex
-    filter_complex_parts = []
-    main_video_stream_label = '[0:v]'
-    
-    overlay_stream_label = None
+    overlay_input_index = None
+    prepared_overlay = None
     if overlay_file and os.path.exists(overlay_file):
-        overlay_stream_label = '[1:v]'
-    
-    last_video_node = main_video_stream_label
-    node_idx = 0
-    
-    # Применение фильтра обрезки
-    if crop_filter:
-        new_node_label = f'[v{node_idx}]'
-        filter_complex_parts.append(f'{last_video_node}{crop_filter}{new_node_label}')
-        last_video_node = new_node_label
-        node_idx += 1
-    
-    # Настройка целевых размеров
-    target_w, target_h = REELS_WIDTH, REELS_HEIGHT
-    is_reels_format = output_format == REELS_FORMAT_NAME
-
-    # Форматирование для reels
-    if is_reels_format:
-        if blur_background:
-            # С размытым фоном
-            filter_complex_parts.append(
-                f'{last_video_node}split[original][original_copy];'
-                f'[original_copy]scale={target_w}:{target_h}:force_original_aspect_ratio=increase,'
-                f'crop={target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2,'
-                f'gblur=sigma=25[bg];'
-                f'[original]scale={target_w}:{target_h}:force_original_aspect_ratio=decrease[fg];'
-                f'[bg][fg]overlay=x=(W-w)/2:y=(H-h)/2[formatted]'
-            )
-        else:
-            # С черными полосами
-            filter_complex_parts.append(
-                f'{last_video_node}scale={target_w}:{target_h}:force_original_aspect_ratio=decrease,'
-                f'pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black[formatted]'
-            )
-        last_video_node = '[formatted]'
-    
-    # Проверка наличия случайного фильтра в списке
-    is_random_filter_in_list = 'Случайный фильтр' in filters
-    
-    # Применение фильтров
-    for f_name in filters:
-        f_template = FILTERS.get(f_name)
-        if not f_template or f_name == 'Нет фильтра':
-            continue
-        
-        # Пропускаем обычные фильтры если есть случайный
-        if is_random_filter_in_list and f_name != 'Случайный фильтр':
-            continue
-        
-        final_template = ''
-        
-        if f_name == 'Случайный фильтр':
-            # Для превью используем фиксированный фильтр "Сепия"
-            final_template = FILTERS.get('Сепия', '')
-        elif f_name == 'Случ. цвет (яркость/контраст/...)':
-            # Фиксированные параметры для превью
-            br = 0.1
-            ct = 1.1
-            sat = 1.1
-            hue = 2
-            final_template = f_template.format(br=br, ct=ct, sat=sat, hue=hue)
-        else:
-            final_template = f_template
-        
-        if final_template:
-            new_node_label = f'[v{node_idx}]'
-            filter_complex_parts.append(f'{last_video_node}{final_template}{new_node_label}')
-            last_video_node = new_node_label
-            node_idx += 1
-    
-    # Применение зума
-    zoom_factor = zoom_p / 100
-    if abs(zoom_factor - 1) > 1e-5:
-        if zoom_factor >= 1:
-            # Увеличение с последующей обрезкой
-            scale_node = f'[v{node_idx}]'
-            node_idx += 1
-            filter_complex_parts.append(f'{last_video_node}scale=iw*{zoom_factor}:ih*{zoom_factor}:flags=bicubic{scale_node}')
-            
-            crop_node = f'[v{node_idx}]'
-            node_idx += 1
-            
-            if is_reels_format:
-                filter_complex_parts.append(f'{scale_node}crop={target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2{crop_node}')
-            else:
-                filter_complex_parts.append(f'{scale_node}crop=iw/{zoom_factor}:ih/{zoom_factor}:(in_w-iw/{zoom_factor})/2:(in_h-ih/{zoom_factor})/2{crop_node}')
-            
-            last_video_node = crop_node
-        else:
-            # Уменьшение
-            scale_node = f'[v{node_idx}]'
-            node_idx += 1
-            filter_complex_parts.append(f'{last_video_node}scale=iw*{zoom_factor}:ih*{zoom_factor}:flags=bicubic{scale_node}')
-            last_video_node = scale_node
-    
-    # Добавление видео оверлея
-    if overlay_stream_label:
-        pos_params = OVERLAY_POSITIONS.get(overlay_pos, 'x=(W-w)/2:y=(H-h)/2')
-        
-        alpha_node = f'[ovl{node_idx}]'
-        node_idx += 1
-        overlay_node = f'[v{node_idx}]'
-        node_idx += 1
-        
-        filter_complex_parts.append(f'{overlay_stream_label}format=rgba{alpha_node}')
-        filter_complex_parts.append(f'{last_video_node}{alpha_node}overlay={pos_params}{overlay_node}')
-        last_video_node = overlay_node
-    
-    # Финальное форматирование
-    filter_complex_parts.append(f'{last_video_node}format=rgba[vout]')
-    
-    # Сборка filter_complex
-    fc_string = ';'.join(filter(None, filter_complex_parts))
-    
-    if fc_string:
-        cmd.extend(['-filter_complex', fc_string])
-        cmd.extend(['-map', '[vout]'])
+        prepared_overlay = _prepare_overlay_or_none(overlay_file)
+        cmd.extend(['-i', prepared_overlay.path if prepared_overlay else overlay_file])
+        overlay_input_index = 1
+    
+    # Тот же граф, что и при финальной обработке. Случайные фильтры
+    # разрешаются с зерном от пути файла, чтобы превью было стабильным.
+    spec = GraphSpec(
+        filter_templates=resolve_filter_templates(filters, random.Random(in_path)),
+        zoom_factor=zoom_p / 100,
+        reels=output_format == REELS_FORMAT_NAME,
+        blur_background=blur_background,
+        blur_mode=blur_mode,
+        crop_filter=crop_filter,
+        overlay_input=overlay_input_index,
+        overlay_pos=overlay_pos,
+        overlay_prepared=prepared_overlay is not None,
+        overlay_still=bool(prepared_overlay and prepared_overlay.is_still),
+        source_size=_known_dimensions(in_path)
+    ).for_preview()
+    
+    cmd.extend(['-filter_complex', compile_filter_graph(spec)])
+    cmd.extend(['-map', f'[{VIDEO_OUTPUT_LABEL}]'])
     
     # Генерация одного кадра
     cmd.extend(['-vframes', '1'])
     cmd.append(out_path)
     
     # Запуск FFmpeg
-    run_ffmpeg(cmd, input_file_for_log=in_path)
\ No newline at end of file
+    run_ffmpeg(cmd, input_file_for_log=in_path)
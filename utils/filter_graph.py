@@ -0,0 +1,1052 @@
+"""
+Filter graph module for building FFmpeg filter_complex strings.
+Модуль построения графа фильтров FFmpeg (filter_complex).
+
+Граф описывается типизированными узлами (FilterNode), объединёнными в
+линейные цепочки (FilterChain) между метками потоков. Один и тот же
+построитель используется и для финального рендера, и для предпросмотра,
+поэтому их цепочки не расходятся.
+"""
+
+import random
+import re
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from utils.constants import (
+    BLUR_FAST_DOWNSCALE,
+    BLUR_MODE_FAST,
+    BLUR_MODE_QUALITY,
+    BLUR_SIGMA,
+    FILTERS,
+    OVERLAY_POSITIONS,
+    REELS_WIDTH,
+    REELS_HEIGHT,
+)
+
+
+# Служебные названия фильтров из FILTERS
+NO_FILTER_NAME = 'Нет фильтра'
+RANDOM_FILTER_NAME = 'Случайный фильтр'
+RANDOM_COLOR_FILTER_NAME = 'Случ. цвет (яркость/контраст/...)'
+
+# Метки финальных потоков графа
+VIDEO_OUTPUT_LABEL = 'vout'
+AUDIO_OUTPUT_LABEL = 'aout'
+
+# Алгоритмы масштабирования по стадиям графа
+SCALER_FLAGS = {
+    'downscale': 'area',
+    'upscale': 'bicubic',
+    'background': 'fast_bilinear',
+    'background_down': 'area',
+    'background_up': 'bilinear',
+}
+
+# Ключи eq, которые можно объединять арифметически
+_EQ_MERGEABLE_KEYS = {'brightness', 'contrast', 'saturation'}
+
+
+@dataclass
+class FilterNode:
+    """Один фильтр FFmpeg (узел графа), например scale=1080:1920."""
+    name: str
+    args: str = ''
+
+    def render(self) -> str:
+        return f'{self.name}={self.args}' if self.args else self.name
+
+
+@dataclass
+class FilterChain:
+    """Линейная цепочка фильтров между входными и выходными метками."""
+    inputs: List[str]
+    nodes: List[FilterNode]
+    outputs: List[str]
+    media: str = 'video'
+
+    def render(self) -> str:
+        ins = ''.join(f'[{label}]' for label in self.inputs)
+        outs = ''.join(f'[{label}]' for label in self.outputs)
+        return ins + ','.join(node.render() for node in self.nodes) + outs
+
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    """
+    Разбивает строку по разделителю, не трогая кавычки, экранирование
+    и выражения в скобках.
+    """
+    parts = []
+    current = []
+    depth = 0
+    in_quotes = False
+    escaped = False
+
+    for ch in text:
+        if escaped:
+            current.append(ch)
+            escaped = False
+            continue
+        if ch == '\\':
+            current.append(ch)
+            escaped = True
+            continue
+        if ch == "'":
+            in_quotes = not in_quotes
+        elif not in_quotes and ch == '(':
+            depth += 1
+        elif not in_quotes and ch == ')':
+            depth -= 1
+        elif not in_quotes and depth == 0 and ch == separator:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(ch)
+
+    parts.append(''.join(current))
+    return parts
+
+
+def parse_filter_chain(text: str) -> List[FilterNode]:
+    """
+    Разбирает текстовую цепочку фильтров (шаблон из FILTERS) в список узлов.
+
+    Args:
+        text: Цепочка вида 'eq=contrast=1.5,hue=s=0'
+
+    Returns:
+        Список узлов FilterNode
+    """
+    nodes = []
+    for part in _split_top_level(text, ','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, args = part.partition('=')
+        nodes.append(FilterNode(name.strip(), args))
+    return nodes
+
+
+def _parse_args(args: str) -> Tuple[List[str], Dict[str, str]]:
+    """Разбирает аргументы фильтра на позиционные и именованные."""
+    positional = []
+    named = {}
+    if not args:
+        return positional, named
+
+    for item in _split_top_level(args, ':'):
+        key, sep, value = item.partition('=')
+        if sep and re.fullmatch(r'[A-Za-z_]+', key):
+            named[key] = value
+        else:
+            positional.append(item)
+    return positional, named
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    """Преобразует строку в число, если это литерал без выражений."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _fmt_num(value: float) -> str:
+    """Детерминированное текстовое представление числа для графа."""
+    text = f'{value:.6f}'.rstrip('0').rstrip('.')
+    return text if text not in ('', '-0') else '0'
+
+
+def _named_values(node: FilterNode, order: Tuple[str, ...]) -> Optional[Dict[str, str]]:
+    """
+    Возвращает аргументы узла в виде словаря, раскладывая позиционные
+    значения по порядку order. None, если позиционных значений слишком много.
+    """
+    positional, named = _parse_args(node.args)
+    if len(positional) > len(order):
+        return None
+    values = dict(zip(order, positional))
+    for key, value in named.items():
+        values[key] = value
+    return values
+
+
+def _is_noop(node: FilterNode) -> bool:
+    """Проверяет, что узел не изменяет поток."""
+    name = node.name
+
+    if name in ('null', 'anull'):
+        return True
+
+    if name in ('volume', 'atempo'):
+        values = _named_values(node, ('volume',) if name == 'volume' else ('tempo',))
+        if values is None or len(values) != 1:
+            return False
+        return _to_float(next(iter(values.values()))) == 1.0
+
+    if name == 'setpts':
+        expr = node.args.replace(' ', '')
+        if expr == 'PTS':
+            return True
+        match = re.fullmatch(r'PTS[/*]([0-9.]+)', expr)
+        return bool(match) and _to_float(match.group(1)) == 1.0
+
+    if name == 'scale':
+        values = _named_values(node, ('w', 'h'))
+        if values is None:
+            return False
+        w = values.pop('w', values.pop('width', None))
+        h = values.pop('h', values.pop('height', None))
+        values.pop('flags', None)
+        if values:
+            return False
+        return _is_identity_dim(w, 'iw') and _is_identity_dim(h, 'ih')
+
+    if name == 'crop':
+        values = _named_values(node, ('w', 'h', 'x', 'y'))
+        if values is None:
+            return False
+        w = values.pop('w', values.pop('out_w', None))
+        h = values.pop('h', values.pop('out_h', None))
+        x = values.pop('x', '0')
+        y = values.pop('y', '0')
+        if values:
+            return False
+        return (_is_identity_dim(w, 'iw') and _is_identity_dim(h, 'ih')
+                and _to_float(x) == 0 and _to_float(y) == 0)
+
+    if name == 'eq':
+        values = _named_values(node, ('contrast', 'brightness', 'saturation', 'gamma'))
+        if values is None:
+            return False
+        defaults = {'brightness': 0.0, 'contrast': 1.0, 'saturation': 1.0, 'gamma': 1.0}
+        for key, value in values.items():
+            if key not in defaults or _to_float(value) != defaults[key]:
+                return False
+        return True
+
+    if name == 'hue':
+        values = _named_values(node, ('h', 's'))
+        if values is None:
+            return False
+        defaults = {'h': 0.0, 's': 1.0}
+        for key, value in values.items():
+            if key not in defaults or _to_float(value) != defaults[key]:
+                return False
+        return True
+
+    return False
+
+
+def _is_identity_dim(value: Optional[str], input_name: str) -> bool:
+    """Проверяет, что выражение размера равно входному размеру (iw, iw*1.0...)."""
+    if value is None:
+        return False
+    expr = value.replace(' ', '')
+    aliases = {'iw': ('iw', 'in_w'), 'ih': ('ih', 'in_h')}[input_name]
+    if expr in aliases:
+        return True
+    match = re.fullmatch(r'(\w+)[*/]([0-9.]+)', expr)
+    return bool(match) and match.group(1) in aliases and _to_float(match.group(2)) == 1.0
+
+
+def _merge_eq(first: FilterNode, second: FilterNode) -> Optional[FilterNode]:
+    """
+    Объединяет два последовательных eq в один.
+
+    eq применяет v' = contrast * (v - 0.5) + 0.5 + brightness, поэтому
+    композиция двух узлов снова является eq (без учета промежуточного клиппинга).
+    """
+    a = _named_values(first, ('contrast', 'brightness', 'saturation'))
+    b = _named_values(second, ('contrast', 'brightness', 'saturation'))
+    if a is None or b is None:
+        return None
+    if not set(a) <= _EQ_MERGEABLE_KEYS or not set(b) <= _EQ_MERGEABLE_KEYS:
+        return None
+
+    defaults = {'brightness': '0', 'contrast': '1', 'saturation': '1'}
+    first_nums = {key: _to_float(a.get(key, default)) for key, default in defaults.items()}
+    second_nums = {key: _to_float(b.get(key, default)) for key, default in defaults.items()}
+    if None in first_nums.values() or None in second_nums.values():
+        return None
+
+    contrast = first_nums['contrast'] * second_nums['contrast']
+    brightness = second_nums['contrast'] * first_nums['brightness'] + second_nums['brightness']
+    saturation = first_nums['saturation'] * second_nums['saturation']
+
+    params = []
+    if brightness != 0:
+        params.append(f'brightness={_fmt_num(brightness)}')
+    if contrast != 1:
+        params.append(f'contrast={_fmt_num(contrast)}')
+    if saturation != 1:
+        params.append(f'saturation={_fmt_num(saturation)}')
+    return FilterNode('eq', ':'.join(params))
+
+
+def _merge_crop(first: FilterNode, second: FilterNode) -> Optional[FilterNode]:
+    """Объединяет два последовательных crop с числовыми параметрами."""
+    a = _named_values(first, ('w', 'h', 'x', 'y'))
+    b = _named_values(second, ('w', 'h', 'x', 'y'))
+    if a is None or b is None or not set(a) <= {'w', 'h', 'x', 'y'} or not set(b) <= {'w', 'h', 'x', 'y'}:
+        return None
+
+    w1, h1 = _to_float(a.get('w')), _to_float(a.get('h'))
+    w2, h2 = _to_float(b.get('w')), _to_float(b.get('h'))
+    if None in (w1, h1, w2, h2):
+        return None
+
+    x1, y1 = _to_float(a.get('x')), _to_float(a.get('y'))
+    x2 = _to_float(b.get('x', _fmt_num((w1 - w2) / 2)))
+    y2 = _to_float(b.get('y', _fmt_num((h1 - h2) / 2)))
+    if None in (x1, y1, x2, y2):
+        return None
+
+    return FilterNode('crop', ':'.join(_fmt_num(v) for v in (w2, h2, x1 + x2, y1 + y2)))
+
+
+def _merge_scale(first: FilterNode, second: FilterNode) -> Optional[FilterNode]:
+    """
+    Убирает scale, за которым сразу следует scale с абсолютными размерами:
+    итоговый размер не зависит от первого масштабирования. Размеры -1/-2
+    (сохранить пропорции) считаются от результата первого scale, поэтому
+    такие пары не объединяются.
+    """
+    a = _named_values(first, ('w', 'h'))
+    b = _named_values(second, ('w', 'h'))
+    if a is None or b is None:
+        return None
+
+    # Масштабирование с neighbor - художественный эффект (пикселизация)
+    if 'neighbor' in a.get('flags', ''):
+        return None
+    if not set(a) <= {'w', 'h', 'flags', 'force_original_aspect_ratio'}:
+        return None
+    if not set(b) <= {'w', 'h', 'flags'}:
+        return None
+    width, height = _to_float(b.get('w')), _to_float(b.get('h'))
+    if width is None or height is None or width <= 0 or height <= 0:
+        return None
+    return second
+
+
+_MERGERS = {
+    'eq': _merge_eq,
+    'crop': _merge_crop,
+    'scale': _merge_scale,
+}
+
+
+def _merge_adjacent(nodes: List[FilterNode]) -> List[FilterNode]:
+    """Объединяет соседние однотипные узлы scale/crop/eq и format."""
+    result: List[FilterNode] = []
+    for node in nodes:
+        if result and result[-1].name == node.name:
+            previous = result[-1]
+            if node.name == 'format':
+                result[-1] = node
+                continue
+            merger = _MERGERS.get(node.name)
+            merged = merger(previous, node) if merger else None
+            if merged is not None:
+                result[-1] = merged
+                if _is_noop(merged):
+                    result.pop()
+                continue
+        result.append(node)
+    return result
+
+
+class FilterGraph:
+    """
+    Направленный ациклический граф фильтров FFmpeg.
+
+    Узлы добавляются цепочками, связанными метками потоков. Метод optimize()
+    убирает пустые узлы, объединяет соседние scale/crop/eq и склеивает
+    линейные цепочки, compile() возвращает строку для -filter_complex.
+    """
+
+    def __init__(self):
+        self.chains: List[FilterChain] = []
+        self.outputs: List[str] = []
+        self._label_counters: Dict[str, int] = {}
+        self._compiled: Optional[str] = None
+
+    def new_label(self, prefix: str = 'v') -> str:
+        """Создает новую уникальную метку потока."""
+        index = self._label_counters.get(prefix, 0)
+        self._label_counters[prefix] = index + 1
+        return f'{prefix}{index}'
+
+    def add(self, inputs: List[str], nodes: List[FilterNode],
+            outputs: Optional[List[str]] = None, media: str = 'video') -> List[str]:
+        """
+        Добавляет цепочку фильтров в граф.
+
+        Args:
+            inputs: Входные метки (без квадратных скобок), например ['0:v']
+            nodes: Узлы цепочки
+            outputs: Выходные метки; если не заданы, создается одна новая
+            media: Тип потока ('video' или 'audio')
+
+        Returns:
+            Список выходных меток цепочки
+        """
+        if outputs is None:
+            outputs = [self.new_label('v' if media == 'video' else 'a')]
+        self.chains.append(FilterChain(list(inputs), list(nodes), list(outputs), media))
+        self._compiled = None
+        return list(outputs)
+
+    def mark_output(self, label: str) -> None:
+        """Помечает метку как финальный выход графа (используется в -map)."""
+        if label not in self.outputs:
+            self.outputs.append(label)
+
+    def _consumers(self, label: str) -> List[FilterChain]:
+        return [chain for chain in self.chains if label in chain.inputs]
+
+    def _fuse_linear_chains(self) -> bool:
+        """Склеивает цепочку с единственным потребителем её выхода."""
+        for chain in self.chains:
+            if len(chain.outputs) != 1 or chain.outputs[0] in self.outputs:
+                continue
+            consumers = self._consumers(chain.outputs[0])
+            if len(consumers) != 1 or consumers[0].inputs != chain.outputs:
+                continue
+            consumer = consumers[0]
+            consumer.inputs = list(chain.inputs)
+            consumer.nodes = chain.nodes + consumer.nodes
+            self.chains.remove(chain)
+            return True
+        return False
+
+    def _drop_empty_chains(self) -> bool:
+        """Удаляет пустые цепочки, перенаправляя их потребителей на вход."""
+        for chain in self.chains:
+            if chain.nodes or len(chain.inputs) != 1 or len(chain.outputs) != 1:
+                continue
+            if chain.outputs[0] in self.outputs:
+                continue
+            for consumer in self._consumers(chain.outputs[0]):
+                consumer.inputs = [chain.inputs[0] if label == chain.outputs[0] else label
+                                   for label in consumer.inputs]
+            self.chains.remove(chain)
+            return True
+        return False
+
+    def optimize(self) -> 'FilterGraph':
+        """Оптимизирует граф на месте и возвращает его же."""
+        changed = True
+        while changed:
+            for chain in self.chains:
+                chain.nodes = _merge_adjacent([node for node in chain.nodes if not _is_noop(node)])
+            changed = self._drop_empty_chains() or self._fuse_linear_chains()
+
+        # Финальной метке нужен хотя бы один фильтр
+        for chain in self.chains:
+            if not chain.nodes:
+                chain.nodes = [FilterNode('null' if chain.media == 'video' else 'anull')]
+
+        self._compiled = None
+        return self
+
+    def is_passthrough(self, media: str) -> bool:
+        """
+        Сводится ли поток данного типа к входу 0 без изменений.
+
+        Для видео допускается только финальный format: совпадение
+        пиксельного формата с исходным проверяет вызывающий код.
+        """
+        chains = [chain for chain in self.chains if chain.media == media]
+        if len(chains) != 1 or chains[0].inputs != [f'0:{media[0]}']:
+            return False
+        allowed = {'format', 'null'} if media == 'video' else {'anull'}
+        return all(node.name in allowed for node in chains[0].nodes)
+
+    def compile(self) -> str:
+        """Возвращает строку filter_complex (результат кешируется)."""
+        if self._compiled is None:
+            self._compiled = ';'.join(chain.render() for chain in self.chains)
+        return self._compiled
+
+
+def resolve_filter_templates(filters: List[str], rng: Optional[random.Random] = None) -> Tuple[str, ...]:
+    """
+    Превращает названия фильтров в конкретные шаблоны FFmpeg.
+
+    Случайные фильтры разрешаются здесь, до построения графа, чтобы граф
+    был детерминированным. Для предпросмотра передается rng с фиксированным
+    зерном, поэтому кадр не меняется между обновлениями.
+
+    Args:
+        filters: Список названий фильтров из FILTERS
+        rng: Генератор случайных чисел (по умолчанию модуль random)
+
+    Returns:
+        Кортеж строк-шаблонов фильтров
+    """
+    rng = rng or random
+    templates = []
+
+    for f_name in filters:
+        f_template = FILTERS.get(f_name)
+        if not f_template or f_name == NO_FILTER_NAME:
+            continue
+
+        final_template = ''
+
+        if f_name == RANDOM_FILTER_NAME:
+            # Выбор случайного фильтра
+            possible_filters = [k for k, v in FILTERS.items()
+                                if v and k not in (NO_FILTER_NAME, RANDOM_FILTER_NAME, RANDOM_COLOR_FILTER_NAME)]
+            if possible_filters:
+                chosen_filter_name = rng.choice(possible_filters)
+                final_template = FILTERS[chosen_filter_name]
+        elif f_name == RANDOM_COLOR_FILTER_NAME:
+            # Случайные цветовые параметры
+            br = round(rng.uniform(-0.15, 0.15), 3)
+            ct = round(rng.uniform(0.8, 1.2), 3)
+            sat = round(rng.uniform(0.8, 1.3), 3)
+            hue = round(rng.uniform(-5, 5), 3)
+            final_template = f_template.format(br=br, ct=ct, sat=sat, hue=hue)
+        else:
+            final_template = f_template
+
+        if final_template:
+            templates.append(final_template)
+
+    return tuple(templates)
+
+
+@dataclass(frozen=True)
+class GraphSpec:
+    """
+    Полное, уже разрешенное описание обработки одного файла.
+
+    Все случайные параметры выбраны заранее, поэтому одинаковый GraphSpec
+    всегда дает одинаковую строку filter_complex.
+    """
+    filter_templates: Tuple[str, ...] = ()
+    zoom_factor: float = 1.0
+    speed_factor: float = 1.0
+    reels: bool = False
+    blur_background: bool = False
+    blur_mode: str = BLUR_MODE_QUALITY
+    crop_filter: Optional[str] = None
+    srt_path: Optional[str] = None
+    subtitle_font_size: int = 36
+    overlay_input: Optional[int] = None
+    overlay_pos: str = 'center'
+    overlay_prepared: bool = False
+    overlay_still: bool = False
+    overlay_looped: bool = False
+    has_audio: bool = True
+    mute_audio: bool = False
+    original_volume: float = 1.0
+    overlay_audio_input: Optional[int] = None
+    overlay_volume: float = 1.0
+    audio_mix_duration: float = 0.0  # Общая длина дорожек для amerge (0 - неизвестна, amix)
+    audio_mix_sample_rate: int = 0  # Частота, к которой приводятся дорожки перед amerge (0 - не менять)
+    output_pix_fmt: str = 'yuv420p'
+    include_video: bool = True
+    loop_input: bool = False
+    shortest: bool = False
+    source_size: Optional[Tuple[int, int]] = None
+    optimize: bool = True
+
+    @property
+    def has_audio_output(self) -> bool:
+        """Будет ли у графа аудиовыход."""
+        return (self.has_audio and not self.mute_audio) or self.overlay_audio_input is not None
+
+    def for_preview(self) -> 'GraphSpec':
+        """Вариант графа для одного кадра предпросмотра (без аудио и скорости)."""
+        return replace(
+            self,
+            speed_factor=1.0,
+            has_audio=False,
+            overlay_audio_input=None,
+            output_pix_fmt='rgba'
+        )
+
+
+def _subtitles_node(srt_path: str, font_size: int) -> FilterNode:
+    """Узел субтитров со стилем по умолчанию."""
+    sanitized_srt_path = srt_path.replace('\\', '/').replace(':', '\\:')
+    position_code = 2  # Внизу по центру
+    vertical_margin = 70
+
+    style_params = [
+        f'Alignment={position_code}',
+        'MarginL=25',
+        'MarginR=25',
+        f'MarginV={vertical_margin}',
+        'FontName=Arial',
+        f'FontSize={font_size}',
+        'PrimaryColour=&HFFFFFF',
+        'BorderStyle=1',
+        'OutlineColour=&H000000',
+        'Outline=2',
+        'Shadow=1'
+    ]
+
+    style_string = '\\,'.join(style_params)
+    return FilterNode('subtitles', f"'{sanitized_srt_path}':force_style='{style_string}'")
+
+
+def _atempo_nodes(speed_factor: float) -> List[FilterNode]:
+    """Разбивает изменение темпа на допустимые для atempo шаги (0.5..2.0)."""
+    tempo_filters = []
+    current_tempo = speed_factor
+
+    while current_tempo > 2:
+        tempo_filters.append(FilterNode('atempo', '2.0'))
+        current_tempo /= 2
+
+    min_tempo = 0.5
+    while current_tempo < min_tempo:
+        tempo_filters.append(FilterNode('atempo', f'{min_tempo}'))
+        current_tempo /= min_tempo
+
+    if abs(current_tempo - 1) > 1e-5 and min_tempo <= current_tempo <= 2:
+        tempo_filters.append(FilterNode('atempo', f'{current_tempo}'))
+
+    return tempo_filters
+
+
+def _even(value: float) -> int:
+    """Округляет размер до четного (требование yuv420p)."""
+    return max(2, int(round(value / 2)) * 2)
+
+
+def _scaler_flags(src_w: float, dst_w: float) -> str:
+    """Выбирает алгоритм масштабирования для стадии."""
+    return SCALER_FLAGS['downscale'] if dst_w < src_w else SCALER_FLAGS['upscale']
+
+
+def _parse_crop_box(crop_filter: Optional[str]) -> Optional[Tuple[int, int, int, int]]:
+    """Извлекает числовую область обрезки (w, h, x, y) из строки 'crop=w:h:x:y'."""
+    if not crop_filter:
+        return None
+    nodes = parse_filter_chain(crop_filter)
+    if len(nodes) != 1 or nodes[0].name != 'crop':
+        return None
+    values = _named_values(nodes[0], ('w', 'h', 'x', 'y'))
+    if values is None:
+        return None
+    numbers = [_to_float(values.get(key)) for key in ('w', 'h', 'x', 'y')]
+    if None in numbers:
+        return None
+    return tuple(int(n) for n in numbers)
+
+
+def _centered_box(region: Tuple[int, int, int, int], width: float, height: float) -> Tuple[int, int, int, int]:
+    """Область заданного размера по центру region (в координатах источника)."""
+    rw, rh, rx, ry = region
+    w = max(2, min(rw, int(round(width))))
+    h = max(2, min(rh, int(round(height))))
+    return (w, h, rx + (rw - w) // 2, ry + (rh - h) // 2)
+
+
+def _crop_scale_nodes(box: Tuple[int, int, int, int], full_frame: Optional[Tuple[int, int]],
+                      out_w: int, out_h: int,
+                      flags: Optional[str] = None) -> List[FilterNode]:
+    """Узлы crop (до масштабирования) и scale для одной стадии."""
+    nodes = []
+    w, h, x, y = box
+    if full_frame is None or (w, h, x, y) != (full_frame[0], full_frame[1], 0, 0):
+        nodes.append(FilterNode('crop', f'{w}:{h}:{x}:{y}'))
+    if (out_w, out_h) != (w, h):
+        nodes.append(FilterNode('scale', f'{out_w}:{out_h}:flags={flags or _scaler_flags(w, out_w)}'))
+    return nodes
+
+
+def _background_size(spec: GraphSpec, canvas_w: int, canvas_h: int) -> Tuple[int, int]:
+    """Размер, в котором размывается фон (уменьшенный в быстром режиме)."""
+    if spec.blur_mode == BLUR_MODE_FAST:
+        return _even(canvas_w / BLUR_FAST_DOWNSCALE), _even(canvas_h / BLUR_FAST_DOWNSCALE)
+    return canvas_w, canvas_h
+
+
+def _background_flags(spec: GraphSpec) -> str:
+    """Алгоритм масштабирования копии кадра для фона."""
+    # Сильное уменьшение без усреднения дает мерцающий алиасинг
+    return SCALER_FLAGS['background_down' if spec.blur_mode == BLUR_MODE_FAST else 'background']
+
+
+def _background_blur_nodes(spec: GraphSpec, canvas_w: int, canvas_h: int) -> List[FilterNode]:
+    """
+    Размытие фона, уже приведенного к _background_size.
+
+    В быстром режиме фон размывается в уменьшенном кадре с пропорционально
+    меньшим sigma и растягивается обратно: после сильного размытия
+    разница с полноразмерным gblur незаметна, а пикселей в 64 раза меньше.
+    """
+    sigma = BLUR_SIGMA * spec.zoom_factor
+    if spec.blur_mode != BLUR_MODE_FAST:
+        return [FilterNode('gblur', f'sigma={_fmt_num(sigma)}')]
+    return [
+        FilterNode('gblur', f'sigma={_fmt_num(sigma / BLUR_FAST_DOWNSCALE)}'),
+        FilterNode('scale', f'{canvas_w}:{canvas_h}:flags={SCALER_FLAGS["background_up"]}'),
+    ]
+
+
+def source_fit_box(spec: GraphSpec) -> Optional[Tuple[int, int]]:
+    """
+    Рамка, в которую граф вписывает исходный кадр.
+
+    Источник, который по ширине или высоте не меньше рамки, не
+    увеличивается; больший источник только уменьшается. Используется
+    для выбора разрешения при скачивании.
+
+    Returns:
+        (ширина, высота) для формата reels или None, если нужен исходный размер
+    """
+    if not spec.reels:
+        return None
+    return _even(REELS_WIDTH * spec.zoom_factor), _even(REELS_HEIGHT * spec.zoom_factor)
+
+
+def _add_planned_geometry(graph: FilterGraph, spec: GraphSpec, last_video: str) -> str:
+    """
+    Обрезка, формат reels и зум, сведенные в одну стадию crop -> scale (-> pad).
+
+    Зум больше не увеличивает уже отформатированный кадр, чтобы потом
+    обрезать его: видимая область вычисляется в координатах источника,
+    обрезается до масштабирования, и кадр масштабируется один раз сразу
+    в итоговый размер. Если размеры источника неизвестны, используются
+    выражения FFmpeg с тем же результатом.
+    """
+    z = spec.zoom_factor
+    crop_box = _parse_crop_box(spec.crop_filter)
+
+    if spec.source_size:
+        full_frame = tuple(spec.source_size)
+        region = crop_box or (full_frame[0], full_frame[1], 0, 0)
+    elif crop_box:
+        full_frame = None
+        region = crop_box
+    else:
+        return _add_expression_geometry(graph, spec, last_video)
+
+    rw, rh = region[0], region[1]
+
+    if not spec.reels:
+        if z >= 1:
+            box = _centered_box(region, rw / z, rh / z)
+            out_w, out_h = _even(rw), _even(rh)
+        else:
+            box = region
+            out_w, out_h = _even(rw * z), _even(rh * z)
+        nodes = _crop_scale_nodes(box, full_frame, out_w, out_h)
+        if not nodes:
+            return last_video
+        return graph.add([last_video], nodes)[0]
+
+    target_w, target_h = REELS_WIDTH, REELS_HEIGHT
+    # Размер холста: при уменьшении кадр целиком меньше 1080x1920
+    canvas_w, canvas_h = (target_w, target_h) if z >= 1 else (_even(target_w * z), _even(target_h * z))
+
+    # Передний план: вписать в (W*z, H*z) и оставить видимую часть холста
+    fit = min(target_w * z / rw, target_h * z / rh)
+    fg_box = _centered_box(region, canvas_w / fit, canvas_h / fit)
+    fg_w = min(canvas_w, _even(fg_box[0] * fit))
+    fg_h = min(canvas_h, _even(fg_box[1] * fit))
+    fg_nodes = _crop_scale_nodes(fg_box, full_frame, fg_w, fg_h)
+
+    if not spec.blur_background:
+        if (fg_w, fg_h) != (canvas_w, canvas_h):
+            fg_nodes.append(FilterNode('pad', f'{canvas_w}:{canvas_h}:(ow-iw)/2:(oh-ih)/2:color=black'))
+        return graph.add([last_video], fg_nodes or [FilterNode('null')])[0]
+
+    # Фон: заполнить холст (increase) с тем же зумом
+    cover = max(target_w / rw, target_h / rh) * z
+    bg_box = _centered_box(region, canvas_w / cover, canvas_h / cover)
+    bg_w, bg_h = _background_size(spec, canvas_w, canvas_h)
+    bg_nodes = _crop_scale_nodes(bg_box, full_frame, bg_w, bg_h, flags=_background_flags(spec))
+    bg_nodes.extend(_background_blur_nodes(spec, canvas_w, canvas_h))
+
+    original, original_copy = graph.add([last_video], [FilterNode('split')],
+                                         [graph.new_label('fg_src'), graph.new_label('bg_src')])
+    bg = graph.add([original_copy], bg_nodes, [graph.new_label('bg')])[0]
+    fg = graph.add([original], fg_nodes or [FilterNode('null')], [graph.new_label('fg')])[0]
+    return graph.add([bg, fg], [FilterNode('overlay', 'x=(W-w)/2:y=(H-h)/2:shortest=1')])[0]
+
+
+def _add_expression_geometry(graph: FilterGraph, spec: GraphSpec, last_video: str) -> str:
+    """Та же геометрия, что и в _add_planned_geometry, но без размеров источника."""
+    z = spec.zoom_factor
+    zoom = _fmt_num(z)
+
+    if not spec.reels:
+        if abs(z - 1) <= 1e-5:
+            return last_video
+        if z >= 1:
+            # Без размеров источника итог округляется до четных, иначе
+            # обрезка iw/zoom может дать нечетную высоту и libx264 откажется
+            nodes = [
+                FilterNode('crop', f'iw/{zoom}:ih/{zoom}'),
+                FilterNode('scale', f"'round(iw*{zoom}/2)*2':'round(ih*{zoom}/2)*2':"
+                                    f'flags={SCALER_FLAGS["upscale"]}'),
+            ]
+        else:
+            nodes = [FilterNode('scale', f'iw*{zoom}:ih*{zoom}:flags={SCALER_FLAGS["downscale"]}')]
+        return graph.add([last_video], nodes)[0]
+
+    target_w, target_h = REELS_WIDTH, REELS_HEIGHT
+    canvas_w, canvas_h = (target_w, target_h) if z >= 1 else (_even(target_w * z), _even(target_h * z))
+    fit_w, fit_h = _even(target_w * z), _even(target_h * z)
+
+    fg_nodes = [FilterNode('scale', f'{fit_w}:{fit_h}:force_original_aspect_ratio=decrease:flags=bicubic')]
+    if z > 1:
+        fg_nodes.append(FilterNode('crop', f"w='min(iw,{canvas_w})':h='min(ih,{canvas_h})'"))
+
+    if not spec.blur_background:
+        fg_nodes.append(FilterNode('pad', f'{canvas_w}:{canvas_h}:(ow-iw)/2:(oh-ih)/2:color=black'))
+        return graph.add([last_video], fg_nodes)[0]
+
+    bg_w, bg_h = _background_size(spec, canvas_w, canvas_h)
+    bg_fit_w, bg_fit_h = _background_size(spec, fit_w, fit_h)
+    bg_nodes = [
+        FilterNode('scale', f'{bg_fit_w}:{bg_fit_h}:force_original_aspect_ratio=increase:'
+                            f'flags={_background_flags(spec)}'),
+        FilterNode('crop', f'{bg_w}:{bg_h}'),
+    ]
+    bg_nodes.extend(_background_blur_nodes(spec, canvas_w, canvas_h))
+
+    original, original_copy = graph.add([last_video], [FilterNode('split')],
+                                         [graph.new_label('fg_src'), graph.new_label('bg_src')])
+    bg = graph.add([original_copy], bg_nodes, [graph.new_label('bg')])[0]
+    fg = graph.add([original], fg_nodes, [graph.new_label('fg')])[0]
+    return graph.add([bg, fg], [FilterNode('overlay', 'x=(W-w)/2:y=(H-h)/2:shortest=1')])[0]
+
+
+def _add_legacy_geometry(graph: FilterGraph, spec: GraphSpec, last_video: str) -> str:
+    """
+    Исходный порядок стадий: обрезка, reels, пользовательские фильтры,
+    затем зум через увеличение кадра и обрезку обратно.
+    Используется при spec.optimize=False (сравнение и запасной режим).
+    """
+    target_w, target_h = REELS_WIDTH, REELS_HEIGHT
+
+    # Применение фильтра обрезки
+    if spec.crop_filter:
+        last_video = graph.add([last_video], parse_filter_chain(spec.crop_filter))[0]
+
+    # Форматирование для reels
+    if spec.reels:
+        if spec.blur_background:
+            # С размытым фоном
+            original, original_copy = graph.add([last_video], [FilterNode('split')],
+                                                 [graph.new_label('fg_src'), graph.new_label('bg_src')])
+            bg = graph.add([original_copy], [
+                FilterNode('scale', f'{target_w}:{target_h}:force_original_aspect_ratio=increase'),
+                FilterNode('crop', f'{target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2'),
+                FilterNode('gblur', 'sigma=25'),
+            ], [graph.new_label('bg')])[0]
+            fg = graph.add([original], [
+                FilterNode('scale', f'{target_w}:{target_h}:force_original_aspect_ratio=decrease'),
+            ], [graph.new_label('fg')])[0]
+            last_video = graph.add([bg, fg], [FilterNode('overlay', 'x=(W-w)/2:y=(H-h)/2:shortest=1')])[0]
+        else:
+            # С черными полосами
+            last_video = graph.add([last_video], [
+                FilterNode('scale', f'{target_w}:{target_h}:force_original_aspect_ratio=decrease'),
+                FilterNode('pad', f'{target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black'),
+            ])[0]
+
+    # Применение фильтров
+    for template in spec.filter_templates:
+        last_video = graph.add([last_video], parse_filter_chain(template))[0]
+
+    # Применение зума
+    zoom_factor = spec.zoom_factor
+    if abs(zoom_factor - 1) > 1e-5:
+        zoom_nodes = [FilterNode('scale', f'iw*{zoom_factor}:ih*{zoom_factor}:flags=bicubic')]
+        if zoom_factor >= 1:
+            # Увеличение с последующей обрезкой
+            if spec.reels:
+                zoom_nodes.append(FilterNode('crop', f'{target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2'))
+            else:
+                zoom_nodes.append(FilterNode(
+                    'crop',
+                    f'iw/{zoom_factor}:ih/{zoom_factor}:(in_w-iw/{zoom_factor})/2:(in_h-ih/{zoom_factor})/2'
+                ))
+        last_video = graph.add([last_video], zoom_nodes)[0]
+
+    return last_video
+
+
+def _add_video_chains(graph: FilterGraph, spec: GraphSpec) -> None:
+    """Видеочасть графа с финальной меткой 'vout'."""
+    last_video = '0:v'
+
+    if spec.optimize:
+        # Геометрия за один проход, фильтры - уже на итоговом разрешении
+        last_video = _add_planned_geometry(graph, spec, last_video)
+        for template in spec.filter_templates:
+            last_video = graph.add([last_video], parse_filter_chain(template))[0]
+    else:
+        last_video = _add_legacy_geometry(graph, spec, last_video)
+
+    # Добавление субтитров
+    if spec.srt_path:
+        last_video = graph.add([last_video], [_subtitles_node(spec.srt_path, spec.subtitle_font_size)])[0]
+
+    # Изменение скорости видео
+    if abs(spec.speed_factor - 1) > 1e-5:
+        last_video = graph.add([last_video], [FilterNode('setpts', f'PTS/{spec.speed_factor}')])[0]
+
+    # Добавление видео оверлея
+    if spec.overlay_input is not None:
+        pos_params = OVERLAY_POSITIONS.get(spec.overlay_pos, 'x=(W-w)/2:y=(H-h)/2')
+        overlay_label = f'{spec.overlay_input}:v'
+        if spec.overlay_prepared:
+            # Оверлей уже в формате выхода с премультиплицированной альфой;
+            # картинка декодируется один раз и повторяется фильтром loop
+            if spec.overlay_still:
+                overlay_label = graph.add([overlay_label], [FilterNode('loop', 'loop=-1:size=1')],
+                                          [graph.new_label('ovl')])[0]
+            overlay_args = f'{pos_params}:alpha=premultiplied:shortest=1'
+        else:
+            overlay_label = graph.add([overlay_label], [FilterNode('format', 'rgba')],
+                                      [graph.new_label('ovl')])[0]
+            # Зацикленный GIF бесконечен: выход заканчивается вместе с основным видео
+            overlay_args = f'{pos_params}:shortest=1' if spec.overlay_looped else pos_params
+        last_video = graph.add([last_video, overlay_label], [FilterNode('overlay', overlay_args)])[0]
+
+    # Финальное форматирование
+    graph.add([last_video], [FilterNode('format', f'pix_fmts={spec.output_pix_fmt}')], [VIDEO_OUTPUT_LABEL])
+    graph.mark_output(VIDEO_OUTPUT_LABEL)
+
+
+def _add_audio_chains(graph: FilterGraph, spec: GraphSpec) -> None:
+    """Аудиочасть графа с финальной меткой 'aout' (если есть звук)."""
+    sources = []
+
+    if spec.has_audio and not spec.mute_audio:
+        sources.append(('0:a', spec.original_volume))
+
+    if spec.overlay_audio_input is not None:
+        sources.append((f'{spec.overlay_audio_input}:a', spec.overlay_volume))
+
+    if not sources:
+        return
+
+    if len(sources) == 1:
+        label, volume = sources[0]
+        final_audio = graph.add([label], [FilterNode('volume', f'{volume}')], media='audio')[0]
+    elif spec.audio_mix_duration > 0:
+        # Длительность микса известна: дорожки дополняются тишиной до общей
+        # длины, а amerge + pan складывают каналы с постоянными весами.
+        # Веса повторяют нормализацию amix (1/число входов), громкости
+        # входят в те же коэффициенты, отдельные volume не нужны.
+        # amerge требует одинаковой частоты всех входов: аудио оверлея,
+        # взятое как есть, может отличаться от исходного звука.
+        aformat_args = 'channel_layouts=stereo'
+        if spec.audio_mix_sample_rate:
+            aformat_args += f':sample_rates={spec.audio_mix_sample_rate}'
+        merged = [graph.add([label], [
+            FilterNode('aformat', aformat_args),
+            FilterNode('apad', f'whole_dur={spec.audio_mix_duration:.3f}'),
+        ], media='audio')[0] for label, _ in sources]
+        gains = [_fmt_num(volume / len(sources)) for _, volume in sources]
+        channels = ['+'.join(f'{gain}*c{2 * i + side}' for i, gain in enumerate(gains)) for side in (0, 1)]
+        final_audio = graph.add(merged, [
+            FilterNode('amerge', f'inputs={len(sources)}'),
+            FilterNode('pan', f'stereo|c0={channels[0]}|c1={channels[1]}'),
+        ], media='audio')[0]
+    else:
+        mixed = [graph.add([label], [FilterNode('volume', f'{volume}')], media='audio')[0]
+                 for label, volume in sources]
+        final_audio = graph.add(mixed, [
+            FilterNode('amix', f'inputs={len(mixed)}:duration=longest')
+        ], media='audio')[0]
+
+    graph.add([final_audio], _atempo_nodes(spec.speed_factor) or [FilterNode('anull')],
+              [AUDIO_OUTPUT_LABEL], media='audio')
+    graph.mark_output(AUDIO_OUTPUT_LABEL)
+
+
+def build_filter_graph(spec: GraphSpec) -> FilterGraph:
+    """
+    Строит (неоптимизированный) граф фильтров по описанию обработки.
+
+    Args:
+        spec: Описание обработки файла
+
+    Returns:
+        Граф с финальными метками 'vout' и, при наличии звука, 'aout'
+    """
+    graph = FilterGraph()
+    if spec.include_video:
+        _add_video_chains(graph, spec)
+    _add_audio_chains(graph, spec)
+    return graph
+
+
+@lru_cache(maxsize=64)
+def compile_filter_graph(spec: GraphSpec) -> str:
+    """
+    Строит, оптимизирует и компилирует граф в строку filter_complex.
+
+    Результат кешируется по GraphSpec, поэтому повторные запросы того же
+    задания (например, повторный рендер или предпросмотр) не строят граф заново.
+    """
+    return build_filter_graph(spec).optimize().compile()
+
+
+@lru_cache(maxsize=64)
+def is_video_passthrough(spec: GraphSpec) -> bool:
+    """Видео не меняется графом (кроме приведения к output_pix_fmt)."""
+    return build_filter_graph(replace(spec, has_audio=False, overlay_audio_input=None)).optimize() \
+        .is_passthrough('video')
+
+
+@lru_cache(maxsize=64)
+def is_audio_passthrough(spec: GraphSpec) -> bool:
+    """Исходный звук попадает в выход без изменений (громкость, темп, микс)."""
+    return build_filter_graph(replace(spec, include_video=False)).optimize().is_passthrough('audio')
+
+
+def expected_output_duration(spec: GraphSpec, source_duration: float,
+                             overlay_audio_duration: float = 0) -> float:
+    """
+    Ожидаемая длительность выходного файла в секундах.
+
+    Учитывает изменение скорости (setpts/atempo), зацикленный вход
+    (spec.loop_input), микс дорожек до самой длинной и -shortest (spec.shortest).
+
+    Args:
+        spec: Описание обработки файла
+        source_duration: Длительность входного файла (0 - неизвестна)
+        overlay_audio_duration: Длительность наложенного аудио (0 - неизвестна)
+
+    Returns:
+        Длительность в секундах или 0, если выход не ограничен или длительность неизвестна
+    """
+    # 0 означает неограниченный или неизвестный поток
+    video = 0.0 if spec.loop_input else max(0.0, source_duration)
+
+    audio_parts = []
+    if spec.has_audio and not spec.mute_audio:
+        audio_parts.append(max(0.0, source_duration))
+    if spec.overlay_audio_input is not None:
+        audio_parts.append(max(0.0, overlay_audio_duration))
+
+    streams = [video]
+    if audio_parts:
+        # Микс (amix duration=longest или amerge с apad) длится до конца самой длинной дорожки
+        streams.append(0.0 if 0.0 in audio_parts else max(audio_parts))
+
+    if spec.shortest:
+        bounded = [d for d in streams if d > 0]
+        duration = min(bounded) if bounded else 0.0
+    else:
+        duration = 0.0 if 0.0 in streams else max(streams)
+
+    return duration / spec.speed_factor if spec.speed_factor > 0 else duration
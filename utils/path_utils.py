@@ -3,12 +3,9 @@ Path utilities module for handling resource paths in PyInstaller applications.
 Модуль утилит для работы с путями ресурсов в приложениях PyInstaller.
 """
 
-import shutil
 import sys
 import os
 
-from utils.constants import FFMPEG_EXE_PATH, YTDLP_EXE_PATH
-
 
 def resource_path(relative_path: str) -> str:
     """
@@ -36,33 +33,18 @@ def resource_path(relative_path: str) -> str:
 
     return os.path.join(base_path, relative_path)
 
-# Поиск FFPMEG где рядом с исполняемым файлом или в системном PATH
+# Поиск FFMPEG и YT_DLP рядом с исполняемым файлом или в системном PATH
+# (путь ищется один раз и кешируется реестром utils.tool_utils; импорт внутри
+# функций, потому что реестр сам использует resource_path)
 
 def get_ffmpeg_path():
-    local_path = resource_path(FFMPEG_EXE_PATH)
-    if os.path.isfile(local_path):
-        return local_path
-    
-    # Поиск в системном PATH
-    system_path = shutil.which('ffmpeg')
-    if system_path:
-        return system_path
-    
-    raise FileNotFoundError("FFmpeg not found at local path or in system PATH.")
+    from utils.tool_utils import TOOL_FFMPEG, get_tool_path
+    return get_tool_path(TOOL_FFMPEG)
 
-# Поиск YT_DLP где рядом с исполняемым файлом или в системном PATH
 
 def get_ytdlp_path():
-    local_path = resource_path(YTDLP_EXE_PATH)
-    if os.path.isfile(local_path):
-        return local_path
-    
-    # Поиск в системном PATH
-    system_path = shutil.which('yt-dlp')
-    if system_path:
-        return system_path
-    
-    raise FileNotFoundError("yt-dlp not found at local path or in system PATH.")
+    from utils.tool_utils import TOOL_YTDLP, get_tool_path
+    return get_tool_path(TOOL_YTDLP)
 
 # Дополнительные вспомогательные функции для работы с путями
 
@@ -129,6 +111,27 @@ def get_temp_directory() -> str:
     return temp_dir
 
 
+def get_cache_directory(subdir: str = '') -> str:
+    """
+    Получает путь к директории кеша приложения.
+    
+    В отличие от temp, содержимое кеша переживает перезапуск приложения.
+    
+    Args:
+        subdir: Необязательная поддиректория внутри кеша
+        
+    Returns:
+        Путь к директории кеша
+    """
+    app_path = get_application_path()
+    cache_dir = os.path.join(app_path, 'cache', subdir) if subdir else os.path.join(app_path, 'cache')
+    
+    # Создаем директорию если она не существует
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    return cache_dir
+
+
 def get_logs_directory() -> str:
     """
     Получает путь к директории логов приложения.
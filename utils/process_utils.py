@@ -0,0 +1,397 @@
+"""
+Shared runner for external tools: ffmpeg, ffprobe and yt-dlp.
+Общий запуск внешних инструментов: ffmpeg, ffprobe и yt-dlp.
+
+Все дочерние процессы приложения запускаются через этот модуль:
+    - одинаковые параметры Popen (на Windows окно консоли скрыто);
+    - глобальный предел одновременных процессов каждого инструмента,
+      ожидание свободного слота прерывается отменой;
+    - вывод читается построчно в обратные вызовы, в результате хранится
+      весь вывод или только последние строки;
+    - отмена через threading.Event и таймаут завершают процесс сразу;
+    - ProcessResult с кодом возврата, выводом, временем ожидания слота,
+      временем работы и использованием ресурсов (ChildMonitor);
+    - счетчики по инструментам (process_stats) для диагностики.
+"""
+
+import logging
+import os
+import platform
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+from utils.constants import PROCESS_LIMIT_FFPROBE, PROCESS_LIMIT_YTDLP
+from utils.resource_utils import ChildMonitor, ProcessUsage, record_child_usage
+from utils.scheduling_utils import available_cpu_count
+
+
+# Типы инструментов: у каждого свой предел одновременных процессов
+TOOL_FFMPEG = 'ffmpeg'
+TOOL_FFPROBE = 'ffprobe'
+TOOL_YTDLP = 'yt-dlp'
+
+# Шаг проверки отмены и таймаута, секунды
+PROCESS_POLL_INTERVAL = 0.25
+
+# Ожидание слота дольше стольких секунд попадает в лог
+PROCESS_QUEUE_LOG_SECONDS = 1.0
+
+
+class ProcessCancelledError(RuntimeError):
+    """Процесс остановлен (или не запущен) по событию отмены."""
+
+
+@dataclass
+class ProcessResult:
+    """Результат завершившегося процесса."""
+    tool: str
+    args: List[str]
+    returncode: int
+    stdout: str = ''
+    stderr: str = ''
+    queued: float = 0.0  # Ожидание свободного слота, секунды
+    elapsed: float = 0.0  # Время работы процесса, секунды
+    usage: Optional[ProcessUsage] = None
+
+    def check_returncode(self) -> 'ProcessResult':
+        """
+        Raises:
+            subprocess.CalledProcessError: Если код возврата не 0
+        """
+        if self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.args, self.stdout, self.stderr)
+        return self
+
+
+@dataclass
+class ToolStats:
+    """Счетчики процессов одного инструмента с начала работы приложения."""
+    limit: int = 0
+    running: int = 0
+    waiting: int = 0
+    peak_running: int = 0
+    started: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    queued_seconds: float = 0.0
+
+
+class _ToolSlots:
+    """Предел одновременных процессов инструмента; предел можно менять на ходу."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.stats = ToolStats(limit=max(1, limit))
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit: int) -> None:
+        with self._cond:
+            self.stats.limit = max(1, limit)
+            self._cond.notify_all()
+
+    def acquire(self, cancel_event: Optional[threading.Event]) -> float:
+        """
+        Занимает слот.
+
+        Returns:
+            Время ожидания в секундах
+
+        Raises:
+            ProcessCancelledError: Если отмена пришла во время ожидания
+        """
+        start = time.monotonic()
+        with self._cond:
+            self.stats.waiting += 1
+            try:
+                while self.stats.running >= self.stats.limit:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise ProcessCancelledError(f'{self.name} was cancelled while waiting for a free slot')
+                    self._cond.wait(PROCESS_POLL_INTERVAL)
+            finally:
+                self.stats.waiting -= 1
+            self.stats.running += 1
+            self.stats.started += 1
+            self.stats.peak_running = max(self.stats.peak_running, self.stats.running)
+            queued = time.monotonic() - start
+            self.stats.queued_seconds += queued
+        if queued >= PROCESS_QUEUE_LOG_SECONDS:
+            logging.info(f'{self.name} waited {queued:.1f}s for a free slot (limit {self.stats.limit})')
+        return queued
+
+    def release(self, elapsed: float, failed: bool) -> None:
+        with self._cond:
+            self.stats.running -= 1
+            self.stats.busy_seconds += elapsed
+            if failed:
+                self.stats.failed += 1
+            self._cond.notify()
+
+
+def default_process_limits() -> Dict[str, int]:
+    """Пределы по умолчанию: FFmpeg - два процесса на ядро, но не меньше 4."""
+    return {
+        TOOL_FFMPEG: max(4, 2 * available_cpu_count()),
+        TOOL_FFPROBE: PROCESS_LIMIT_FFPROBE,
+        TOOL_YTDLP: PROCESS_LIMIT_YTDLP,
+    }
+
+
+_tools: Dict[str, _ToolSlots] = {name: _ToolSlots(name, limit) for name, limit in default_process_limits().items()}
+_tools_lock = threading.Lock()
+
+
+def _slots(tool: str) -> _ToolSlots:
+    with _tools_lock:
+        if tool not in _tools:
+            _tools[tool] = _ToolSlots(tool, available_cpu_count())
+        return _tools[tool]
+
+
+def set_process_limit(tool: str, limit: int) -> None:
+    """Меняет предел одновременных процессов инструмента (ожидающие сразу его учитывают)."""
+    _slots(tool).set_limit(limit)
+
+
+def process_stats() -> Dict[str, ToolStats]:
+    """Снимок счетчиков по инструментам."""
+    with _tools_lock:
+        tools = list(_tools.values())
+    snapshot = {}
+    for entry in tools:
+        with entry._cond:
+            snapshot[entry.name] = replace(entry.stats)
+    return snapshot
+
+
+def format_process_stats() -> str:
+    """Сводка счетчиков для лога: запуски, ошибки, пик параллельности и ожидание слотов."""
+    lines = ['Processes by tool:']
+    for name, stats in sorted(process_stats().items()):
+        if stats.started:
+            lines.append(f'  {name}: started={stats.started} failed={stats.failed} '
+                         f'peak={stats.peak_running}/{stats.limit} busy={stats.busy_seconds:.1f}s '
+                         f'queued={stats.queued_seconds:.1f}s')
+    return '\n'.join(lines)
+
+
+def hidden_window_options() -> Dict:
+    """Параметры Popen, скрывающие окно консоли на Windows (на других ОС пусто)."""
+    if platform.system() != 'Windows':
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return {'creationflags': subprocess.CREATE_NO_WINDOW, 'startupinfo': startupinfo}
+
+
+class ManagedProcess:
+    """Процесс, запущенный через open_process."""
+
+    def __init__(self, tool: str, args: List[str], popen: subprocess.Popen, queued: float):
+        self.tool = tool
+        self.args = args
+        self.popen = popen
+        self.queued = queued
+        self.monitor = ChildMonitor(popen)
+        self.started = time.monotonic()
+        self.returncode: Optional[int] = None
+        self.usage: Optional[ProcessUsage] = None
+        self.killed = False
+
+    @property
+    def pid(self) -> int:
+        return self.popen.pid
+
+    @property
+    def stdin(self):
+        return self.popen.stdin
+
+    @property
+    def stdout(self):
+        return self.popen.stdout
+
+    @property
+    def stderr(self):
+        return self.popen.stderr
+
+    def running(self) -> bool:
+        """Процесс еще работает; проверка не собирает процесс и не теряет его ресурсы."""
+        if self.returncode is not None or self.popen.returncode is not None:
+            return False
+        if hasattr(os, 'waitid'):
+            try:
+                return os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None
+            except ChildProcessError:
+                return False
+        return self.popen.poll() is None
+
+    def kill(self) -> None:
+        """Немедленно завершает процесс (безопасно из любого потока)."""
+        self.killed = True
+        self.monitor.kill()
+
+    def wait(self) -> int:
+        """Ждет завершения; использование ресурсов добавляется к активным стадиям потока."""
+        if self.returncode is None:
+            self.returncode, self.usage = self.monitor.wait()
+            record_child_usage(self.usage)
+        return self.returncode
+
+
+@contextmanager
+def open_process(tool: str, args: List[str], cancel_event: Optional[threading.Event] = None,
+                 cwd: Optional[str] = None, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                 stderr=subprocess.PIPE, bufsize: int = -1, text: bool = False) -> Iterator[ManagedProcess]:
+    """
+    Запускает процесс инструмента в пределах его слотов.
+
+    При выходе из блока процесс, который еще работает, завершается,
+    каналы закрываются, а слот освобождается.
+
+    Args:
+        tool: Тип инструмента (TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP)
+        args: Команда с путем к исполняемому файлу
+        cancel_event: Событие отмены ожидания слота
+        cwd: Рабочая папка процесса
+        stdin, stdout, stderr: Как в subprocess.Popen
+        bufsize: Как в subprocess.Popen
+        text: Текстовые каналы UTF-8 (ошибки декодирования заменяются)
+
+    Raises:
+        FileNotFoundError: Если исполняемый файл не найден
+        ProcessCancelledError: Если отмена пришла до запуска
+    """
+    args = [str(arg) for arg in args]
+    slots = _slots(tool)
+    queued = slots.acquire(cancel_event)
+    popen_kwargs = dict(stdin=stdin, stdout=stdout, stderr=stderr, bufsize=bufsize, cwd=cwd, **hidden_window_options())
+    if text:
+        popen_kwargs.update(text=True, encoding='utf-8', errors='replace')
+    try:
+        popen = subprocess.Popen(args, **popen_kwargs)
+    except BaseException:
+        slots.release(0.0, failed=True)
+        raise
+
+    process = ManagedProcess(tool, args, popen, queued)
+    try:
+        yield process
+    finally:
+        if process.running():
+            process.kill()
+        process.wait()
+        for stream in (popen.stdin, popen.stdout, popen.stderr):
+            if stream is not None:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+        elapsed = time.monotonic() - process.started
+        slots.release(elapsed, failed=process.returncode != 0 and not process.killed)
+        logging.debug(f'{tool} exited with code {process.returncode} after {elapsed:.2f}s '
+                      f'(queued {queued:.2f}s, cpu {process.usage.cpu_time if process.usage else 0:.2f}s)')
+
+
+def _read_lines(stream, lines: Deque[str], callback: Optional[Callable[[str], None]]) -> None:
+    """Читает текстовый канал построчно: строки уходят в callback и в буфер."""
+    for line in iter(stream.readline, ''):
+        line = line.rstrip('\r\n')
+        if callback is not None:
+            callback(line)
+        lines.append(line)
+
+
+def run_process(tool: str, args: List[str], timeout: Optional[float] = None,
+                cancel_event: Optional[threading.Event] = None, cwd: Optional[str] = None,
+                check: bool = False, on_stdout_line: Optional[Callable[[str], None]] = None,
+                on_stderr_line: Optional[Callable[[str], None]] = None, merge_stderr: bool = False,
+                keep_lines: Optional[int] = None) -> ProcessResult:
+    """
+    Запускает процесс инструмента и ждет его завершения.
+
+    stdout читается в вызывающем потоке, stderr - в отдельном, поэтому
+    обратные вызовы для stdout приходят в вызывающем потоке.
+
+    Args:
+        tool: Тип инструмента (TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP)
+        args: Команда с путем к исполняемому файлу
+        timeout: Предел времени работы процесса, секунды (ожидание слота не считается)
+        cancel_event: Событие отмены; процесс завершается сразу
+        cwd: Рабочая папка процесса
+        check: Бросать CalledProcessError при ненулевом коде возврата
+        on_stdout_line: Вызывается для каждой строки stdout
+        on_stderr_line: Вызывается для каждой строки stderr
+        merge_stderr: Направить stderr в stdout
+        keep_lines: Сколько последних строк каждого канала хранить в результате (None - все)
+
+    Returns:
+        ProcessResult
+
+    Raises:
+        FileNotFoundError: Если исполняемый файл не найден
+        ProcessCancelledError: Если процесс отменен
+        subprocess.TimeoutExpired: Если вышел таймаут
+        subprocess.CalledProcessError: Если check=True и код возврата не 0
+    """
+    stdout_lines: Deque[str] = deque(maxlen=keep_lines)
+    stderr_lines: Deque[str] = deque(maxlen=keep_lines)
+    stop_reason: List[str] = []
+    finished = threading.Event()
+
+    with open_process(tool, args, cancel_event=cancel_event, cwd=cwd,
+                      stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE, text=True) as process:
+
+        def supervise() -> None:
+            deadline = process.started + timeout if timeout else None
+            while not finished.wait(PROCESS_POLL_INTERVAL):
+                if cancel_event is not None and cancel_event.is_set():
+                    stop_reason.append('cancelled')
+                elif deadline is not None and time.monotonic() > deadline:
+                    stop_reason.append('timeout')
+                else:
+                    continue
+                process.kill()
+                return
+
+        supervisor = None
+        if timeout or cancel_event is not None:
+            supervisor = threading.Thread(target=supervise, daemon=True)
+            supervisor.start()
+        stderr_reader = None
+        if not merge_stderr:
+            stderr_reader = threading.Thread(target=_read_lines, args=(process.stderr, stderr_lines, on_stderr_line),
+                                             daemon=True)
+            stderr_reader.start()
+
+        try:
+            _read_lines(process.stdout, stdout_lines, on_stdout_line)
+            if stderr_reader is not None:
+                stderr_reader.join()
+            returncode = process.wait()
+        finally:
+            finished.set()
+            if supervisor is not None:
+                supervisor.join()
+
+    result = ProcessResult(
+        tool=tool,
+        args=process.args,
+        returncode=returncode,
+        stdout='\n'.join(stdout_lines),
+        stderr='\n'.join(stderr_lines),
+        queued=process.queued,
+        elapsed=time.monotonic() - process.started,
+        usage=process.usage,
+    )
+    if stop_reason and stop_reason[0] == 'cancelled':
+        raise ProcessCancelledError(f'{tool} was cancelled')
+    if stop_reason:
+        raise subprocess.TimeoutExpired(result.args, timeout, output=result.stdout, stderr=result.stderr)
+    if check:
+        result.check_returncode()
+    return result
@@ -0,0 +1,192 @@
+"""
+Progress telemetry module for FFmpeg jobs.
+Модуль телеметрии прогресса заданий FFmpeg.
+
+Разбирает поток key=value из `ffmpeg -progress` в структурированные
+события (кадр, fps, скорость, битрейт, размер, время вывода) и считает
+оставшееся время для файла и для всей пачки.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Одно событие прогресса кодирования (блок -progress FFmpeg)."""
+    frame: int = 0
+    fps: float = 0.0
+    speed: float = 0.0  # Во сколько раз быстрее реального времени
+    bitrate_kbps: float = 0.0
+    total_size: int = 0  # Байт записано в выходной файл
+    out_time: float = 0.0  # Секунд выходного видео уже готово
+    duration: float = 0.0  # Ожидаемая длительность выхода, 0 - неизвестна
+    finished: bool = False
+    # Поля пачки заполняет BatchProgress
+    file_index: int = 0
+    file_count: int = 1
+    batch_percent: float = 0.0
+    batch_eta: Optional[float] = None
+
+    @property
+    def percent(self) -> int:
+        """Прогресс файла в процентах (0..100)."""
+        if self.finished:
+            return 100
+        if self.duration <= 0:
+            return 0
+        return max(0, min(100, int(self.out_time / self.duration * 100)))
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оставшееся время обработки файла в секундах или None."""
+        if self.finished:
+            return 0.0
+        if self.duration <= 0 or self.speed <= 0:
+            return None
+        return max(0.0, (self.duration - self.out_time) / self.speed)
+
+
+def _parse_number(value: Optional[str], suffix: str = '') -> float:
+    """Число из значения -progress ('1.5x', '1200.3kbits/s', 'N/A')."""
+    if not value:
+        return 0.0
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def parse_progress_block(values: Dict[str, str], duration: float = 0) -> ProgressEvent:
+    """
+    Превращает один блок -progress в ProgressEvent.
+
+    Args:
+        values: Пары key=value блока (до строки progress=... включительно)
+        duration: Ожидаемая длительность выходного видео в секундах
+
+    Returns:
+        Событие прогресса
+    """
+    # out_time_ms, несмотря на название, тоже в микросекундах
+    out_time_us = values.get('out_time_us') or values.get('out_time_ms') or ''
+    return ProgressEvent(
+        frame=int(_parse_number(values.get('frame'))),
+        fps=_parse_number(values.get('fps')),
+        speed=_parse_number(values.get('speed'), 'x'),
+        bitrate_kbps=_parse_number(values.get('bitrate'), 'kbits/s'),
+        total_size=int(_parse_number(values.get('total_size'))),
+        out_time=max(0.0, _parse_number(out_time_us) / 1000000),
+        duration=duration,
+        finished=values.get('progress') == 'end',
+    )
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """Форматирует оставшееся время как 'м:сс' или 'ч:мм:сс'."""
+    if seconds is None:
+        return '--:--'
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f'{hours}:{minutes:02d}:{secs:02d}'
+    return f'{minutes}:{secs:02d}'
+
+
+class BatchProgress:
+    """
+    Прогресс и оставшееся время для пачки файлов.
+
+    Оставшееся время пачки = необработанная длительность выхода, деленная
+    на фактическую производительность пачки (секунды выхода за секунду
+    работы). До первого завершенного файла берется суммарная текущая
+    скорость FFmpeg. Несколько файлов могут обрабатываться одновременно.
+    """
+
+    def __init__(self, durations: List[float]):
+        self.durations = [max(0.0, d) for d in durations]
+        self.index = 0
+        self._done_media = 0.0
+        self._batch_started: Optional[float] = None
+        self._finished = set()
+        self._percent: Dict[int, float] = {}
+        self._speed: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def set_duration(self, index: int, duration: float) -> None:
+        """Уточняет ожидаемую длительность выхода файла."""
+        if 0 <= index < len(self.durations):
+            self.durations[index] = max(0.0, duration)
+
+    def estimate_duration(self, index: int, duration: float) -> None:
+        """Задает предварительную длительность файла, если точная еще неизвестна."""
+        with self._lock:
+            if 0 <= index < len(self.durations) and self.durations[index] <= 0:
+                self.durations[index] = max(0.0, duration)
+
+    def start_file(self, index: int) -> None:
+        """Отмечает начало (или повтор) обработки файла с индексом index."""
+        with self._lock:
+            self.index = index
+            if self._batch_started is None:
+                self._batch_started = time.monotonic()
+            self._percent[index] = 0.0
+            self._speed[index] = 0.0
+
+    def finish_file(self, index: Optional[int] = None) -> None:
+        """Отмечает завершение файла (по умолчанию - последнего начатого)."""
+        with self._lock:
+            index = self.index if index is None else index
+            if index in self._finished:
+                return
+            self._finished.add(index)
+            self._percent.pop(index, None)
+            self._speed.pop(index, None)
+            if index < len(self.durations):
+                self._done_media += self.durations[index]
+
+    def update(self, event: ProgressEvent, index: Optional[int] = None) -> ProgressEvent:
+        """Дополняет событие файла index (по умолчанию - последнего начатого) полями пачки."""
+        with self._lock:
+            index = self.index if index is None else index
+            # Точная длительность выхода известна только при запуске FFmpeg
+            if event.duration > 0:
+                self.set_duration(index, event.duration)
+            self._percent[index] = event.percent
+            self._speed[index] = event.speed
+
+            total = sum(self.durations)
+            in_progress = sum(self.durations[i] * p / 100 for i, p in self._percent.items()
+                              if i < len(self.durations))
+            processed = self._done_media + in_progress
+
+            if total > 0:
+                batch_percent = processed / total * 100
+            else:
+                done_files = len(self._finished) + sum(p / 100 for p in self._percent.values())
+                batch_percent = done_files / max(1, len(self.durations)) * 100
+
+            elapsed = time.monotonic() - self._batch_started if self._batch_started else 0.0
+            if self._done_media > 0 and elapsed > 0:
+                throughput = processed / elapsed
+            else:
+                throughput = sum(self._speed.values())
+
+            if total > 0 and throughput > 0:
+                batch_eta = max(0.0, total - processed) / throughput
+            else:
+                batch_eta = None
+
+            return replace(
+                event,
+                file_index=index,
+                file_count=len(self.durations),
+                batch_percent=min(100.0, batch_percent),
+                batch_eta=batch_eta,
+            )
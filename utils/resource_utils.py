@@ -0,0 +1,435 @@
+"""
+Per-job resource accounting module.
+Модуль учета ресурсов по заданиям.
+
+Замеряет для каждой стадии обработки (поиск черных полос, извлечение
+аудио, Whisper, FFmpeg, загрузка) время, CPU потока стадии и дочерних
+процессов, пиковую память, прочитанные/записанные байты и размер
+результата. Записи пачки пишутся в JSONL по мере завершения стадий,
+в конце пачки - в CSV вместе со сводкой самых затратных стадий и CPU
+всего процесса за пачку.
+
+Использование дочерних процессов:
+    - POSIX: os.wait4 (CPU и пиковый RSS) и /proc/<pid>/io (байты, Linux)
+    - Windows: GetProcessTimes, GetProcessMemoryInfo, GetProcessIoCounters
+"""
+
+import csv
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from utils.path_utils import get_logs_directory
+
+
+# Количество записей в сводке самых затратных заданий
+REPORT_TOP_CONSUMERS = 5
+
+
+@dataclass
+class ProcessUsage:
+    """Ресурсы, потраченные процессом."""
+    cpu_time: float = 0.0  # user + system, секунды
+    peak_rss_kb: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+    def merge(self, other: 'ProcessUsage') -> None:
+        """Добавляет использование другого процесса (пиковая память - максимум)."""
+        self.cpu_time += other.cpu_time
+        self.peak_rss_kb = max(self.peak_rss_kb, other.peak_rss_kb)
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+
+
+@dataclass
+class StageUsage:
+    """Одна запись отчета: стадия обработки одного файла."""
+    stage: str
+    label: str = ''
+    started_at: str = ''
+    wall_time: float = 0.0
+    cpu_time: float = 0.0  # CPU потока, выполнявшего стадию (параллельные задания не смешиваются)
+    child_cpu_time: float = 0.0
+    peak_rss_kb: int = 0  # Максимум среди своего процесса и дочерних
+    child_peak_rss_kb: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    output_size: int = 0
+    ok: bool = True
+    error: str = ''
+    _children: ProcessUsage = field(default_factory=ProcessUsage, repr=False)
+
+    def to_dict(self) -> Dict:
+        """Запись без служебных полей для JSONL/CSV."""
+        data = asdict(self)
+        data.pop('_children', None)
+        return data
+
+
+REPORT_FIELDS = [f.name for f in fields(StageUsage) if not f.name.startswith('_')]
+
+
+# --- Счетчики процессов для разных ОС ---
+
+def _read_proc_io(pid) -> Optional[Tuple[int, int]]:
+    """Байты чтения/записи процесса из /proc/<pid>/io (только Linux)."""
+    try:
+        with open(f'/proc/{pid}/io', 'r') as f:
+            values = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(values['rchar']), int(values['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _maxrss_kb(value: int) -> int:
+    """ru_maxrss в килобайтах: на macOS он в байтах, на Linux - в КБ."""
+    return value // 1024 if sys.platform == 'darwin' else value
+
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    class _FILETIME(ctypes.Structure):
+        _fields_ = [('low', wintypes.DWORD), ('high', wintypes.DWORD)]
+
+    class _IO_COUNTERS(ctypes.Structure):
+        _fields_ = [(name, ctypes.c_ulonglong) for name in (
+            'ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount',
+            'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount'
+        )]
+
+    class _PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    def _windows_usage(handle) -> Optional[ProcessUsage]:
+        """Счетчики процесса Windows по его дескриптору."""
+        try:
+            kernel32 = ctypes.windll.kernel32
+            psapi = ctypes.windll.psapi
+            creation, exit_time, kernel, user = (_FILETIME() for _ in range(4))
+            if not kernel32.GetProcessTimes(int(handle), ctypes.byref(creation), ctypes.byref(exit_time),
+                                            ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            # FILETIME - интервалы по 100 нс
+            cpu = sum((t.high << 32 | t.low) for t in (kernel, user)) / 10_000_000
+
+            memory = _PROCESS_MEMORY_COUNTERS()
+            memory.cb = ctypes.sizeof(memory)
+            psapi.GetProcessMemoryInfo(int(handle), ctypes.byref(memory), memory.cb)
+
+            io = _IO_COUNTERS()
+            kernel32.GetProcessIoCounters(int(handle), ctypes.byref(io))
+
+            return ProcessUsage(
+                cpu_time=cpu,
+                peak_rss_kb=memory.PeakWorkingSetSize // 1024,
+                bytes_read=io.ReadTransferCount,
+                bytes_written=io.WriteTransferCount,
+            )
+        except Exception as e:
+            logging.debug(f'Failed to read Windows process counters: {e}')
+            return None
+
+
+def self_usage() -> ProcessUsage:
+    """Накопленное использование ресурсов текущим процессом."""
+    if sys.platform == 'win32':
+        usage = _windows_usage(ctypes.windll.kernel32.GetCurrentProcess())
+        if usage:
+            return usage
+
+    usage = ProcessUsage(cpu_time=time.process_time())
+    if resource is not None:
+        usage.peak_rss_kb = _maxrss_kb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    io = _read_proc_io('self')
+    if io:
+        usage.bytes_read, usage.bytes_written = io
+    return usage
+
+
+class ChildMonitor:
+    """
+    Сбор использования ресурсов дочерним процессом.
+
+    На POSIX процесс ожидается через os.wait4, поэтому его нельзя завершать
+    через Popen.poll()/kill() из других потоков - используйте kill().
+    """
+
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self._io: Optional[Tuple[int, int]] = None
+        self._reaped = False
+        self._lock = threading.Lock()
+
+    def sample(self) -> None:
+        """Запоминает счетчики ввода-вывода живого процесса (Linux)."""
+        io = _read_proc_io(self.process.pid)
+        if io:
+            self._io = io
+
+    def kill(self) -> None:
+        """Принудительно завершает процесс, если он еще не собран."""
+        with self._lock:
+            if self._reaped or self.process.returncode is not None:
+                return
+            if os.name == 'posix':
+                try:
+                    os.kill(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                self.process.kill()
+
+    def wait(self) -> Tuple[int, Optional[ProcessUsage]]:
+        """
+        Ожидает завершения процесса.
+
+        Returns:
+            Кортеж (код возврата, использование ресурсов или None)
+        """
+        if os.name != 'posix' or not hasattr(os, 'wait4'):
+            return_code = self.process.wait()
+            usage = _windows_usage(self.process._handle) if sys.platform == 'win32' else None
+            return return_code, usage
+
+        self.sample()
+        try:
+            _, status, rusage = os.wait4(self.process.pid, 0)
+        except ChildProcessError:
+            # Процесс уже собран через Popen - остаются только код возврата
+            return self.process.wait(), None
+        with self._lock:
+            self._reaped = True
+            self.process.returncode = os.waitstatus_to_exitcode(status)
+
+        usage = ProcessUsage(
+            cpu_time=rusage.ru_utime + rusage.ru_stime,
+            peak_rss_kb=_maxrss_kb(rusage.ru_maxrss),
+        )
+        if self._io:
+            usage.bytes_read, usage.bytes_written = self._io
+        else:
+            # Без /proc - только блочный ввод-вывод (блоки по 512 байт)
+            usage.bytes_read = rusage.ru_inblock * 512
+            usage.bytes_written = rusage.ru_oublock * 512
+        return self.process.returncode, usage
+
+
+# --- Стадии и отчеты ---
+
+_active = threading.local()
+
+
+def _active_stages() -> List[StageUsage]:
+    if not hasattr(_active, 'stages'):
+        _active.stages = []
+    return _active.stages
+
+
+_merge_lock = threading.Lock()
+
+
+def record_child_usage(usage: Optional[ProcessUsage]) -> None:
+    """Добавляет использование дочернего процесса ко всем активным стадиям потока."""
+    if usage is None:
+        return
+    with _merge_lock:
+        for stage in _active_stages():
+            stage._children.merge(usage)
+
+
+def bind_active_stages(func: Callable) -> Callable:
+    """
+    Привязывает func к активным стадиям текущего потока.
+
+    Нужна, когда одна стадия запускает процессы из пула потоков (например,
+    сегменты одного файла): их использование попадает в стадию вызывающего.
+    """
+    stages = list(_active_stages())
+
+    def run(*args, **kwargs):
+        previous = _active_stages()
+        _active.stages = previous + stages
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _active.stages = previous
+    return run
+
+
+class ResourceReport:
+    """
+    Отчет об использовании ресурсов одной пачки.
+
+    Записи дописываются в <name>.jsonl сразу по завершении стадии,
+    CSV и сводка пишутся методом finish().
+    """
+
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(get_logs_directory(), 'resources')
+        os.makedirs(self.directory, exist_ok=True)
+        self.jsonl_path = os.path.join(self.directory, f'{name}.jsonl')
+        self.csv_path = os.path.join(self.directory, f'{name}.csv')
+        self.records: List[StageUsage] = []
+        self._lock = threading.Lock()
+        # CPU всех потоков процесса считается один раз на пачку, а не в каждой записи
+        self._process_cpu_start = self_usage().cpu_time
+
+    @classmethod
+    def for_batch(cls, prefix: str = 'batch') -> 'ResourceReport':
+        """Новый отчет с именем по времени запуска пачки."""
+        return cls(f'{prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
+
+    def add(self, record: StageUsage) -> None:
+        """Сохраняет запись и дописывает ее в JSONL."""
+        with self._lock:
+            self.records.append(record)
+            try:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+            except OSError as e:
+                logging.warning(f'Failed to write resource report {self.jsonl_path}: {e}')
+
+    @contextmanager
+    def track(self, stage: str, label: str = '', output_path: Optional[str] = None) -> Iterator[StageUsage]:
+        """
+        Замеряет ресурсы блока кода как одну стадию.
+
+        Args:
+            stage: Имя стадии ('crop_detect', 'extract_audio', 'whisper', 'ffmpeg', 'upload'...)
+            label: Имя файла или задания
+            output_path: Файл результата, размер которого попадет в отчет
+        """
+        record = StageUsage(stage=stage, label=label, started_at=datetime.now().isoformat(timespec='seconds'))
+        before = self_usage()
+        thread_cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        stages = _active_stages()
+        stages.append(record)
+        try:
+            yield record
+        except BaseException as e:
+            record.ok = False
+            record.error = f'{type(e).__name__}: {e}'[:300]
+            raise
+        finally:
+            stages.remove(record)
+            after = self_usage()
+            children = record._children
+            record.wall_time = round(time.perf_counter() - wall_start, 3)
+            record.cpu_time = round(time.thread_time() - thread_cpu_start, 3)
+            record.child_cpu_time = round(children.cpu_time, 3)
+            record.child_peak_rss_kb = children.peak_rss_kb
+            record.peak_rss_kb = max(after.peak_rss_kb, children.peak_rss_kb)
+            record.bytes_read = max(0, after.bytes_read - before.bytes_read) + children.bytes_read
+            record.bytes_written = max(0, after.bytes_written - before.bytes_written) + children.bytes_written
+            if output_path and os.path.exists(output_path):
+                record.output_size = os.path.getsize(output_path)
+            self.add(record)
+
+    def summary(self, top: int = REPORT_TOP_CONSUMERS) -> str:
+        """Текстовая сводка: итоги по стадиям и самые долгие задания."""
+        with self._lock:
+            records = list(self.records)
+        if not records:
+            return 'Нет данных об использовании ресурсов.'
+
+        totals: Dict[str, List[float]] = {}
+        for record in records:
+            total = totals.setdefault(record.stage, [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += record.wall_time
+            total[2] += record.cpu_time + record.child_cpu_time
+
+        lines = ['Стадии (время / CPU):']
+        for stage, (count, wall, cpu) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f'  {stage:<14} x{count:<3} {wall:9.1f} s  CPU {cpu:9.1f} s')
+
+        lines.append(f'  CPU приложения за пачку (все потоки, без дочерних процессов): {self_usage().cpu_time - self._process_cpu_start:.1f} s')
+
+        lines.append(f'Самые долгие задания (топ-{top}):')
+        for record in sorted(records, key=lambda r: -r.wall_time)[:top]:
+            lines.append(
+                f'  {record.stage:<14} {record.label:<30} {record.wall_time:8.1f} s  '
+                f'CPU {record.cpu_time + record.child_cpu_time:8.1f} s  '
+                f'RSS {record.peak_rss_kb / 1024:7.0f} MB'
+            )
+        return '\n'.join(lines)
+
+    def finish(self) -> str:
+        """
+        Пишет CSV и сводку в лог.
+
+        Returns:
+            Текст сводки
+        """
+        with self._lock:
+            records = list(self.records)
+        if records:
+            try:
+                with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                    writer.writeheader()
+                    for record in records:
+                        writer.writerow(record.to_dict())
+            except OSError as e:
+                logging.warning(f'Failed to write resource report {self.csv_path}: {e}')
+
+        summary = self.summary()
+        logging.info(f'Resource report {self.jsonl_path}\n{summary}')
+        return summary
+
+
+_session_reports: Dict[str, ResourceReport] = {}
+_session_lock = threading.Lock()
+
+
+def session_report(prefix: str) -> ResourceReport:
+    """
+    Общий отчет на весь запуск приложения для заданий вне пачек (например, загрузок).
+    
+    Args:
+        prefix: Префикс имени файла отчета
+    """
+    with _session_lock:
+        if prefix not in _session_reports:
+            _session_reports[prefix] = ResourceReport.for_batch(prefix)
+        return _session_reports[prefix]
+
+
+@contextmanager
+def track_stage(report: Optional[ResourceReport], stage: str, label: str = '',
+                output_path: Optional[str] = None) -> Iterator[Optional[StageUsage]]:
+    """Как ResourceReport.track, но без отчета (report=None) ничего не замеряет."""
+    if report is None:
+        yield None
+        return
+    with report.track(stage, label, output_path) as record:
+        yield record
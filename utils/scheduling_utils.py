@@ -0,0 +1,184 @@
+"""
+Job scheduling utilities: per-job thread budgets and CPU affinity.
+Утилиты планирования заданий: потоки на задание и привязка к ядрам.
+
+Когда несколько кодирований идут одновременно, каждый libx264 по умолчанию
+берет все ядра плюс потоки lookahead, а фильтры - столько же потоков.
+ThreadPlan делит доступные ядра между заданиями и превращает долю задания
+в аргументы FFmpeg (-threads, -filter_threads, -filter_complex_threads,
+lookahead_threads для x264) и, по желанию, в набор ядер для привязки.
+"""
+
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+
+def available_cpu_count() -> int:
+    """Количество ядер, доступных процессу (с учетом привязки, если ОС ее сообщает)."""
+    if hasattr(os, 'sched_getaffinity'):
+        try:
+            return max(1, len(os.sched_getaffinity(0)))
+        except OSError:
+            pass
+    return max(1, os.cpu_count() or 1)
+
+
+def _available_cpus() -> List[int]:
+    """Номера доступных ядер по порядку."""
+    if hasattr(os, 'sched_getaffinity'):
+        try:
+            return sorted(os.sched_getaffinity(0))
+        except OSError:
+            pass
+    return list(range(os.cpu_count() or 1))
+
+
+@dataclass(frozen=True)
+class ThreadPlan:
+    """
+    Бюджет потоков одного задания FFmpeg.
+
+    Значение 0 означает "не задавать" (решает FFmpeg), поэтому ThreadPlan()
+    без аргументов не меняет команду.
+    """
+    threads: int = 0  # Потоки кодировщика и декодера
+    filter_threads: int = 0
+    filter_complex_threads: int = 0
+    lookahead_threads: int = 0  # Только для libx264
+    cpu_set: Optional[Tuple[int, ...]] = None
+
+    @property
+    def is_default(self) -> bool:
+        return not (self.threads or self.filter_threads or self.filter_complex_threads
+                    or self.lookahead_threads or self.cpu_set)
+
+    def global_args(self) -> List[str]:
+        """Глобальные аргументы (до входных файлов)."""
+        args = []
+        if self.filter_threads:
+            args.extend(['-filter_threads', str(self.filter_threads)])
+        if self.filter_complex_threads:
+            args.extend(['-filter_complex_threads', str(self.filter_complex_threads)])
+        return args
+
+    def input_args(self) -> List[str]:
+        """Аргументы перед основным входом (потоки декодера)."""
+        return ['-threads', str(self.threads)] if self.threads else []
+
+    def x264_params(self) -> List[str]:
+        """Параметры x264 для -x264-params."""
+        return [f'lookahead_threads={self.lookahead_threads}'] if self.lookahead_threads else []
+
+    def output_args(self, codec: str) -> List[str]:
+        """Аргументы кодировщика (после -c:v)."""
+        args = []
+        if self.threads:
+            args.extend(['-threads', str(self.threads)])
+        if codec == 'libx264' and self.x264_params():
+            args.extend(['-x264-params', ':'.join(self.x264_params())])
+        return args
+
+
+def plan_threads(job_count: int, slot: int = 0, cpu_count: Optional[int] = None,
+                 pin: bool = False) -> ThreadPlan:
+    """
+    Делит ядра между одновременными заданиями.
+
+    Args:
+        job_count: Сколько заданий FFmpeg идут одновременно
+        slot: Номер слота задания (0..job_count-1), определяет набор ядер при pin
+        cpu_count: Количество ядер (по умолчанию - доступные процессу)
+        pin: Привязать задание к своему набору ядер
+
+    Returns:
+        ThreadPlan; для одного задания - план по умолчанию (FFmpeg решает сам)
+    """
+    if job_count <= 1:
+        return ThreadPlan()
+
+    cpus = _available_cpus()
+    if cpu_count:
+        cpus = cpus[:cpu_count] if len(cpus) >= cpu_count else list(range(cpu_count))
+    per_job = max(1, len(cpus) // job_count)
+
+    cpu_set = None
+    if pin and len(cpus) >= job_count:
+        start = (slot % job_count) * per_job
+        cpu_set = tuple(cpus[start:start + per_job])
+
+    return ThreadPlan(
+        threads=per_job,
+        # Фильтры и кодировщик работают конвейером, им хватает половины доли
+        filter_threads=max(1, per_job // 2),
+        filter_complex_threads=max(1, per_job // 2),
+        # По умолчанию x264 берет threads/6 потоков lookahead поверх основных
+        lookahead_threads=max(1, per_job // 6),
+        cpu_set=cpu_set,
+    )
+
+
+def split_thread_plan(plan: ThreadPlan, parts: int, slot: int = 0) -> ThreadPlan:
+    """
+    Делит бюджет одного задания между его частями (например, сегментами файла).
+
+    Args:
+        plan: План задания; план по умолчанию означает "все доступные ядра"
+        parts: Сколько частей работают одновременно
+        slot: Номер части
+
+    Returns:
+        План одной части; привязка к ядрам задания сохраняется
+    """
+    if parts <= 1:
+        return plan
+    if not plan.threads:
+        return plan_threads(parts, slot)
+    return ThreadPlan(
+        threads=max(1, plan.threads // parts),
+        filter_threads=max(1, plan.filter_threads // parts),
+        filter_complex_threads=max(1, plan.filter_complex_threads // parts),
+        lookahead_threads=max(1, plan.lookahead_threads // parts),
+        cpu_set=plan.cpu_set,
+    )
+
+
+def set_process_affinity(pid: int, cpus: Sequence[int], handle=None) -> bool:
+    """
+    Привязывает запущенный процесс к набору ядер.
+
+    На Linux привязываются все уже созданные потоки процесса, новые потоки
+    наследуют привязку. На Windows используется SetProcessAffinityMask.
+    На остальных ОС привязка не поддерживается.
+
+    Args:
+        pid: Идентификатор процесса
+        cpus: Номера ядер
+        handle: Дескриптор процесса (Windows, Popen._handle)
+
+    Returns:
+        True если привязка применена
+    """
+    if not cpus:
+        return False
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            task_dir = f'/proc/{pid}/task'
+            tids = [int(t) for t in os.listdir(task_dir)] if os.path.isdir(task_dir) else [pid]
+            for tid in tids:
+                try:
+                    os.sched_setaffinity(tid, set(cpus))
+                except ProcessLookupError:
+                    pass
+            return True
+        if sys.platform == 'win32' and handle is not None:
+            import ctypes
+            mask = 0
+            for cpu in cpus:
+                mask |= 1 << cpu
+            return bool(ctypes.windll.kernel32.SetProcessAffinityMask(int(handle), ctypes.c_size_t(mask)))
+    except OSError as e:
+        logging.warning(f'Failed to set CPU affinity for process {pid}: {e}')
+    return False
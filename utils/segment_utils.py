@@ -0,0 +1,124 @@
+"""
+Segment planning utilities for split-encode-concat processing.
+Утилиты планирования сегментов для режима "разрезать - закодировать - склеить".
+
+Длинный файл делится по ключевым кадрам на отрезки, каждый отрезок
+кодируется отдельным процессом FFmpeg с тем же графом фильтров, а
+результаты склеиваются concat-демультиплексором без перекодирования.
+Здесь только чистая логика: выбор точек разреза и сдвиг субтитров
+на начало отрезка. Запуск FFmpeg - в utils.ffmpeg_utils.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Отрезок исходного видео в секундах от начала файла."""
+    index: int
+    start: float
+    end: Optional[float]  # None - до конца файла
+
+    def source_duration(self, total: float) -> float:
+        """Длительность отрезка во входном файле."""
+        end = total if self.end is None else self.end
+        return max(0.0, end - self.start)
+
+
+def plan_segments(keyframes: Sequence[float], duration: float, count: int,
+                  min_duration: float) -> List[Segment]:
+    """
+    Делит файл на count отрезков, начинающихся с ключевых кадров.
+
+    Для каждой равномерной точки разреза выбирается ближайший ключевой
+    кадр; отрезки короче min_duration не создаются.
+
+    Args:
+        keyframes: Время ключевых кадров от начала файла, в секундах
+        duration: Длительность файла
+        count: Желаемое количество отрезков
+        min_duration: Минимальная длительность отрезка
+
+    Returns:
+        Список отрезков; один отрезок, если делить нечего
+    """
+    count = min(count, int(duration // min_duration)) if min_duration > 0 else count
+    if count <= 1 or duration <= 0:
+        return [Segment(0, 0.0, None)]
+
+    candidates = sorted(k for k in keyframes if 0 < k < duration)
+    cuts = []
+    for part in range(1, count):
+        target = duration * part / count
+        previous = cuts[-1] if cuts else 0.0
+        allowed = [k for k in candidates
+                   if k - previous >= min_duration and duration - k >= min_duration]
+        if not allowed:
+            break
+        cut = min(allowed, key=lambda k: abs(k - target))
+        if cut > previous:
+            cuts.append(cut)
+
+    bounds = [0.0] + cuts
+    return [Segment(i, start, bounds[i + 1] if i + 1 < len(bounds) else None)
+            for i, start in enumerate(bounds)]
+
+
+_SRT_TIME = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)')
+
+
+def _parse_srt_time(text: str) -> float:
+    h, m, s, ms = _SRT_TIME.match(text.strip()).groups()
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms.ljust(3, '0')[:3]) / 1000
+
+
+def _format_srt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    h, rem = divmod(millis, 3600 * 1000)
+    m, rem = divmod(rem, 60 * 1000)
+    s, ms = divmod(rem, 1000)
+    return f'{h:02}:{m:02}:{s:02},{ms:03}'
+
+
+def shift_srt(srt_path: str, out_path: str, offset: float, end: Optional[float] = None) -> str:
+    """
+    Сохраняет субтитры отрезка: время сдвигается на -offset.
+
+    Фразы, закончившиеся до начала отрезка или начавшиеся после end,
+    отбрасываются; фраза на границе обрезается до 0.
+
+    Args:
+        srt_path: Исходный SRT файл
+        out_path: Путь для SRT отрезка
+        offset: Начало отрезка в секундах
+        end: Конец отрезка (None - до конца)
+
+    Returns:
+        out_path
+    """
+    with open(srt_path, 'r', encoding='utf-8-sig') as f:
+        blocks = re.split(r'\n\s*\n', f.read().replace('\r\n', '\n').strip())
+
+    entries = []
+    for block in blocks:
+        lines = block.split('\n')
+        timing = next((i for i, line in enumerate(lines) if '-->' in line), None)
+        if timing is None:
+            continue
+        start_text, _, end_text = lines[timing].partition('-->')
+        try:
+            start = _parse_srt_time(start_text)
+            stop = _parse_srt_time(end_text)
+        except AttributeError:
+            continue
+        if stop <= offset or (end is not None and start >= end):
+            continue
+        times = f'{_format_srt_time(max(0.0, start - offset))} --> {_format_srt_time(stop - offset)}'
+        entries.append([times] + lines[timing + 1:])
+
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for number, entry in enumerate(entries, 1):
+            f.write(f'{number}\n' + '\n'.join(entry) + '\n\n')
+    return out_path
@@ -0,0 +1,218 @@
+"""
+Lazy registry of external tools: ffmpeg, ffprobe and yt-dlp.
+Ленивый реестр внешних инструментов: ffmpeg, ffprobe и yt-dlp.
+
+Пути ищутся при первом обращении, а не при импорте модулей обработки:
+    - имя файла зависит от ОС (ffmpeg.exe на Windows, ffmpeg на Linux/macOS);
+    - сначала проверяется папка bin рядом с приложением, затем системный PATH;
+    - ffprobe дополнительно ищется рядом с найденным ffmpeg;
+    - путь, версия и возможности сборки FFmpeg (кодировщики, фильтры,
+      аппаратные ускорители) определяются один раз и кешируются;
+    - reset_tools() сбрасывает кеш, например после установки FFmpeg.
+"""
+
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional
+
+from utils.constants import TOOLS_BIN_DIR
+from utils.path_utils import resource_path
+from utils.process_utils import TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP, run_process
+
+# Предел времени запроса версии и возможностей, секунды
+TOOL_PROBE_TIMEOUT = 15
+
+# Имена инструментов для сообщений об ошибках
+TOOL_DISPLAY_NAMES = {TOOL_FFMPEG: 'FFmpeg', TOOL_FFPROBE: 'ffprobe', TOOL_YTDLP: 'yt-dlp'}
+
+# Аргумент вывода версии каждого инструмента
+_VERSION_ARGS = {TOOL_FFMPEG: '-version', TOOL_FFPROBE: '-version', TOOL_YTDLP: '--version'}
+
+# Строки списков -encoders и -filters: флаги, затем имя
+_ENCODER_LINE = re.compile(r'^\s*[VAS][A-Z.]{5}\s+(\S+)')
+_FILTER_LINE = re.compile(r'^\s*[T.][S.][C.]\s+(\S+)\s+\S+->\S+')
+
+
+@dataclass(frozen=True)
+class FFmpegCapabilities:
+    """Возможности сборки FFmpeg."""
+    encoders: FrozenSet[str]
+    filters: FrozenSet[str]
+    hwaccels: FrozenSet[str]
+
+
+# _lock защищает словари и держится только на время чтения и записи; запуски
+# инструментов для версий и возможностей идут под своими блокировками, чтобы
+# find_tool() не ждал их (до TOOL_PROBE_TIMEOUT секунд на запуск)
+_lock = threading.RLock()
+_version_lock = threading.Lock()
+_capabilities_lock = threading.Lock()
+_paths: Dict[str, Optional[str]] = {}
+_versions: Dict[str, str] = {}
+_capabilities: Dict[str, Optional[FFmpegCapabilities]] = {}
+
+
+def executable_name(tool: str) -> str:
+    """Имя исполняемого файла инструмента для текущей ОС."""
+    return f'{tool}.exe' if sys.platform == 'win32' else tool
+
+
+def _resolve(tool: str) -> Optional[str]:
+    """Ищет инструмент: папка bin приложения, папка ffmpeg (для ffprobe), системный PATH."""
+    name = executable_name(tool)
+    candidates = [resource_path(os.path.join(TOOLS_BIN_DIR, name))]
+    if tool == TOOL_FFPROBE:
+        ffmpeg_path = find_tool(TOOL_FFMPEG)
+        if ffmpeg_path:
+            candidates.append(os.path.join(os.path.dirname(ffmpeg_path), name))
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+
+    system_path = shutil.which(name)
+    if system_path:
+        logging.info(f"Info: Using '{name}' found in system PATH: {system_path}")
+        return system_path
+
+    logging.warning(f"Warning: '{name}' not found at '{candidates[0]}' or in system PATH.")
+    return None
+
+
+def find_tool(tool: str) -> Optional[str]:
+    """
+    Путь к инструменту; поиск выполняется при первом обращении.
+
+    Args:
+        tool: Имя инструмента (TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP)
+
+    Returns:
+        Путь к исполняемому файлу или None, если инструмент не найден
+    """
+    with _lock:
+        if tool not in _paths:
+            _paths[tool] = _resolve(tool)
+        return _paths[tool]
+
+
+def get_tool_path(tool: str) -> str:
+    """
+    Путь к инструменту для запуска.
+
+    Args:
+        tool: Имя инструмента (TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP)
+
+    Returns:
+        Путь к исполняемому файлу
+
+    Raises:
+        FileNotFoundError: Если инструмент не найден
+    """
+    path = find_tool(tool)
+    if not path:
+        raise FileNotFoundError(f'{TOOL_DISPLAY_NAMES.get(tool, tool)} not found at local path or in system PATH.')
+    return path
+
+
+def _probe_output(tool: str, args) -> Optional[str]:
+    """Вывод служебного запуска инструмента или None, если он не удался."""
+    path = find_tool(tool)
+    if not path:
+        return None
+    try:
+        result = run_process(tool, [path] + list(args), timeout=TOOL_PROBE_TIMEOUT,
+                             cwd=os.path.dirname(path), check=True)
+        return result.stdout
+    except Exception as e:
+        logging.warning(f"Could not query '{path} {' '.join(args)}': {e}")
+        return None
+
+
+def tool_version(tool: str) -> str:
+    """
+    Версия инструмента (например, '7.0.2' или '2024.08.06').
+
+    Args:
+        tool: Имя инструмента
+
+    Returns:
+        Строка версии или пустая строка, если ее не удалось получить
+    """
+    with _version_lock:
+        with _lock:
+            if tool in _versions:
+                return _versions[tool]
+        output = _probe_output(tool, [_VERSION_ARGS[tool]]) or ''
+        first_line = output.strip().splitlines()[0] if output.strip() else ''
+        match = re.search(r'version\s+(\S+)', first_line)
+        version = match.group(1) if match else first_line.strip()
+        with _lock:
+            _versions[tool] = version
+        return version
+
+
+def _parse_names(output: str, pattern: re.Pattern) -> FrozenSet[str]:
+    names = set()
+    for line in output.splitlines():
+        match = pattern.match(line)
+        if match:
+            names.add(match.group(1))
+    return frozenset(names)
+
+
+def ffmpeg_capabilities() -> Optional[FFmpegCapabilities]:
+    """
+    Кодировщики, фильтры и аппаратные ускорители найденной сборки FFmpeg.
+
+    Returns:
+        FFmpegCapabilities или None, если FFmpeg не найден или не ответил
+    """
+    with _capabilities_lock:
+        with _lock:
+            if TOOL_FFMPEG in _capabilities:
+                return _capabilities[TOOL_FFMPEG]
+        encoders = _probe_output(TOOL_FFMPEG, ['-hide_banner', '-encoders'])
+        filters = _probe_output(TOOL_FFMPEG, ['-hide_banner', '-filters'])
+        hwaccels = _probe_output(TOOL_FFMPEG, ['-hide_banner', '-hwaccels'])
+        if encoders is None or filters is None:
+            capabilities = None
+        else:
+            capabilities = FFmpegCapabilities(
+                encoders=_parse_names(encoders, _ENCODER_LINE),
+                filters=_parse_names(filters, _FILTER_LINE),
+                hwaccels=frozenset(line.strip() for line in (hwaccels or '').splitlines()[1:] if line.strip()),
+            )
+        with _lock:
+            _capabilities[TOOL_FFMPEG] = capabilities
+        return capabilities
+
+
+def has_encoder(name: str) -> bool:
+    """Есть ли кодировщик в сборке FFmpeg; если список неизвестен, считается, что есть."""
+    capabilities = ffmpeg_capabilities()
+    return capabilities is None or name in capabilities.encoders
+
+
+def describe_tools() -> str:
+    """Строка для лога: найденные инструменты, их версии и пути."""
+    parts = []
+    for tool in (TOOL_FFMPEG, TOOL_FFPROBE, TOOL_YTDLP):
+        path = find_tool(tool)
+        if path:
+            parts.append(f'{tool} {tool_version(tool) or "?"} ({path})')
+        else:
+            parts.append(f'{tool} not found')
+    return 'Tools: ' + '; '.join(parts)
+
+
+def reset_tools() -> None:
+    """Сбрасывает найденные пути, версии и возможности (следующее обращение ищет заново)."""
+    with _lock:
+        _paths.clear()
+        _versions.clear()
+        _capabilities.clear()
@@ -4,25 +4,74 @@ YouTube utilities module for downloading videos using yt-dlp.
 """
 
 import subprocess
-import platform
+import json
 import shlex
 import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.constants import YTDLP_INFO_TIMEOUT
 from utils.path_utils import get_ytdlp_path, resource_path
+from utils.process_utils import TOOL_YTDLP, ProcessCancelledError, run_process
+
+
+class DownloadCancelledError(ProcessCancelledError):
+    """Скачивание остановлено по запросу пользователя."""
+
+
+# Строки вывода yt-dlp (с --newline), из которых берется прогресс
+_DOWNLOAD_PERCENT = re.compile(r'^\[download\]\s+([\d.]+)%')
+_DOWNLOAD_FORMATS = re.compile(r'^\[info\].*Downloading \d+ format\(s\):\s*(\S+)')
+_DOWNLOAD_DESTINATION = re.compile(r'^\[download\] Destination:')
+
+
+# Формат по умолчанию: лучшее видео MP4 со звуком M4A
+DEFAULT_FORMAT_SELECTOR = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+# Сколько секунд хранится результат --dump-json (ссылки на потоки со временем устаревают)
+VIDEO_INFO_TTL = 1800
 
+# Форматы, которые yt-dlp может отдать в stdout для обработки на лету:
+# один файл с видео и звуком, скачиваемый по HTTP(S)
+STREAM_PROTOCOLS = ('https', 'http')
+STREAM_EXTENSIONS = ('mp4', 'webm')
 
-def download_video(url: str, out_path: str) -> bool:
+# Поля, которые yt-dlp записывает в файл метаданных после скачивания
+DOWNLOAD_METADATA_TEMPLATE = 'after_move:%(.{extractor_key,id,format_id,width,height,duration,title})j'
+
+
+def download_video(url: str, out_path: str,
+                   progress_callback: Optional[Callable[[float], None]] = None,
+                   cancel_event: Optional[threading.Event] = None,
+                   metadata_path: Optional[str] = None,
+                   format_selector: str = DEFAULT_FORMAT_SELECTOR,
+                   section: Optional[Tuple[float, float]] = None,
+                   info_path: Optional[str] = None) -> bool:
     """
     Downloads a video from a URL using a bundled youtube-dlp.
     
+    Если выбраны отдельные видео и аудио потоки (формат вида 137+140),
+    прогресс считается по частям: каждая часть - равная доля от 100%.
+    
     Args:
         url: URL видео для скачивания
         out_path: Путь для сохранения видео
+        progress_callback: Функция обратного вызова с процентом скачивания (0-100)
+        cancel_event: Событие отмены; процесс yt-dlp завершается сразу
+        metadata_path: Файл, в который yt-dlp запишет JSON с экстрактором, ID и форматом
+        format_selector: Селектор формата yt-dlp (см. select_download_format)
+        section: Скачать только отрезок (начало, конец) в секундах
+        info_path: JSON из get_video_info: yt-dlp не извлекает информацию повторно
         
     Returns:
         True если скачивание прошло успешно, False в противном случае
         
     Raises:
         FileNotFoundError: Если yt-dlp не найден
+        DownloadCancelledError: Если скачивание отменено
         subprocess.CalledProcessError: Если yt-dlp завершился с ошибкой
         RuntimeError: При других ошибках выполнения
     """
@@ -32,68 +81,61 @@ def download_video(url: str, out_path: str) -> bool:
     # Команда для скачивания видео с лучшим качеством в формате MP4
     command = [
         yt_dlp_exe_path,
-        '-f', 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',  # Формат видео
+        '-f', format_selector,  # Формат видео
         '--merge-output-format', 'mp4',  # Объединить в MP4
+        '--no-playlist',  # Только видео, даже если в ссылке есть плейлист
+        '--newline',  # Прогресс построчно
         '-o', out_path,  # Выходной файл
-        url  # URL для скачивания
     ]
+    if metadata_path:
+        command.extend(['--print-to-file', DOWNLOAD_METADATA_TEMPLATE, metadata_path])
+    if section:
+        command.extend(['--download-sections', f'*{section[0]:g}-{section[1]:g}'])
+    # Источник: сохраненный JSON или URL для скачивания
+    command.extend(['--load-info-json', info_path] if info_path else [url])
 
     # Логирование команды
     print(f'Running youtube-dlp command: {" ".join(shlex.quote(c) for c in command)}')
     
-    # Настройка для Windows (скрытие окна консоли)
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
+    output_lines = []
+    progress = {'parts': 1, 'finished_parts': -1}
     
-    try:
-        # Запуск процесса с захватом вывода
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo
-        )
+    def handle_line(line: str) -> None:
+        line = line.strip()
+        if not line:
+            return
         
-        output_lines = []
+        match = _DOWNLOAD_PERCENT.match(line)
+        if match:
+            if progress_callback:
+                part_percent = min(100.0, float(match.group(1)))
+                progress_callback((max(0, progress['finished_parts']) + part_percent / 100) / progress['parts'] * 100)
+            return
         
-        # Чтение вывода в реальном времени
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                break
-                
-            line = line.strip()
-            if line:
-                print(f'youtube-dlp: {line}')
-                output_lines.append(line)
+        print(f'youtube-dlp: {line}')
+        output_lines.append(line)
         
-        # Закрытие потока и ожидание завершения
-        process.stdout.close()
-        return_code = process.wait()
+        match = _DOWNLOAD_FORMATS.match(line)
+        if match:
+            progress['parts'] = match.group(1).count('+') + 1
+        elif _DOWNLOAD_DESTINATION.match(line):
+            progress['finished_parts'] = min(progress['parts'] - 1, progress['finished_parts'] + 1)
+    
+    try:
+        # Вывод читается построчно в реальном времени, отмена завершает процесс сразу
+        result = run_process(TOOL_YTDLP, command, cancel_event=cancel_event, merge_stderr=True,
+                             on_stdout_line=handle_line, keep_lines=0)
         
         # Проверка кода возврата
-        if return_code != 0:
-            error_message = (
-                f'youtube-dlp failed with exit code {return_code} for URL \'{url}\'.\n'
-                f'Command: {" ".join(shlex.quote(c) for c in command)}\n'
-                f'Last lines of output:\n' + '\n'.join(output_lines[-15:])
-            )
+        if result.returncode != 0:
             raise subprocess.CalledProcessError(
-                return_code, 
+                result.returncode, 
                 command, 
                 output='\n'.join(output_lines)
             )
         
+        if progress_callback:
+            progress_callback(100.0)
         print(f"youtube-dlp successfully downloaded video to '{out_path}'")
         return True
         
@@ -102,18 +144,83 @@ def download_video(url: str, out_path: str) -> bool:
             f'youtube-dlp not found at the specified path: {yt_dlp_exe_path}. '
             "Please ensure it's included in the package."
         )
+    except ProcessCancelledError:
+        raise DownloadCancelledError(f"Download of '{url}' was cancelled.")
     except Exception as e:
         raise RuntimeError(f"An error occurred while running youtube-dlp for URL '{url}': {e}")
 
 
+def get_playlist_urls(url: str) -> list:
+    """
+    Разворачивает ссылку на плейлист в список ссылок на видео.
+    
+    Используется --flat-playlist: yt-dlp читает только список, не
+    открывая каждое видео. Для ссылки на одно видео возвращается [url].
+    
+    Args:
+        url: URL плейлиста или видео
+        
+    Returns:
+        Список URL видео
+        
+    Raises:
+        FileNotFoundError: Если yt-dlp не найден
+        RuntimeError: При ошибках выполнения
+    """
+    yt_dlp_exe_path = get_ytdlp_path()
+    
+    command = [
+        yt_dlp_exe_path,
+        '--flat-playlist',  # Только список записей
+        '--dump-single-json',  # Один JSON на весь плейлист
+        url
+    ]
+    
+    try:
+        result = run_process(TOOL_YTDLP, command, timeout=YTDLP_INFO_TIMEOUT, check=True)
+        
+        info = json.loads(result.stdout)
+        if info.get('_type') != 'playlist':
+            return [url]
+        
+        urls = []
+        for entry in info.get('entries') or []:
+            entry_url = entry.get('url') or entry.get('webpage_url')
+            if entry_url:
+                urls.append(entry_url)
+        return urls
+        
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f'youtube-dlp not found at the specified path: {yt_dlp_exe_path}. '
+            "Please ensure it's included in the package."
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to get playlist entries for URL '{url}': {e.stderr}")
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Failed to parse playlist JSON: {e}")
+
+
 # Дополнительные вспомогательные функции
 
-def get_video_info(url: str) -> dict:
+_video_info_cache: Dict[str, Tuple[float, dict]] = {}
+# Запросы yt-dlp, которые еще выполняются: второй вызов для той же ссылки ждет первый
+_video_info_pending: Dict[str, Future] = {}
+_video_info_lock = threading.Lock()
+
+
+def get_video_info(url: str, use_cache: bool = True) -> dict:
     """
     Получает информацию о видео без его скачивания.
     
+    Результат одного вызова yt-dlp --dump-json кешируется на VIDEO_INFO_TTL
+    секунд: название, длительность, форматы и выбор формата для скачивания
+    берутся из него без повторного запуска yt-dlp. Если информация о той
+    же ссылке уже запрашивается в другом потоке, вызов ждет ее результат.
+    
     Args:
         url: URL видео
+        use_cache: Взять результат из кеша, если он есть
         
     Returns:
         Словарь с информацией о видео
@@ -122,39 +229,53 @@ def get_video_info(url: str) -> dict:
         FileNotFoundError: Если yt-dlp не найден
         RuntimeError: При ошибках выполнения
     """
+    if not use_cache:
+        info = _fetch_video_info(url)
+        with _video_info_lock:
+            _video_info_cache[url] = (time.monotonic(), info)
+        return info
+    
+    with _video_info_lock:
+        cached = _video_info_cache.get(url)
+        if cached and time.monotonic() - cached[0] < VIDEO_INFO_TTL:
+            return cached[1]
+        pending = _video_info_pending.get(url)
+        if pending is None:
+            future = _video_info_pending[url] = Future()
+    if pending is not None:
+        # Ошибка первого запроса передается и ожидающим
+        return pending.result()
+    
+    try:
+        info = _fetch_video_info(url)
+    except BaseException as e:
+        with _video_info_lock:
+            del _video_info_pending[url]
+        future.set_exception(e)
+        raise
+    with _video_info_lock:
+        _video_info_cache[url] = (time.monotonic(), info)
+        del _video_info_pending[url]
+    future.set_result(info)
+    return info
+
+
+def _fetch_video_info(url: str) -> dict:
+    """Запускает yt-dlp --dump-json для одной ссылки."""
     yt_dlp_exe_path = get_ytdlp_path()
     
     command = [
         yt_dlp_exe_path,
         '--dump-json',  # Вывод информации в JSON
         '--no-download',  # Не скачивать видео
+        '--no-playlist',  # Только видео, даже если в ссылке есть плейлист
         url
     ]
     
-    # Настройка для Windows
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            check=True
-        )
+        result = run_process(TOOL_YTDLP, command, timeout=YTDLP_INFO_TIMEOUT, check=True)
         
-        import json
-        return json.loads(result.stdout)
+        info = json.loads(result.stdout)
         
     except FileNotFoundError:
         raise FileNotFoundError(
@@ -167,6 +288,113 @@ def get_video_info(url: str) -> dict:
         raise RuntimeError(f"Failed to parse video info JSON: {e}")
     except Exception as e:
         raise RuntimeError(f"An error occurred while getting video info for URL '{url}': {e}")
+    
+    return info
+
+
+def select_download_format(info: dict, fit_box: Optional[Tuple[int, int]] = None) -> str:
+    """
+    Выбирает формат для скачивания под итоговый кадр.
+    
+    Из форматов видео берется самый маленький, который не придется
+    увеличивать при вписывании в fit_box (ширина или высота не меньше
+    рамки), предпочтительно MP4/H.264. Если такого нет - самый большой.
+    Отдельный поток видео дополняется лучшим аудио.
+    
+    Args:
+        info: Информация о видео из get_video_info
+        fit_box: Рамка (ширина, высота) из filter_graph.source_fit_box; None - лучшее качество
+        
+    Returns:
+        Селектор формата yt-dlp с запасным вариантом DEFAULT_FORMAT_SELECTOR
+    """
+    if not fit_box:
+        return DEFAULT_FORMAT_SELECTOR
+    
+    box_w, box_h = fit_box
+    videos = [f for f in info.get('formats') or []
+              if f.get('vcodec') not in (None, 'none') and f.get('width') and f.get('height')
+              and f.get('format_id')]
+    if not videos:
+        return DEFAULT_FORMAT_SELECTOR
+    
+    covering = [f for f in videos if f['width'] >= box_w or f['height'] >= box_h]
+    chosen = (min(covering, key=_format_preference) if covering
+              else max(videos, key=lambda f: f['width'] * f['height']))
+    
+    format_id = chosen['format_id']
+    if chosen.get('acodec') in (None, 'none'):
+        selector = f'{format_id}+bestaudio[ext=m4a]/{format_id}+bestaudio'
+    else:
+        selector = format_id
+    return f'{selector}/{DEFAULT_FORMAT_SELECTOR}'
+
+
+def _format_preference(f: dict) -> tuple:
+    """Ключ выбора среди подходящих форматов: меньше пикселей, MP4/H.264, выше битрейт."""
+    is_h264_mp4 = f.get('ext') == 'mp4' and str(f.get('vcodec', '')).startswith('avc')
+    return (f['width'] * f['height'], not is_h264_mp4, -(f.get('tbr') or 0))
+
+
+def select_stream_format(info: dict, fit_box: Optional[Tuple[int, int]] = None) -> Optional[dict]:
+    """
+    Выбирает формат для обработки без сохранения файла (yt-dlp -o -).
+    
+    Подходит только один файл с видео и звуком (STREAM_EXTENSIONS по
+    STREAM_PROTOCOLS): отдельные потоки видео и аудио yt-dlp склеивает
+    на диске, и в канал их не отдать. Формат должен покрывать fit_box так же,
+    как в select_download_format; без рамки - не уступать лучшему видео.
+    
+    Args:
+        info: Информация о видео из get_video_info
+        fit_box: Рамка (ширина, высота) из filter_graph.source_fit_box; None - лучшее качество
+        
+    Returns:
+        Словарь формата из info['formats'] или None, если нужно скачивать файл
+    """
+    formats = [f for f in info.get('formats') or []
+               if f.get('vcodec') not in (None, 'none') and f.get('width') and f.get('height')
+               and f.get('format_id')]
+    progressive = [f for f in formats
+                   if f.get('acodec') not in (None, 'none') and f.get('protocol') in STREAM_PROTOCOLS
+                   and f.get('ext') in STREAM_EXTENSIONS]
+    if not progressive:
+        return None
+    
+    if fit_box:
+        box_w, box_h = fit_box
+        covering = [f for f in progressive if f['width'] >= box_w or f['height'] >= box_h]
+        return min(covering, key=_format_preference) if covering else None
+    
+    best = max(progressive, key=lambda f: f['width'] * f['height'])
+    if best['width'] * best['height'] < max(f['width'] * f['height'] for f in formats):
+        return None
+    return best
+
+
+def stream_command(url: str, format_id: str, info_path: Optional[str] = None) -> list:
+    """
+    Команда yt-dlp, которая пишет выбранный формат в stdout.
+    
+    Args:
+        url: URL видео
+        format_id: ID формата (см. select_stream_format)
+        info_path: JSON из get_video_info: yt-dlp не извлекает информацию повторно
+        
+    Returns:
+        Список аргументов для subprocess
+    """
+    command = [
+        get_ytdlp_path(),
+        '-f', format_id,
+        '--no-playlist',
+        '--no-part',
+        '--quiet',  # В stdout идет только видео
+        '--no-warnings',
+        '-o', '-',
+    ]
+    command.extend(['--load-info-json', info_path] if info_path else [url])
+    return command
 
 
 def download_audio_only(url: str, out_path: str, format: str = 'mp3') -> bool:
@@ -198,27 +426,8 @@ def download_audio_only(url: str, out_path: str, format: str = 'mp3') -> bool:
     
     print(f'Running youtube-dlp audio download: {" ".join(shlex.quote(c) for c in command)}')
     
-    # Настройка для Windows
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            check=True
-        )
+        result = run_process(TOOL_YTDLP, command, check=True)
         
         print(f"youtube-dlp successfully downloaded audio to '{out_path}'")
         return True
@@ -238,69 +447,25 @@ def get_available_formats(url: str) -> list:
     """
     Получает список доступных форматов для видео.
     
+    Форматы берутся из кешированного результата get_video_info.
+    
     Args:
         url: URL видео
         
     Returns:
-        Список доступных форматов
+        Список строк вида "137 mp4 1920x1080 1080p"
         
     Raises:
         FileNotFoundError: Если yt-dlp не найден
         RuntimeError: При ошибках выполнения
     """
-    yt_dlp_exe_path = get_ytdlp_path()
-    
-    command = [
-        yt_dlp_exe_path,
-        '--list-formats',  # Список форматов
-        '--no-download',   # Не скачивать
-        url
-    ]
-    
-    # Настройка для Windows
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
-    try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            check=True
-        )
-        
-        # Парсим вывод форматов
-        formats = []
-        lines = result.stdout.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('[') and 'format code' not in line.lower():
-                # Простое извлечение информации о формате
-                if ' ' in line:
-                    formats.append(line)
-        
-        return formats
-        
-    except FileNotFoundError:
-        raise FileNotFoundError(
-            f'youtube-dlp not found at the specified path: {yt_dlp_exe_path}. '
-            "Please ensure it's included in the package."
-        )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to get formats for URL '{url}': {e.stderr}")
-    except Exception as e:
-        raise RuntimeError(f"An error occurred while getting formats for URL '{url}': {e}")
+    formats = []
+    for f in get_video_info(url).get('formats') or []:
+        resolution = f.get('resolution') or (f"{f['width']}x{f['height']}" if f.get('width') else 'audio only')
+        formats.append(' '.join(str(part) for part in (
+            f.get('format_id'), f.get('ext'), resolution, f.get('format_note') or ''
+        )).strip())
+    return formats
 
 
 def download_with_custom_format(url: str, out_path: str, format_selector: str) -> bool:
@@ -331,27 +496,8 @@ def download_with_custom_format(url: str, out_path: str, format_selector: str) -
     
     print(f'Running youtube-dlp with custom format: {" ".join(shlex.quote(c) for c in command)}')
     
-    # Настройка для Windows
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            check=True
-        )
+        result = run_process(TOOL_YTDLP, command, check=True)
         
         print(f"youtube-dlp successfully downloaded video to '{out_path}'")
         return True
@@ -386,27 +532,8 @@ def validate_url(url: str) -> bool:
         url
     ]
     
-    # Настройка для Windows
-    creationflags = 0
-    startupinfo = None
-    
-    if platform.system() == 'Windows':
-        creationflags = subprocess.CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            creationflags=creationflags,
-            startupinfo=startupinfo,
-            timeout=30  # Таймаут 30 секунд
-        )
+        result = run_process(TOOL_YTDLP, command, timeout=30)  # Таймаут 30 секунд
         
         return result.returncode == 0
         
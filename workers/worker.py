@@ -1,22 +1,40 @@
 from PyQt5.QtCore import QThread, pyqtSignal
 import os
+import queue
 import random
 import subprocess
+import threading
 import uuid
-from typing import List, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import List, Optional, Dict, Tuple
 
-from utils.ffmpeg_utils import process_single, detect_crop_dimensions
+from utils.constants import (
+    BLUR_MODE_QUALITY, ENCODE_PROFILE_BALANCED, DEFAULT_TARGET_SIZE_MB, AUTO_FASTER_BACKLOG, AUTO_FASTER_PRESET,
+    REELS_FORMAT_NAME, DOWNLOAD_JOBS_DEFAULT
+)
+from utils.download_utils import DownloadCache, download_now, is_video_url, open_stream, source_name
+from utils.ffmpeg_utils import (
+    process_single, detect_crop_dimensions, prepare_overlay, get_video_duration,
+    EncodeProfile, FFmpegCancelledError, FFmpegWatchdogError, PipedInput
+)
+from utils.filter_graph import GraphSpec, source_fit_box
+from utils.process_utils import format_process_stats
+from utils.progress_utils import BatchProgress
+from utils.resource_utils import ResourceReport
+from utils.scheduling_utils import ThreadPlan, plan_threads
 from utils.subtitle_utils import extract_audio, generate_srt_from_whisper
+from utils.youtube_utils import DownloadCancelledError, get_video_info
 
 
 class Worker(QThread):
     # Сигналы для обратной связи с UI
     progress = pyqtSignal(int, int)  # (текущий файл, общее количество)
-    file_progress = pyqtSignal(int)  # прогресс обработки одного файла
     finished = pyqtSignal()  # завершение работы
     error = pyqtSignal(str)  # ошибка
     file_processing = pyqtSignal(str)  # имя обрабатываемого файла
     status_update = pyqtSignal(str)  # обновление статуса
+    telemetry = pyqtSignal(object)  # ProgressEvent с полями пачки (fps, speed, ETA)
     
     def __init__(
         self,
@@ -42,7 +60,16 @@ class Worker(QThread):
         auto_crop: bool,
         overlay_audio: Optional[str],
         original_volume: int,
-        overlay_volume: int
+        overlay_volume: int,
+        blur_mode: str = BLUR_MODE_QUALITY,
+        parallel_jobs: int = 1,
+        pin_cpus: bool = False,
+        encode_profile: str = ENCODE_PROFILE_BALANCED,
+        target_size_mb: float = DEFAULT_TARGET_SIZE_MB,
+        two_pass: bool = False,
+        auto_faster: bool = True,
+        segment_jobs: int = 1,
+        download_cache: Optional[DownloadCache] = None
     ):
         super().__init__()
         
@@ -63,6 +90,13 @@ class Worker(QThread):
         self.mute_audio = mute_audio
         self.output_format = output_format
         self.blur_background = blur_background
+        self.blur_mode = blur_mode
+        self.parallel_jobs = max(1, parallel_jobs)
+        self.pin_cpus = pin_cpus
+        self.encode_profile = EncodeProfile(encode_profile, target_size_mb, two_pass)
+        self.auto_faster = auto_faster
+        self.segment_jobs = max(1, segment_jobs)
+        self.download_cache = download_cache
         self.strip_metadata = strip_metadata
         self.codec = codec
         self.subtitle_settings = subtitle_settings
@@ -75,7 +109,12 @@ class Worker(QThread):
         
         # Флаг работы и результаты
         self._is_running = True
+        self._cancel_event = threading.Event()
         self.output_paths = []
+        self._results_lock = threading.Lock()
+        self._started_files = 0
+        self.resource_report = None
+        self._probe_executor: Optional[ThreadPoolExecutor] = None
     
     def pick_zoom(self) -> int:
         """Выбирает значение zoom в зависимости от режима"""
@@ -95,9 +134,104 @@ class Worker(QThread):
                 return self.speed_min
         return self.speed_static
     
+    def expected_speed_factor(self) -> float:
+        """Средний множитель скорости для оценки длительности еще не обработанных файлов"""
+        if self.speed_mode == 'dynamic' and self.speed_max >= self.speed_min:
+            speed = (self.speed_min + self.speed_max) / 2
+        else:
+            speed = self.speed_static
+        return speed / 100 if speed > 0 else 1.0
+    
+    def pick_encode_profile(self) -> EncodeProfile:
+        """Профиль кодирования; при большой очереди медленные пресеты x264 ускоряются"""
+        with self._results_lock:
+            waiting = len(self.files) - self._started_files
+        if self.auto_faster and waiting >= AUTO_FASTER_BACKLOG * self.parallel_jobs:
+            return replace(self.encode_profile, preset_cap=AUTO_FASTER_PRESET)
+        return self.encode_profile
+    
+    def source_duration(self, source: str) -> float:
+        """Длительность файла или видео по ссылке (из кеша информации yt-dlp)"""
+        if not is_video_url(source):
+            return get_video_duration(source)
+        try:
+            return float(get_video_info(source).get('duration') or 0)
+        except Exception as e:
+            print(f"Could not get duration of '{source}': {e}")
+            return 0
+    
+    def probe_url_durations(self, batch_progress: BatchProgress, speed_factor: float) -> None:
+        """Параллельно узнает длительности ссылок (yt-dlp --dump-json) и передает их в прогресс пачки"""
+        urls = [(i, path) for i, path in enumerate(self.files) if is_video_url(path)]
+        if not urls:
+            return
+        
+        def probe(i, url):
+            if self._cancel_event.is_set():
+                return
+            duration = self.source_duration(url)
+            if duration > 0:
+                batch_progress.estimate_duration(i, duration / speed_factor)
+        
+        # Информация кешируется, а запрос, который еще идет, get_video_info не повторяет:
+        # выбор формата при обработке ссылки дождется результата пробы
+        executor = self._probe_executor = ThreadPoolExecutor(max_workers=min(DOWNLOAD_JOBS_DEFAULT, len(urls)))
+        for i, url in urls:
+            executor.submit(probe, i, url)
+        executor.shutdown(wait=False)
+    
+    def stop_url_probes(self) -> None:
+        """Отменяет пробы ссылок, которые еще не начались"""
+        executor = self._probe_executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def fit_box(self, zoom: int) -> Optional[Tuple[int, int]]:
+        """Рамка кадра, под которую выбирается разрешение видео по ссылке"""
+        return source_fit_box(GraphSpec(reels=self.output_format == REELS_FORMAT_NAME, zoom_factor=zoom / 100))
+    
+    def resolve_source(self, url: str, fit_box: Optional[Tuple[int, int]],
+                       can_stream: bool) -> Tuple[str, Optional[PipedInput]]:
+        """
+        Готовит ссылку к обработке: канал yt-dlp или скачанный файл.
+        
+        Видео, которое уже есть в кеше загрузок, берется оттуда.
+        
+        Returns:
+            (имя для логов, PipedInput) при обработке на лету или (путь к файлу, None)
+        """
+        entry = self.get_download_cache().lookup(url, fit_box=fit_box)
+        if entry is not None:
+            return entry['path'], None
+        if can_stream:
+            try:
+                piped_input = open_stream(url, fit_box)
+                if piped_input is not None:
+                    return piped_input.name, piped_input
+            except Exception as e:
+                print(f"Could not prepare streaming for '{url}', downloading instead: {e}")
+        return self.download_source(url, fit_box), None
+    
+    def get_download_cache(self) -> DownloadCache:
+        """Кеш загрузок UI или собственный, созданный при первой ссылке"""
+        with self._results_lock:
+            if self.download_cache is None:
+                self.download_cache = DownloadCache()
+            return self.download_cache
+    
+    def download_source(self, url: str, fit_box: Optional[Tuple[int, int]]) -> str:
+        """Скачивает видео по ссылке в кеш загрузок и возвращает путь к файлу"""
+        self.status_update.emit('Скачивание видео...')
+        path = download_now(url, self.out_dir, fit_box, cache=self.get_download_cache(),
+                            cancel_event=self._cancel_event)
+        self.status_update.emit('Обработка...')
+        return path
+    
     def stop(self):
-        """Остановка работы worker'а"""
+        """Остановка работы worker'а: текущий процесс FFmpeg завершается сразу"""
         self._is_running = False
+        self._cancel_event.set()
+        self.stop_url_probes()
         print('Worker stop requested.')
     
     def run(self):
@@ -116,129 +250,248 @@ class Worker(QThread):
             self.error.emit(f'Не удалось создать выходную папку: {self.out_dir}\nОшибка: {e}')
             return
         
-        # Обработка каждого файла
-        for i, in_file_path in enumerate(self.files):
-            # Проверка флага остановки
-            if not self._is_running:
-                print('Worker stopped.')
-                break
-            
-            # Подготовка имен файлов
-            base_name = os.path.basename(in_file_path)
-            name_part, _ = os.path.splitext(base_name)
-            
-            # Определение суффикса в зависимости от формата
-            suffix = '_reels' if self.output_format != 'Оригинальный' else '_processed'
-            out_file_name = f'{name_part}{suffix}.mp4'
-            out_file_path = os.path.join(self.out_dir, out_file_name)
-            
-            # Проверка на совпадение входного и выходного пути
-            if os.path.abspath(in_file_path) == os.path.abspath(out_file_path):
-                alt_out_file_name = f'{name_part}{suffix}_output.mp4'
-                out_file_path = os.path.join(self.out_dir, alt_out_file_name)
-                print(f'Warning: Output path is same as input. Saving to: {alt_out_file_name}')
-            
-            # Уведомление о начале обработки файла
-            self.file_processing.emit(base_name)
-            self.file_progress.emit(0)
-            
-            # Инициализация переменных
-            srt_path = None
-            temp_audio_path = None
-            crop_filter = None
-            
+        # Отчет о ресурсах пачки (logs/resources/batch_*.jsonl и .csv)
+        report = self.resource_report = ResourceReport.for_batch()
+        
+        # Длительности нужны для оценки оставшегося времени пачки; ссылки
+        # уточняются в фоне, чтобы обработка не ждала yt-dlp по каждой из них
+        self.status_update.emit('Анализ файлов...')
+        speed_factor = self.expected_speed_factor()
+        batch_progress = BatchProgress([0.0 if is_video_url(path) else self.source_duration(path) / speed_factor
+                                        for path in self.files])
+        self.probe_url_durations(batch_progress, speed_factor)
+        
+        # Оверлей готовится один раз на всю пачку, дальше берется из кеша
+        if self.overlay_file and os.path.exists(self.overlay_file):
+            self.status_update.emit('Подготовка оверлея...')
             try:
+                prepare_overlay(self.overlay_file)
+            except Exception as e:
+                print(f'Overlay preparation failed, it will be applied as is: {e}')
+        
+        jobs = max(1, min(self.parallel_jobs, total_files))
+        if jobs == 1:
+            # Последовательная обработка каждого файла
+            for i, in_file_path in enumerate(self.files):
+                # Проверка флага остановки
+                if not self._is_running:
+                    print('Worker stopped.')
+                    break
+                if not self._process_file(i, in_file_path, batch_progress, report, ThreadPlan()):
+                    break
+        else:
+            # Параллельная обработка: каждый слот получает свою долю ядер
+            self.status_update.emit(f'Обработка ({jobs} задания параллельно)...')
+            slots = queue.Queue()
+            for slot in range(jobs):
+                slots.put(slot)
+            
+            def run_job(i, in_file_path):
+                if not self._is_running:
+                    return
+                slot = slots.get()
                 try:
-                    # Анализ черных полос если включен auto_crop
-                    if self.auto_crop:
-                        self.status_update.emit('Анализ черных полос...')
-                        crop_filter = detect_crop_dimensions(in_file_path)
-                        self.status_update.emit('Обработка...')
-                    
-                    # Обработка субтитров
-                    subtitle_mode = self.subtitle_settings.get('mode')
-                    
-                    if subtitle_mode == 'whisper':
-                        # Генерация субтитров через Whisper
-                        temp_dir = self.out_dir
-                        temp_audio_path = os.path.join(temp_dir, f'{uuid.uuid4()}.wav')
-                        srt_path = os.path.join(temp_dir, f'{uuid.uuid4()}.srt')
-                        
-                        self.status_update.emit(f"Извлечение аудио из '{base_name}'...")
-                        extract_audio(in_file_path, temp_audio_path)
-                        
-                        self.status_update.emit('Распознавание речи... (может занять много времени)')
-                        generate_srt_from_whisper(
-                            audio_path=temp_audio_path,
-                            srt_path=srt_path,
-                            model_name=self.subtitle_settings.get('model'),
-                            language=self.subtitle_settings.get('language'),
-                            words_per_line=self.subtitle_settings.get('words_per_line')
-                        )
-                        
-                        self.file_processing.emit(base_name)
-                        
-                    elif subtitle_mode == 'srt_file':
-                        # Использование готового SRT файла
-                        srt_path = self.subtitle_settings.get('srt_path')
-                        if not srt_path or not os.path.exists(srt_path):
-                            raise FileNotFoundError(f'Файл субтитров не найден: {srt_path}')
-                    
-                    # Выбор параметров zoom и speed
-                    current_zoom = self.pick_zoom()
-                    current_speed = self.pick_speed()
-                    
-                    # Вызов основной функции обработки
-                    process_single(
-                        in_path=in_file_path,
-                        out_path=out_file_path,
-                        filters=self.filters,
-                        zoom_p=current_zoom,
-                        speed_p=current_speed,
-                        overlay_file=self.overlay_file,
-                        overlay_pos=self.overlay_pos,
-                        output_format=self.output_format,
-                        blur_background=self.blur_background,
-                        mute_audio=self.mute_audio,
-                        strip_metadata=self.strip_metadata,
-                        codec=self.codec,
-                        srt_path=srt_path,
-                        subtitle_style=self.subtitle_settings.get('style', {}),
-                        crop_filter=crop_filter,
-                        overlay_audio_path=self.overlay_audio,
-                        original_volume=self.original_volume,
-                        overlay_volume=self.overlay_volume,
-                        progress_callback=self.file_progress.emit
-                    )
-                    
-                    # Добавление пути к результатам
-                    self.output_paths.append(out_file_path)
-                    
-                    # Обновление общего прогресса
-                    self.progress.emit(i + 1, total_files)
-                    
-                except Exception as e:
-                    # Обработка ошибок
-                    error_msg = f"Ошибка при обработке файла '{base_name}':\n{type(e).__name__}: {e}"
-                    
-                    # Дополнительная информация для ошибок subprocess
-                    if isinstance(e, subprocess.CalledProcessError) and e.output:
-                        error_msg += f'\n\nFFmpeg output:\n{e.output[-500:]}'
-                    
-                    print(f'Error in worker thread: {error_msg}')
-                    self.error.emit(error_msg)
-                    
-            finally:
-                # Очистка временных файлов
-                if temp_audio_path and os.path.exists(temp_audio_path):
-                    os.remove(temp_audio_path)
-                
-                if srt_path and subtitle_mode == 'whisper' and os.path.exists(srt_path):
-                    os.remove(srt_path)
+                    plan = plan_threads(jobs, slot, pin=self.pin_cpus)
+                    self._process_file(i, in_file_path, batch_progress, report, plan)
+                finally:
+                    slots.put(slot)
+            
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for i, in_file_path in enumerate(self.files):
+                    executor.submit(run_job, i, in_file_path)
+        
+        # Длительности ссылок, до которых пробы не дошли, уже не нужны
+        self.stop_url_probes()
+        
+        # Сводка по ресурсам пачки
+        print(report.finish())
+        print(format_process_stats())
         
         # Завершение работы
         if self._is_running:
             print('Worker finished processing all files.')
             self.finished.emit()
         else:
-            print('Worker finished due to stop request.')
\ No newline at end of file
+            print('Worker finished due to stop request.')
+    
+    def _process_file(self, i: int, in_file_path: str, batch_progress: BatchProgress,
+                      report: ResourceReport, thread_plan: ThreadPlan) -> bool:
+        """
+        Обрабатывает один файл пачки.
+        
+        Returns:
+            False если обработка отменена пользователем
+        """
+        total_files = len(self.files)
+        
+        # Ссылка обрабатывается из канала yt-dlp или после скачивания
+        url = in_file_path if is_video_url(in_file_path) else None
+        
+        # Подготовка имен файлов
+        base_name = source_name(url) if url else os.path.basename(in_file_path)
+        name_part = base_name if url else os.path.splitext(base_name)[0]
+        
+        # Определение суффикса в зависимости от формата
+        suffix = '_reels' if self.output_format != 'Оригинальный' else '_processed'
+        out_file_name = f'{name_part}{suffix}.mp4'
+        out_file_path = os.path.join(self.out_dir, out_file_name)
+        
+        # Проверка на совпадение входного и выходного пути
+        if os.path.abspath(in_file_path) == os.path.abspath(out_file_path):
+            alt_out_file_name = f'{name_part}{suffix}_output.mp4'
+            out_file_path = os.path.join(self.out_dir, alt_out_file_name)
+            print(f'Warning: Output path is same as input. Saving to: {alt_out_file_name}')
+        
+        # Уведомление о начале обработки файла
+        self.file_processing.emit(base_name)
+        batch_progress.start_file(i)
+        with self._results_lock:
+            self._started_files += 1
+        
+        # Инициализация переменных
+        srt_path = None
+        temp_audio_path = None
+        crop_filter = None
+        subtitle_mode = self.subtitle_settings.get('mode')
+        piped_input = None
+        
+        try:
+            # Выбор параметров zoom, speed и профиля кодирования
+            current_zoom = self.pick_zoom()
+            current_speed = self.pick_speed()
+            encode_profile = self.pick_encode_profile()
+            
+            # Анализу черных полос и Whisper нужен файл целиком
+            if url:
+                can_stream = not self.auto_crop and subtitle_mode != 'whisper'
+                in_file_path, piped_input = self.resolve_source(url, self.fit_box(current_zoom), can_stream)
+            
+            # Анализ черных полос если включен auto_crop
+            if self.auto_crop:
+                self.status_update.emit('Анализ черных полос...')
+                with report.track('crop_detect', base_name):
+                    crop_filter = detect_crop_dimensions(in_file_path)
+                self.status_update.emit('Обработка...')
+            
+            # Обработка субтитров
+            if subtitle_mode == 'whisper':
+                # Генерация субтитров через Whisper
+                temp_dir = self.out_dir
+                temp_audio_path = os.path.join(temp_dir, f'{uuid.uuid4()}.wav')
+                srt_path = os.path.join(temp_dir, f'{uuid.uuid4()}.srt')
+                
+                self.status_update.emit(f"Извлечение аудио из '{base_name}'...")
+                with report.track('extract_audio', base_name, temp_audio_path):
+                    extract_audio(in_file_path, temp_audio_path)
+                
+                self.status_update.emit('Распознавание речи... (может занять много времени)')
+                with report.track('whisper', base_name, srt_path):
+                    generate_srt_from_whisper(
+                        audio_path=temp_audio_path,
+                        srt_path=srt_path,
+                        model_name=self.subtitle_settings.get('model'),
+                        language=self.subtitle_settings.get('language'),
+                        words_per_line=self.subtitle_settings.get('words_per_line')
+                    )
+                
+                self.file_processing.emit(base_name)
+                
+            elif subtitle_mode == 'srt_file':
+                # Использование готового SRT файла
+                srt_path = self.subtitle_settings.get('srt_path')
+                if not srt_path or not os.path.exists(srt_path):
+                    raise FileNotFoundError(f'Файл субтитров не найден: {srt_path}')
+            
+            # Вызов основной функции обработки
+            process_kwargs = dict(
+                in_path=in_file_path,
+                out_path=out_file_path,
+                filters=self.filters,
+                zoom_p=current_zoom,
+                speed_p=current_speed,
+                overlay_file=self.overlay_file,
+                overlay_pos=self.overlay_pos,
+                output_format=self.output_format,
+                blur_background=self.blur_background,
+                blur_mode=self.blur_mode,
+                mute_audio=self.mute_audio,
+                strip_metadata=self.strip_metadata,
+                codec=self.codec,
+                srt_path=srt_path,
+                subtitle_style=self.subtitle_settings.get('style', {}),
+                crop_filter=crop_filter,
+                overlay_audio_path=self.overlay_audio,
+                original_volume=self.original_volume,
+                overlay_volume=self.overlay_volume,
+                progress_event_callback=lambda event: self.telemetry.emit(batch_progress.update(event, i)),
+                cancel_event=self._cancel_event,
+                thread_plan=thread_plan,
+                encode_profile=encode_profile,
+                segment_jobs=self.segment_jobs,
+                piped_input=piped_input
+            )
+            try:
+                self._run_process_single(process_kwargs, i, base_name, out_file_path, batch_progress, report)
+            except (subprocess.CalledProcessError, RuntimeError) as e:
+                # Канал не прочитался (формат не читается потоком, обрыв) - повтор со скачанным файлом
+                if piped_input is None or isinstance(e, FFmpegWatchdogError):
+                    raise
+                print(f"Streaming of '{url}' failed, processing the downloaded file instead: {e}")
+                process_kwargs.update(in_path=self.download_source(url, self.fit_box(current_zoom)), piped_input=None)
+                batch_progress.start_file(i)
+                self._run_process_single(process_kwargs, i, base_name, out_file_path, batch_progress, report)
+            
+            # Добавление пути к результатам
+            batch_progress.finish_file(i)
+            with self._results_lock:
+                self.output_paths.append(out_file_path)
+                done = len(self.output_paths)
+            
+            # Обновление общего прогресса
+            self.progress.emit(done if self.parallel_jobs > 1 else i + 1, total_files)
+            return True
+            
+        except (FFmpegCancelledError, DownloadCancelledError):
+            # Отмена пользователем - не ошибка, незавершенный файл удаляется
+            if os.path.exists(out_file_path):
+                os.remove(out_file_path)
+            print(f"Processing of '{base_name}' cancelled.")
+            return False
+            
+        except Exception as e:
+            # Обработка ошибок
+            batch_progress.finish_file(i)
+            error_msg = f"Ошибка при обработке файла '{base_name}':\n{type(e).__name__}: {e}"
+            
+            # Дополнительная информация для ошибок subprocess
+            if isinstance(e, subprocess.CalledProcessError) and e.output:
+                error_msg += f'\n\nFFmpeg output:\n{e.output[-500:]}'
+            
+            print(f'Error in worker thread: {error_msg}')
+            self.error.emit(error_msg)
+            return True
+            
+        finally:
+            # Очистка временных файлов
+            if temp_audio_path and os.path.exists(temp_audio_path):
+                os.remove(temp_audio_path)
+            
+            if srt_path and subtitle_mode == 'whisper' and os.path.exists(srt_path):
+                os.remove(srt_path)
+    
+    def _run_process_single(self, process_kwargs: Dict, i: int, base_name: str, out_file_path: str,
+                            batch_progress: BatchProgress, report: ResourceReport) -> None:
+        """process_single с одним повтором в безопасном режиме после срабатывания сторожа"""
+        try:
+            with report.track('ffmpeg', base_name, out_file_path):
+                process_single(**process_kwargs)
+        except FFmpegCancelledError:
+            raise
+        except FFmpegWatchdogError as e:
+            # Зависание или превышение лимита: один повтор в безопасной конфигурации
+            print(f"Watchdog stopped FFmpeg ({e.reason}) for '{base_name}', retrying in safe mode.")
+            self.status_update.emit('FFmpeg завис, повтор в безопасном режиме...')
+            batch_progress.start_file(i)
+            with report.track('ffmpeg_safe', base_name, out_file_path):
+                process_single(safe_mode=True, **process_kwargs)
+            self.status_update.emit('Обработка...')